@@ -1,73 +1,182 @@
 # FILE: main.py
+#
+# App factory. Run with `uvicorn app.main:app` (module-level instance)
+# or `uvicorn --factory app.main:create_app`.
+#
+# Importing this module does no I/O: the datastore client is created and
+# caches are warmed in the lifespan, so misconfiguration surfaces as a
+# startup error instead of an import crash.
 
-from fastapi import FastAPI
+import time
+
+from app.services.startup_service import mark
+
+mark("import_started", time.perf_counter())
+
+import logging
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+# Once, before any module reads its env config
+load_dotenv()
+
+from fastapi import FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 # Import ALL routers
 from app.routers import sensor, control, alerts, auth, users
 from app.routers import nutrients, growth
-from app.routers import settings, devices
+from app.routers import settings, devices, diagnostics, sites
+from app.services.firebase_service import db
+from app.services.auth_service import validate_auth_config
+from app.services.alert_service import count_alerts
+from app.services.mirror_service import start_mirrors, stop_mirrors
+from app.services.command_service import command_hub
+from app.services.automation_service import automation_engine
+from app.services.presence_service import presence_tracker
+from app.services.spool_service import ingest_spool
+from app.services.invalidation_service import invalidation_bus
+from app.services.metrics_service import MetricsMiddleware, render_metrics
+from app.services.trace_service import DatastoreTraceMiddleware
+from app.services.profiler_service import RequestProfileMiddleware
+from app.services.startup_service import FirstRequestMiddleware, startup_status, warm_up
+from app.services.workload_service import WorkloadMiddleware, configure_threadpool
+from app.utils.responses import CompressionMiddleware
 
+logger = logging.getLogger(__name__)
 
-# Initialize FastAPI app
-app = FastAPI(title="Greenhouse IoT System")
-
-# CORS configuration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # ⚠ Change in production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
 # -----------------------------
-# ROUTERS REGISTRATION
+# Lifespan (background services)
 # -----------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    mark("warmup_started")
+    validate_auth_config()
+    configure_threadpool()
 
-# Authentication
-app.include_router(
-    auth.router,
-    prefix="/api/auth",
-    tags=["Authentication"]
-)
-
-# User Management (Admin only)
-app.include_router(
-    users.router,
-    prefix="/api/users",
-    tags=["User Management"]
-)
-
-# Monitoring
-app.include_router(
-    sensor.router,
-    prefix="/api/sensor",
-    tags=["Monitoring"]
-)
-
-# Device Control & Configuration
-app.include_router(
-    control.router,
-    prefix="/api/control",
-    tags=["Actions"]
-)
-
-# Alerts
-app.include_router(
-    alerts.router,
-    prefix="/api/alerts",
-    tags=["Notifications"]
-)
-
-app.include_router(nutrients.router, prefix="/api/nutrients", tags=["Nutrients"])
-app.include_router(growth.router, prefix="/api/growth", tags=["Growth"])
-app.include_router(settings.router, prefix="/api/settings", tags=["Settings"])
-app.include_router(devices.router, prefix="/api/devices", tags=["Devices"])
+    # Connect first: bad credentials / backend config fail startup here
+    await run_in_threadpool(lambda: db.raw)
+    # Cross-worker cache invalidation, before any cache fills
+    invalidation_bus.start()
 
-# -----------------------------
-# Health Check
-# -----------------------------
-@app.get("/")
-def home():
-    return {"message": "Greenhouse Backend is running!"}
+    # Independent warm-ups run concurrently
+    await warm_up(
+        start_mirrors,
+        lambda: count_alerts("Active"),
+        automation_engine.start(),
+    )
+    command_hub.start()
+    presence_tracker.start()
+    # Replays readings spooled during a datastore outage (also from a previous run)
+    ingest_spool.start()
+
+    mark("ready")
+    logger.info("Startup complete: %s", startup_status())
+    yield
+    await ingest_spool.stop()
+    await presence_tracker.stop()
+    await automation_engine.stop()
+    await command_hub.stop()
+    stop_mirrors()
+    invalidation_bus.stop()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="Greenhouse IoT System", lifespan=lifespan)
+
+    # Per-lane concurrency limits / shedding (inside CORS so 429/503 stay readable)
+    app.add_middleware(WorkloadMiddleware)
+
+    # CORS configuration
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # ⚠ Change in production
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # gzip / brotli for large JSON responses (negotiated via Accept-Encoding)
+    app.add_middleware(CompressionMiddleware)
+
+    # Prometheus request latency (per route template)
+    app.add_middleware(MetricsMiddleware)
+
+    # Per-request datastore cost (X-Datastore-Ops / Server-Timing headers + log)
+    app.add_middleware(DatastoreTraceMiddleware)
+
+    # Admin-only single-request profiling (X-Profile: 1)
+    app.add_middleware(RequestProfileMiddleware)
+
+    # Time-to-first-request (startup_service)
+    app.add_middleware(FirstRequestMiddleware)
+
+    # -----------------------------
+    # ROUTERS REGISTRATION
+    # -----------------------------
+
+    # Authentication
+    app.include_router(
+        auth.router,
+        prefix="/api/auth",
+        tags=["Authentication"]
+    )
+
+    # User Management (Admin only)
+    app.include_router(
+        users.router,
+        prefix="/api/users",
+        tags=["User Management"]
+    )
+
+    # Monitoring
+    app.include_router(
+        sensor.router,
+        prefix="/api/sensor",
+        tags=["Monitoring"]
+    )
+
+    # Device Control & Configuration
+    app.include_router(
+        control.router,
+        prefix="/api/control",
+        tags=["Actions"]
+    )
+
+    # Alerts
+    app.include_router(
+        alerts.router,
+        prefix="/api/alerts",
+        tags=["Notifications"]
+    )
+
+    app.include_router(nutrients.router, prefix="/api/nutrients", tags=["Nutrients"])
+    app.include_router(growth.router, prefix="/api/growth", tags=["Growth"])
+    app.include_router(settings.router, prefix="/api/settings", tags=["Settings"])
+    app.include_router(devices.router, prefix="/api/devices", tags=["Devices"])
+    app.include_router(sites.router, prefix="/api/sites", tags=["Sites"])
+    app.include_router(diagnostics.router, prefix="/api/diagnostics", tags=["Diagnostics"])
+
+    # -----------------------------
+    # Health Check
+    # -----------------------------
+    @app.get("/")
+    def home():
+        return {"message": "Greenhouse Backend is running!"}
+
+    # -----------------------------
+    # Metrics (Prometheus scrape target)
+    # -----------------------------
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        body, content_type = render_metrics()
+        return Response(content=body, media_type=content_type)
+
+    return app
+
+
+app = create_app()
+mark("import")
@@ -1,31 +1,109 @@
 # FILE: alerts.py
 # RBAC Policy:
 # - View Alerts → Admin + User
+# - Count / Dismiss Alerts → Admin + User
+# All routes are scoped to the request's site (X-Site-Id).
 
-from fastapi import APIRouter, HTTPException, Depends
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from app.services.firebase_service import db
-from app.utils.rbac import require_user_or_admin
-from firebase_admin import firestore
+from app.services.alert_service import count_alerts, dismiss_alerts_by_id, dismiss_alerts_by_filter
+from app.services.site_service import site_collection
+from app.utils.rbac import require_user_or_admin, current_site
+from app.utils.pagination import PageParams, page_params, paginate
+from app.utils.responses import json_response
+from app.utils.singleflight import SingleFlight
 
 router = APIRouter()
 
+_reads = SingleFlight(name="alerts_singleflight")
+
+
+class DismissByIdRequest(BaseModel):
+    ids: list[str] = Field(..., min_length=1)
+
+
+class DismissByFilterRequest(BaseModel):
+    sensor_type: str | None = None
+    since: datetime | None = None
+    until: datetime | None = None
+
 
 @router.get("/", dependencies=[Depends(require_user_or_admin)])
-async def get_all_alerts():
+async def get_all_alerts(
+    status: str | None = Query(None, description='Filter, e.g. "Active" or "Dismissed"'),
+    sensor_type: str | None = Query(None, description='Filter, e.g. "pH", "EC"'),
+    page: PageParams = Depends(page_params(20)),
+    site_id: str = Depends(current_site)
+):
+    """
+    Newest alerts first, one page at a time (see next_cursor).
+    """
     try:
-        query = db.collection("alerts") \
-            .order_by("timestamp", direction=firestore.Query.DESCENDING) \
-            .limit(20)
+        query = db.collection(site_collection("alerts", site_id))
+        if status:
+            query = query.where("status", "==", status)
+        if sensor_type:
+            query = query.where("sensor_type", "==", sensor_type)
 
-        docs = query.stream()
+        # Identical concurrent page requests share one query
+        alerts_list, next_cursor = await _reads.do(
+            (site_id, status, sensor_type, page.page_size, page.cursor),
+            lambda: paginate(query, page, order_field="timestamp", descending=True),
+        )
 
-        alerts_list = []
-        for doc in docs:
-            data = doc.to_dict()
-            data['id'] = doc.id
-            alerts_list.append(data)
+        return json_response({"status": "success", "data": alerts_list, "next_cursor": next_cursor})
 
-        return {"status": "success", "data": alerts_list}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/count", dependencies=[Depends(require_user_or_admin)])
+async def get_alert_count(status: str = Query("Active"), site_id: str = Depends(current_site)):
+    """
+    Cheap counter for badges: Firestore count() aggregation, cached briefly.
+    """
+    try:
+        total = await run_in_threadpool(count_alerts, status, site_id)
+        return {"status": "success", "alert_status": status, "count": total}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/dismiss", dependencies=[Depends(require_user_or_admin)])
+async def dismiss_alerts(body: DismissByIdRequest, site_id: str = Depends(current_site)):
+    """
+    Dismiss alerts by id (batched writes).
+    """
+    try:
+        result = await run_in_threadpool(dismiss_alerts_by_id, list(dict.fromkeys(body.ids)), site_id)
+        return {
+            "status": "success",
+            "count": len(result["dismissed"]),
+            "dismissed": result["dismissed"],
+            "not_found": result["not_found"]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to dismiss alerts: {str(e)}")
+
+
+@router.post("/dismiss/filter", dependencies=[Depends(require_user_or_admin)])
+async def dismiss_alerts_matching(body: DismissByFilterRequest, site_id: str = Depends(current_site)):
+    """
+    Dismiss every Active alert matching sensor_type and/or a time range.
+    An empty body clears all active alerts.
+    """
+    if body.since and body.until and body.since > body.until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+
+    try:
+        total = await run_in_threadpool(
+            dismiss_alerts_by_filter, body.sensor_type, body.since, body.until, site_id
+        )
+        return {"status": "success", "count": total}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to dismiss alerts: {str(e)}")
@@ -5,20 +5,38 @@ Handles:
 - Manual device control
 - System mode configuration
 - Threshold configuration
+- Device command channel (WebSocket push + acknowledgements)
+
+Settings, controls and the growth timeline are per site (X-Site-Id,
+see site_service). For the default site, reads of /settings and /control
+are served from the in-memory snapshot mirror (mirror_service); other
+sites' settings come from the per-site config cache.
 
 RBAC Policy:
 - POST   /control               → Admin + User
+- POST   /control/bulk          → Admin + User
 - PUT    /settings/mode         → Admin + User
 - PUT    /settings/thresholds   → Admin only
+- GET    /mirror                → Admin only
+- WS     /commands/{device_id}/ws → Admin token (devices act as admin), ?site=<site_id>
+- GET    /commands[/{device_id}]  → Admin only
+- GET    /automation            → Admin only
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime, timezone
 from pydantic import BaseModel
 
 from app.models import ControlState, ModeUpdate
 from app.services.firebase_service import db
-from app.utils.rbac import require_admin, require_user_or_admin
+from app.services.mirror_service import controls_mirror, settings_mirror, mirror_status
+from app.services.version_service import version_key, served_etag, is_not_modified, not_modified, content_response
+from app.services.command_service import command_hub
+from app.services.control_service import apply_control, apply_controls
+from app.services.automation_service import automation_engine
+from app.services.site_service import DEFAULT_SITE_ID, SITE_HEADER, site_collection, site_settings
+from app.utils.rbac import require_admin, require_user_or_admin, authenticate_token, current_site, resolve_site
 
 router = APIRouter()
 
@@ -32,26 +50,28 @@ class ThresholdUpdate(BaseModel):
     ec_tolerance: float
 
 
+class BulkControlUpdate(BaseModel):
+    controls: list[ControlState]
+
+
 # -------------------------------------------------
 # MANUAL DEVICE CONTROL
 # -------------------------------------------------
 @router.post("/control", dependencies=[Depends(require_user_or_admin)])
-async def update_device_control(command: ControlState):
+async def update_device_control(command: ControlState, site_id: str = Depends(current_site)):
     """
     Update a specific device state (pump, light, etc.)
     """
 
     try:
-        doc_ref = db.collection("controls").document(command.device_id)
-
-        doc_ref.set({
-            "status": command.status,
-            "last_updated": datetime.now(timezone.utc)
-        }, merge=True)
+        # Firestore write + mirror + push to the device (queued if offline)
+        issued = await apply_control(command.device_id, command.status, site_id=site_id)
 
         return {
             "status": "success",
-            "message": f"{command.device_id} is now {command.status}"
+            "message": f"{command.device_id} is now {command.status}",
+            "command_id": issued["id"],
+            "delivered": issued["attempts"] > 0
         }
 
     except Exception as e:
@@ -61,6 +81,51 @@ async def update_device_control(command: ControlState):
         )
 
 
+# -------------------------------------------------
+# BULK DEVICE CONTROL (scenes / whole zones)
+# -------------------------------------------------
+@router.post("/control/bulk", dependencies=[Depends(require_user_or_admin)])
+async def update_device_controls_bulk(body: BulkControlUpdate, site_id: str = Depends(current_site)):
+    """
+    Apply many device states in one atomic Firestore batch.
+    Either all devices switch or none do. If a device appears
+    more than once, the last entry wins.
+    """
+
+    if not body.controls:
+        raise HTTPException(status_code=400, detail="No controls given")
+
+    # Keep the last state per device, in first-seen order
+    latest = {}
+    for command in body.controls:
+        latest.pop(command.device_id, None)
+        latest[command.device_id] = command.status
+
+    try:
+        issued = await apply_controls(list(latest.items()), site_id=site_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to update device controls (no device was changed): {str(e)}"
+        )
+
+    return {
+        "status": "success",
+        "count": len(issued),
+        "data": [
+            {
+                "device_id": command["device_id"],
+                "status": command["status"],
+                "command_id": command["id"],
+                "delivered": command["attempts"] > 0
+            }
+            for command in issued
+        ]
+    }
+
+
 # -------------------------------------------------
 # CHANGE MODE + TARGETS (Admin + User)
 # -------------------------------------------------
@@ -70,12 +135,12 @@ from app.models import ControlState, ModeUpdate
 
 
 @router.put("/settings/mode", dependencies=[Depends(require_user_or_admin)])
-async def update_mode_and_targets(config: ModeUpdate):
+async def update_mode_and_targets(config: ModeUpdate, site_id: str = Depends(current_site)):
     try:
-        doc_ref = db.collection("settings").document("system_config")
+        doc_ref = db.collection(site_collection("settings", site_id)).document("system_config")
 
         # 1) update main config
-        doc_ref.set({
+        fields = {
     "mode": config.mode,
     "target_ph": config.target_ph,
     "target_ec": config.target_ec,
@@ -86,11 +151,16 @@ async def update_mode_and_targets(config: ModeUpdate):
     "light_off_time": config.light_off_time,
 
     "updated_at": datetime.now(timezone.utc)
-}, merge=True)
+}
+        doc_ref.set(fields, merge=True)
 
+        if site_id == DEFAULT_SITE_ID:
+            settings_mirror.merge("system_config", fields)
+            # Apply a new light schedule now instead of at the next resync
+            automation_engine.refresh_global_schedule()
 
         # ✅ 2) NEW: log growth phase change to timeline
-        db.collection("growth_phase_history").add({
+        db.collection(site_collection("growth_phase_history", site_id)).add({
             "mode": config.mode,
             "target_ph": config.target_ph,
             "target_ec": config.target_ec,
@@ -107,21 +177,24 @@ async def update_mode_and_targets(config: ModeUpdate):
 # EDIT THRESHOLDS (Admin ONLY)
 # -------------------------------------------------
 @router.put("/settings/thresholds", dependencies=[Depends(require_admin)])
-async def update_thresholds(threshold_data: ThresholdUpdate):
+async def update_thresholds(threshold_data: ThresholdUpdate, site_id: str = Depends(current_site)):
     """
     Update system safety thresholds.
     Only Admin can modify.
     """
 
     try:
-        doc_ref = db.collection("settings").document("system_config")
+        doc_ref = db.collection(site_collection("settings", site_id)).document("system_config")
 
-        doc_ref.set({
+        fields = {
             "threshold_temp": threshold_data.threshold_temp,
             "ph_tolerance": threshold_data.ph_tolerance,
             "ec_tolerance": threshold_data.ec_tolerance,
             "updated_at": datetime.now(timezone.utc)
-        }, merge=True)
+        }
+        doc_ref.set(fields, merge=True)
+        if site_id == DEFAULT_SITE_ID:
+            settings_mirror.merge("system_config", fields)
 
         return {
             "status": "success",
@@ -135,29 +208,127 @@ async def update_thresholds(threshold_data: ThresholdUpdate):
         )
 
 @router.get("/settings", dependencies=[Depends(require_user_or_admin)])
-async def get_settings():
+async def get_settings(request: Request, site_id: str = Depends(current_site)):
     """
     Load current system settings (mode, targets, light schedule, thresholds, etc.)
+    Conditional: If-None-Match with the current ETag returns 304.
     """
+    key = version_key([site_collection("settings", site_id)], site_id)
+    etag = served_etag(key)
+    if etag and is_not_modified(request, etag):
+        return not_modified(etag)
+
     try:
-        doc = db.collection("settings").document("system_config").get()
-        if not doc.exists:
-            return {"status": "success", "data": {}}
+        # Mirror (default site) or per-site config cache
+        data = site_settings(site_id)
 
-        return {"status": "success", "data": doc.to_dict()}
+        return content_response(request, key, {"status": "success", "data": data})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/control", dependencies=[Depends(require_user_or_admin)])
-async def get_all_controls():
+async def get_all_controls(site_id: str = Depends(current_site)):
     """
-    Load latest statuses for all devices from Firestore controls collection.
+    Load latest statuses for all devices from the site's controls collection.
     """
     try:
-        docs = db.collection("controls").stream()
+        mirrored = controls_mirror.snapshot() if site_id == DEFAULT_SITE_ID else None
+        if mirrored is not None:
+            return {"status": "success", "data": mirrored}
+
+        docs = db.collection(site_collection("controls", site_id)).stream()
         data = {}
         for d in docs:
             data[d.id] = d.to_dict()
         return {"status": "success", "data": data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/mirror", dependencies=[Depends(require_admin)])
+async def get_mirror_status():
+    """
+    Health of the in-memory controls/settings replica (staleness, reconnects).
+    """
+    return {"status": "success", "data": mirror_status()}
+
+
+@router.get("/automation", dependencies=[Depends(require_admin)])
+async def get_automation_status():
+    """
+    Automation engine health: scheduled jobs, runs, errors and tick lag.
+    """
+    return {"status": "success", "data": automation_engine.status()}
+
+
+# -------------------------------------------------
+# DEVICE COMMAND CHANNEL
+# -------------------------------------------------
+@router.websocket("/commands/{device_id}/ws")
+async def device_command_channel(
+    websocket: WebSocket,
+    device_id: str,
+    token: str = Query(...),
+    site: str | None = Query(None)
+):
+    """
+    Persistent command channel for one device of a site (?site=, else
+    the X-Site-Id header, else the default site).
+
+    Server -> device: {"type": "command", "id", "device_id", "status", "issued_at", "attempts"}
+    Device -> server: {"type": "ack", "id": "<command id>"}
+
+    Unacknowledged commands are re-sent, and flushed again on reconnect.
+    """
+    try:
+        user = await run_in_threadpool(authenticate_token, token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    if user.get("role") != "admin":
+        await websocket.close(code=1008)
+        return
+
+    try:
+        site_id = await run_in_threadpool(resolve_site, site or websocket.headers.get(SITE_HEADER), user)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    await command_hub.connect(site_id, device_id, websocket)
+
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except ValueError:
+                continue  # ignore malformed frames
+
+            if isinstance(message, dict) and message.get("type") == "ack":
+                command_hub.ack(site_id, device_id, str(message.get("id")))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        command_hub.disconnect(site_id, device_id, websocket)
+
+
+@router.get("/commands", dependencies=[Depends(require_admin)])
+async def get_command_channel_status():
+    """
+    Delivery/ack counters, connected devices and ack latency.
+    """
+    return {"status": "success", "data": command_hub.status()}
+
+
+@router.get("/commands/{device_id}", dependencies=[Depends(require_admin)])
+async def get_pending_commands(device_id: str, site_id: str = Depends(current_site)):
+    """
+    Commands still waiting for an acknowledgement from this device of the site.
+    """
+    return {
+        "status": "success",
+        "connected": command_hub.is_connected(site_id, device_id),
+        "data": command_hub.pending(site_id, device_id)
+    }
@@ -1,12 +1,28 @@
 # app/routers/devices.py
-from fastapi import APIRouter, Depends, HTTPException
+#
+# Pair codes are indexed in the "pair_codes" collection
+# (document id = pair code, field device_id), so pairing is a document
+# read instead of a query. The claim itself runs in a Firestore transaction.
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from datetime import datetime, timezone
-from app.services.firebase_service import db
+from app.services.firebase_service import db, transactional
+from app.services.presence_service import presence_tracker
+from app.utils.cache import TTLCache
+from app.utils.pagination import PageParams, page_params, paginate
 from app.utils.rbac import require_user_or_admin, require_admin
+from app.utils.responses import json_response
 
 router = APIRouter()
 
+# user_id -> email (owner_email is informational, a few minutes stale is fine)
+_owner_email_cache = TTLCache(ttl_seconds=300, name="owner_email")
+
+# Each provisioned device is 2 writes (device + pair code); batch limit is 500
+PROVISION_CHUNK = 250
+# Firestore "in" filters take at most 30 values
+PAIR_CODE_LOOKUP_CHUNK = 30
+
 
 class PairRequest(BaseModel):
     pair_code: str
@@ -17,6 +33,16 @@ class DeviceUpdate(BaseModel):
     location: str | None = None
 
 
+class ProvisionDevice(BaseModel):
+    pair_code: str
+    name: str | None = None
+    location: str | None = None
+
+
+class ProvisionRequest(BaseModel):
+    devices: list[ProvisionDevice]
+
+
 def _get_user_id(user: dict) -> str:
     # Most JWT libraries store principal in "sub"
     user_id = user.get("sub") or user.get("user_id") or user.get("uid")
@@ -27,35 +53,129 @@ def _get_user_id(user: dict) -> str:
 
 def _get_user_email_from_users_collection(user_id: str) -> str | None:
     # Optional: store owner_email for easier debugging / UI display
+    cached = _owner_email_cache.get(user_id)
+    if cached is not None:
+        return cached or None
+
     doc = db.collection("users").document(user_id).get()
-    if not doc.exists:
+    email = (doc.to_dict() or {}).get("email") if doc.exists else None
+    _owner_email_cache.set(user_id, email or "")
+    return email
+
+
+def _valid_pair_code(pair_code: str) -> bool:
+    # Pair codes are Firestore document ids
+    return bool(pair_code) and "/" not in pair_code and pair_code not in (".", "..")
+
+
+def _resolve_pair_code(pair_code: str) -> str | None:
+    """
+    pair code -> device id, via the pair_codes index.
+    Devices provisioned before the index existed are found with the
+    legacy query once and then back-filled into the index.
+    """
+    snap = db.collection("pair_codes").document(pair_code).get()
+    if snap.exists:
+        return (snap.to_dict() or {}).get("device_id")
+
+    legacy = (
+        db.collection("devices")
+        .where("pair_code", "==", pair_code)
+        .limit(1)
+        .stream()
+    )
+    doc = next(legacy, None)
+    if not doc:
         return None
-    data = doc.to_dict() or {}
-    return data.get("email")
+
+    db.collection("pair_codes").document(pair_code).set({
+        "device_id": doc.id,
+        "created_at": datetime.now(timezone.utc)
+    })
+    return doc.id
+
+
+def _legacy_pair_codes(pair_codes: list[str]) -> set[str]:
+    """
+    Which of `pair_codes` are stored on a devices document
+    (chunked "in" queries, not one query per code).
+    """
+    found = set()
+    for i in range(0, len(pair_codes), PAIR_CODE_LOOKUP_CHUNK):
+        docs = (
+            db.collection("devices")
+            .where("pair_code", "in", pair_codes[i:i + PAIR_CODE_LOOKUP_CHUNK])
+            .select(["pair_code"])
+            .stream()
+        )
+        found.update((doc.to_dict() or {}).get("pair_code") for doc in docs)
+    return found
+
+
+@transactional
+def _claim_device(transaction, device_ref, pair_code: str, user_id: str, owner_email: str | None):
+    """
+    Check-and-claim in one transaction: two users racing on the same
+    pair code cannot both succeed (the loser retries and sees paired=True).
+    """
+    snap = device_ref.get(transaction=transaction)
+    device_data = (snap.to_dict() or {}) if snap.exists else None
+
+    # Index entry points to a deleted device or a re-coded one
+    if device_data is None or device_data.get("pair_code") != pair_code:
+        raise HTTPException(status_code=404, detail="Invalid pair code")
+
+    already_paired = bool(device_data.get("paired"))
+    owner_id = device_data.get("owner_id")
+
+    # paired to someone else
+    if already_paired and owner_id and owner_id != user_id:
+        raise HTTPException(status_code=409, detail="Device already paired to another user")
+
+    now = datetime.now(timezone.utc)
+    transaction.set(
+        device_ref,
+        {
+            "paired": True,
+            "owner_id": user_id,
+            "owner_email": owner_email,  # optional, can be None
+            "paired_at": now,
+            "last_seen_at": now,
+        },
+        merge=True,
+    )
 
 
 @router.get("/")
-async def list_devices(user: dict = Depends(require_user_or_admin)):
+async def list_devices(
+    user: dict = Depends(require_user_or_admin),
+    timeout: float | None = Query(None, gt=0, description="Seconds without heartbeat before offline"),
+    owner_id: str | None = Query(None, description="Admin only: filter by owner"),
+    paired: bool | None = Query(None),
+    page: PageParams = Depends(page_params())
+):
     """
-    - admin: sees all devices
+    - admin: sees all devices (optionally filtered by owner_id)
     - user: sees only devices they own (owner_id == user_id)
+    Each device gets an `online` flag from the in-memory presence index.
     """
     try:
         role = user.get("role")
         user_id = _get_user_id(user)
 
-        if role == "admin":
-            docs = db.collection("devices").stream()
-        else:
-            docs = db.collection("devices").where("owner_id", "==", user_id).stream()
+        query = db.collection("devices")
+        if role != "admin":
+            query = query.where("owner_id", "==", user_id)
+        elif owner_id:
+            query = query.where("owner_id", "==", owner_id)
+        if paired is not None:
+            query = query.where("paired", "==", paired)
 
-        data = []
-        for d in docs:
-            row = d.to_dict() or {}
-            row["id"] = d.id
-            data.append(row)
+        data, next_cursor = paginate(query, page)
+        for row in data:
+            row["online"] = presence_tracker.is_online(row["id"], timeout, row.get("last_seen_at"))
 
-        return {"status": "success", "data": data}
+        return json_response({"status": "success", "data": data, "next_cursor": next_cursor})
     except HTTPException:
         raise
     except Exception as e:
@@ -66,51 +186,136 @@ async def list_devices(user: dict = Depends(require_user_or_admin)):
 async def pair_device(body: PairRequest, user: dict = Depends(require_user_or_admin)):
     """
     Secure Pair flow:
-    - Find device by pair_code
-    - If paired and owned by someone else -> block (409)
-    - Else set paired=True + owner_id (+ owner_email optional) + paired_at
+    - Find device by pair_code (pair_codes index, one document read)
+    - In a transaction:
+      - If paired and owned by someone else -> block (409)
+      - Else set paired=True + owner_id (+ owner_email optional) + paired_at
     """
     try:
         user_id = _get_user_id(user)
 
-        q = (
-            db.collection("devices")
-            .where("pair_code", "==", body.pair_code)
-            .limit(1)
-            .stream()
-        )
-        doc = next(q, None)
-        if not doc:
+        if not _valid_pair_code(body.pair_code):
             raise HTTPException(status_code=404, detail="Invalid pair code")
 
-        device_data = doc.to_dict() or {}
-        already_paired = bool(device_data.get("paired"))
-        owner_id = device_data.get("owner_id")
-
-        # paired to someone else
-        if already_paired and owner_id and owner_id != user_id:
-            raise HTTPException(status_code=409, detail="Device already paired to another user")
+        device_id = _resolve_pair_code(body.pair_code)
+        if not device_id:
+            raise HTTPException(status_code=404, detail="Invalid pair code")
 
         owner_email = _get_user_email_from_users_collection(user_id)
 
-        db.collection("devices").document(doc.id).set(
-            {
-                "paired": True,
-                "owner_id": user_id,
-                "owner_email": owner_email,  # optional, can be None
-                "paired_at": datetime.now(timezone.utc),
-                "last_seen_at": datetime.now(timezone.utc),
-            },
-            merge=True,
+        _claim_device(
+            db.transaction(),
+            db.collection("devices").document(device_id),
+            body.pair_code,
+            user_id,
+            owner_email,
         )
 
-        return {"status": "success", "message": "Device paired", "device_id": doc.id}
+        presence_tracker.record(device_id)
+
+        return {"status": "success", "message": "Device paired", "device_id": device_id}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/provision")
+async def provision_devices(body: ProvisionRequest, user: dict = Depends(require_admin)):
+    """
+    Mass provisioning of new (unpaired) devices.
+    - Checks all pair codes with one batched read of the index, plus
+      chunked queries for legacy devices that are not indexed yet
+    - Creates device + pair code index documents in batched writes
+    Returns a per-device result.
+    """
+    try:
+        results = [None] * len(body.devices)
+        candidates = []
+        seen = set()
+
+        for i, item in enumerate(body.devices):
+            if not _valid_pair_code(item.pair_code):
+                results[i] = {"pair_code": item.pair_code, "status": "error", "detail": "Invalid pair code"}
+            elif item.pair_code in seen:
+                results[i] = {"pair_code": item.pair_code, "status": "error", "detail": "Duplicate pair code in request"}
+            else:
+                seen.add(item.pair_code)
+                candidates.append((i, item))
+
+        code_refs = [db.collection("pair_codes").document(item.pair_code) for _, item in candidates]
+        taken = {snap.id for snap in db.get_all(code_refs) if snap.exists} if code_refs else set()
+        # Legacy devices carry their code only on the device document
+        taken |= _legacy_pair_codes([item.pair_code for _, item in candidates if item.pair_code not in taken])
+
+        to_create = []
+        for i, item in candidates:
+            if item.pair_code in taken:
+                results[i] = {"pair_code": item.pair_code, "status": "error", "detail": "Pair code already in use"}
+            else:
+                to_create.append((i, item))
+
+        now = datetime.now(timezone.utc)
+        for start in range(0, len(to_create), PROVISION_CHUNK):
+            chunk = to_create[start:start + PROVISION_CHUNK]
+            batch = db.batch()
+            refs = []
+            for i, item in chunk:
+                device_ref = db.collection("devices").document()
+                batch.create(device_ref, {
+                    "pair_code": item.pair_code,
+                    "name": item.name,
+                    "location": item.location,
+                    "paired": False,
+                    "owner_id": None,
+                    "created_at": now,
+                })
+                batch.create(db.collection("pair_codes").document(item.pair_code), {
+                    "device_id": device_ref.id,
+                    "created_at": now,
+                })
+                refs.append(device_ref)
+
+            try:
+                batch.commit()
+                for (i, item), ref in zip(chunk, refs):
+                    results[i] = {"pair_code": item.pair_code, "status": "created", "device_id": ref.id}
+            except Exception as e:
+                for i, item in chunk:
+                    results[i] = {"pair_code": item.pair_code, "status": "error", "detail": f"Write failed: {str(e)}"}
+
+        created = sum(1 for r in results if r["status"] == "created")
+        return json_response({"status": "success", "created": created, "failed": len(results) - created, "data": results})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/presence")
+async def get_presence(
+    user: dict = Depends(require_admin),
+    timeout: float | None = Query(None, gt=0, description="Seconds without heartbeat before offline")
+):
+    """
+    Online/offline view of every device that sent a heartbeat
+    to this process, served entirely from memory.
+    """
+    return json_response({
+        "status": "success",
+        "data": presence_tracker.snapshot(timeout),
+        "stats": presence_tracker.status()
+    })
+
+
+@router.post("/{device_id}/heartbeat")
+async def device_heartbeat(device_id: str, user: dict = Depends(require_admin)):
+    """
+    Device liveness ping (devices act as admin).
+    Recorded in memory; last_seen_at is flushed to Firestore in batches.
+    """
+    presence_tracker.record(device_id)
+    return {"status": "success"}
+
+
 @router.put("/{device_id}")
 async def update_device(device_id: str, body: DeviceUpdate, user: dict = Depends(require_admin)):
     try:
@@ -129,7 +334,17 @@ async def update_device(device_id: str, body: DeviceUpdate, user: dict = Depends
 @router.delete("/{device_id}")
 async def delete_device(device_id: str, user: dict = Depends(require_admin)):
     try:
-        db.collection("devices").document(device_id).delete()
+        ref = db.collection("devices").document(device_id)
+        snap = ref.get()
+        pair_code = (snap.to_dict() or {}).get("pair_code") if snap.exists else None
+
+        # Remove the device and its pair code index entry together
+        batch = db.batch()
+        batch.delete(ref)
+        if pair_code and _valid_pair_code(pair_code):
+            batch.delete(db.collection("pair_codes").document(pair_code))
+        batch.commit()
+
         return {"status": "success", "message": "Device removed"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,62 @@
+"""
+diagnostics.py
+--------------
+Production diagnosis (Admin only).
+
+- GET /profile            → sample the whole process for N seconds
+- GET /profiles           → recent single-request profiles (X-Profile: 1)
+- GET /profiles/{id}      → one request profile
+- GET /startup            → startup phase timings (time-to-first-request)
+- GET /spool              → ingest spool backlog, lag and replay counters
+
+Profiles are returned as folded stacks (text/plain), ready for
+flamegraph.pl or speedscope.
+"""
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from app.services.profiler_service import (
+    DEFAULT_INTERVAL_MS, profile_process, recent_profiles, get_profile
+)
+from app.services.startup_service import startup_status
+from app.services.spool_service import ingest_spool
+from app.utils.rbac import require_admin
+
+router = APIRouter()
+
+
+@router.get("/profile", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def profile_process_endpoint(
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(DEFAULT_INTERVAL_MS, ge=1),
+    include_idle: bool = Query(False),
+):
+    """
+    Samples every thread for `seconds` while the worker keeps serving.
+    """
+    return await run_in_threadpool(profile_process, seconds, interval_ms, include_idle)
+
+
+@router.get("/profiles", dependencies=[Depends(require_admin)])
+async def list_request_profiles():
+    return {"status": "success", "data": recent_profiles()}
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def get_request_profile(profile_id: str):
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile["folded"], headers={"X-Profile-Scope": profile["scope"]})
+
+
+@router.get("/startup", dependencies=[Depends(require_admin)])
+async def get_startup_timings():
+    return {"status": "success", "data": startup_status()}
+
+
+@router.get("/spool", dependencies=[Depends(require_admin)])
+async def get_spool_status():
+    return {"status": "success", "data": await run_in_threadpool(ingest_spool.status)}
@@ -8,52 +8,47 @@ Endpoints:
 - GET /history?range=.. -> Admin + User (timeline list)
 
 The write happens automatically when mode changes in control.py (we will update control.py next).
+Scoped to the request's site (X-Site-Id).
 """
 
-from fastapi import APIRouter, HTTPException, Query, Depends
-from datetime import datetime, timedelta, timezone
-from firebase_admin import firestore
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
 
-from app.services.firebase_service import db
-from app.utils.rbac import require_user_or_admin
+from app.services.history_cache import WindowCache, RANGE_SECONDS
+from app.services.site_service import PerSite, site_collection
+from app.services.version_service import version_key, served_etag, is_not_modified, not_modified, content_response
+from app.utils.rbac import require_user_or_admin, current_site
+from app.utils.singleflight import SingleFlight
 
 router = APIRouter()
 
-
-def _range_to_start_time(range: str) -> datetime:
-    now = datetime.now(timezone.utc)
-    if range == "24h":
-        return now - timedelta(hours=24)
-    if range == "7d":
-        return now - timedelta(days=7)
-    return now - timedelta(days=30)
+_history_caches = PerSite(
+    lambda site_id: WindowCache(site_collection("growth_phase_history", site_id), "changed_at"),
+    name="growth_history"
+)
+_reads = SingleFlight(name="growth_reads_singleflight")
 
 
 @router.get("/history", dependencies=[Depends(require_user_or_admin)])
-async def get_growth_phase_history(range: str = Query("24h", enum=["24h", "7d", "30d"])):
-    try:
-        start_time = _range_to_start_time(range)
-
-        query = (
-            db.collection("growth_phase_history")
-            .where("changed_at", ">=", start_time)
-            .order_by("changed_at", direction=firestore.Query.ASCENDING)
-        )
+async def get_growth_phase_history(
+    request: Request,
+    range: str = Query("24h", enum=["24h", "7d", "30d"]),
+    site_id: str = Depends(current_site)
+):
+    key = version_key([site_collection("growth_phase_history", site_id)], site_id, range, window=True)
+    etag = served_etag(key)
+    if etag and is_not_modified(request, etag):
+        return not_modified(etag)
 
-        docs = query.stream()
-        rows = []
-
-        for d in docs:
-            item = d.to_dict()
-            item["id"] = d.id
-            rows.append(item)
+    try:
+        # Sliding window: only entries newer than the cached ones are read
+        rows = await _reads.do(("history", site_id, range), _history_caches[site_id].get, RANGE_SECONDS[range])
 
-        return {
+        return content_response(request, key, {
             "status": "success",
             "range": range,
             "count": len(rows),
             "data": rows
-        }
+        })
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch growth history: {str(e)}")
@@ -9,18 +9,28 @@ Endpoints:
 - GET  /usage?range=..  -> Admin + User (return time-series + totals)
 
 Range allowed: 24h, 7d, 30d
+Scoped to the request's site (X-Site-Id).
 """
 
-from fastapi import APIRouter, HTTPException, Query, Depends
-from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+from datetime import datetime, timezone
 from pydantic import BaseModel, Field
-from firebase_admin import firestore
 
 from app.services.firebase_service import db
-from app.utils.rbac import require_user_or_admin
+from app.services.history_cache import WindowCache, RANGE_SECONDS
+from app.services.site_service import PerSite, site_collection
+from app.services.version_service import version_key, served_etag, is_not_modified, not_modified, content_response
+from app.utils.rbac import require_user_or_admin, current_site
+from app.utils.singleflight import SingleFlight
 
 router = APIRouter()
 
+_usage_caches = PerSite(
+    lambda site_id: WindowCache(site_collection("nutrient_events", site_id), "timestamp"),
+    name="nutrient_usage"
+)
+_reads = SingleFlight(name="nutrient_reads_singleflight")
+
 
 # -----------------------------
 # REQUEST MODEL
@@ -33,20 +43,11 @@ class NutrientEventCreate(BaseModel):
     timestamp: datetime | None = None
 
 
-def _range_to_start_time(range: str) -> datetime:
-    now = datetime.now(timezone.utc)
-    if range == "24h":
-        return now - timedelta(hours=24)
-    if range == "7d":
-        return now - timedelta(days=7)
-    return now - timedelta(days=30)
-
-
 # -----------------------------
 # POST: log nutrient usage event
 # -----------------------------
 @router.post("/events", dependencies=[Depends(require_user_or_admin)])
-async def create_nutrient_event(payload: NutrientEventCreate):
+async def create_nutrient_event(payload: NutrientEventCreate, site_id: str = Depends(current_site)):
     try:
         ts = payload.timestamp or datetime.now(timezone.utc)
 
@@ -56,8 +57,9 @@ async def create_nutrient_event(payload: NutrientEventCreate):
             "timestamp": ts,
         }
 
-        ref = db.collection("nutrient_events").document()
+        ref = db.collection(site_collection("nutrient_events", site_id)).document()
         ref.set(doc)
+        _usage_caches[site_id].note_write(ts)
 
         return {"status": "success", "id": ref.id, "data": doc}
 
@@ -69,38 +71,28 @@ async def create_nutrient_event(payload: NutrientEventCreate):
 # GET: nutrient usage analytics
 # -----------------------------
 @router.get("/usage", dependencies=[Depends(require_user_or_admin)])
-async def get_nutrient_usage(range: str = Query("24h", enum=["24h", "7d", "30d"])):
-    try:
-        start_time = _range_to_start_time(range)
-
-        query = (
-            db.collection("nutrient_events")
-            .where("timestamp", ">=", start_time)
-            .order_by("timestamp", direction=firestore.Query.ASCENDING)
-        )
-
-        docs = query.stream()
+async def get_nutrient_usage(
+    request: Request,
+    range: str = Query("24h", enum=["24h", "7d", "30d"]),
+    site_id: str = Depends(current_site)
+):
+    key = version_key([site_collection("nutrient_events", site_id)], site_id, range, window=True)
+    etag = served_etag(key)
+    if etag and is_not_modified(request, etag):
+        return not_modified(etag)
 
-        events = []
-        total_ml = 0.0
-
-        for d in docs:
-            item = d.to_dict()
-            item["id"] = d.id
-
-            # Firestore timestamp -> should already be datetime
-            ml = float(item.get("nutrient_ml", 0.0))
-            total_ml += ml
-
-            events.append(item)
+    try:
+        # Sliding window: only events newer than the cached ones are read
+        events = await _reads.do(("usage", site_id, range), _usage_caches[site_id].get, RANGE_SECONDS[range])
+        total_ml = sum(float(item.get("nutrient_ml", 0.0)) for item in events)
 
-        return {
+        return content_response(request, key, {
             "status": "success",
             "range": range,
             "count": len(events),
             "total_ml": round(total_ml, 2),
             "data": events,
-        }
+        })
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch nutrient usage: {str(e)}")
@@ -2,38 +2,89 @@
 sensor.py
 ---------
 Handles:
-- Sensor data ingestion (Admin only)
+- Sensor data ingestion, single and batched (Admin only, rate limited
+  per device: see ingest_rate_service; spooled locally while the
+  datastore is slow or down: see spool_service)
 - Dashboard latest reading (User + Admin)
 - Historical data query (User + Admin)
 
+Every route is scoped to the request's site (X-Site-Id, see
+site_service): readings, caches and ETags are per site.
+
 RBAC Policy:
 - POST /latest  → Admin only
+- POST /batch   → Admin only
 - GET  /latest  → Admin + User
 - GET  /history → Admin + User
 """
 
-from fastapi import APIRouter, HTTPException, Query, Depends
-from datetime import datetime, timedelta, timezone
-from firebase_admin import firestore
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, Response
+from pydantic import BaseModel, Field
+from datetime import datetime, timezone
 
 from app.models import SensorReading
-from app.services.firebase_service import db
+from app.services.firebase_service import db, DESCENDING
 from app.services.alert_service import check_sensor_thresholds
-from app.utils.rbac import require_admin, require_user_or_admin
+from app.services.metrics_service import READINGS_INGESTED
+from app.services.spool_service import ingest_spool
+from app.services.ingest_rate_service import MAX_BATCH, check_ingest_rate
+from app.services.history_cache import WindowCache, RANGE_SECONDS
+from app.services.site_service import PerSite, site_collection, split_site_collection
+from app.services.version_service import VersionedCache, version_key, served_etag, is_not_modified, not_modified, content_response
+from app.utils.rbac import require_admin, require_user_or_admin, current_site
+from app.utils.singleflight import SingleFlight
 
 router = APIRouter()
 
+_history_caches = PerSite(
+    lambda site_id: WindowCache(site_collection("sensors", site_id), "timestamp"),
+    name="sensor_history"
+)
+_reads = SingleFlight(name="sensor_reads_singleflight")
+# Dropped by any write to the site's sensors, on this worker or another (invalidation bus)
+_latest_caches = PerSite(
+    lambda site_id: VersionedCache(site_collection("sensors", site_id), ttl_seconds=10),
+    name="sensor_latest"
+)
+
+
+def _sensors(site_id: str):
+    return db.collection(site_collection("sensors", site_id))
+
+
+class SensorBatch(BaseModel):
+    readings: list[SensorReading] = Field(..., min_length=1, max_length=MAX_BATCH)
+
+
+async def ingest_rate_limit(request: Request, response: Response, user: dict, route: str, site_id: str):
+    """
+    One token per ingest request, per X-Device-Id and per credential.
+    Over the limit: 429 with Retry-After and a hint to batch.
+    Called from the handlers, after the body validated, so a rejected
+    body does not cost a token.
+    """
+    headers = await check_ingest_rate(user, request.headers.get("x-device-id"), route, site_id)
+    response.headers.update(headers)
+
 
 # -------------------------------------------------
 # ADMIN ONLY — Sensor Ingestion
 # -------------------------------------------------
-@router.post("/latest", dependencies=[Depends(require_admin)])
-async def save_sensor_data(data: SensorReading):
+@router.post("/latest")
+async def save_sensor_data(
+    data: SensorReading,
+    request: Request,
+    response: Response,
+    user: dict = Depends(require_admin),
+    site_id: str = Depends(current_site)
+):
     """
     Save new sensor reading.
     Only Admin (or IoT device acting as admin) can call this.
     """
 
+    await ingest_rate_limit(request, response, user, "latest", site_id)
+
     try:
         # Ensure timestamp is UTC aware
         if not data.timestamp:
@@ -41,18 +92,26 @@ async def save_sensor_data(data: SensorReading):
 
         sensor_dict = data.dict()
 
-        # Create new document
-        doc_ref = db.collection("sensors").document()
-        doc_ref.set(sensor_dict)
+        # Create new document (or spool it while the datastore is unhealthy)
+        collection = site_collection("sensors", site_id)
+        doc_ref = db.collection(collection).document()
+        stored = await ingest_spool.write(collection, doc_ref.id, sensor_dict)
+        READINGS_INGESTED.inc()
 
-        # Trigger alert checks asynchronously
-        await check_sensor_thresholds(sensor_dict)
+        # Trigger alert checks asynchronously (spooled: checked on replay)
+        if stored:
+            _history_caches[site_id].note_write(data.timestamp)
+            await check_sensor_thresholds(sensor_dict, site_id)
 
         return {
             "status": "success",
-            "id": doc_ref.id
+            "id": doc_ref.id,
+            "spooled": not stored
         }
 
+    except HTTPException:
+        raise
+
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -60,28 +119,115 @@ async def save_sensor_data(data: SensorReading):
         )
 
 
+@router.post("/batch")
+async def save_sensor_batch(
+    batch: SensorBatch,
+    request: Request,
+    response: Response,
+    user: dict = Depends(require_admin),
+    site_id: str = Depends(current_site)
+):
+    """
+    Save several buffered readings in one request (one batched write).
+    Thresholds are checked against the newest reading only; the older
+    ones are already superseded.
+    """
+
+    await ingest_rate_limit(request, response, user, "batch", site_id)
+
+    try:
+        now = datetime.now(timezone.utc)
+        collection = site_collection("sensors", site_id)
+        docs = []
+
+        for reading in batch.readings:
+            if not reading.timestamp:
+                reading.timestamp = now
+            docs.append((db.collection(collection).document().id, reading.dict()))
+
+        stored = await ingest_spool.write_many(collection, docs)
+        READINGS_INGESTED.inc(len(docs))
+
+        if stored:
+            # Buffered readings are usually behind the cached window's newest row
+            _history_caches[site_id].note_write(_oldest(data for _, data in docs)["timestamp"])
+            await check_sensor_thresholds(_newest(data for _, data in docs), site_id)
+
+        return {
+            "status": "success",
+            "count": len(docs),
+            "ids": [doc_id for doc_id, _ in docs],
+            "spooled": not stored
+        }
+
+    except HTTPException:
+        raise
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to save sensor batch: {str(e)}"
+        )
+
+
+def _newest(readings) -> dict:
+    return max(readings, key=lambda r: r["timestamp"].timestamp())
+
+
+def _oldest(readings) -> dict:
+    return min(readings, key=lambda r: r["timestamp"].timestamp())
+
+
+async def _on_spool_replayed(collection: str, docs: list[dict]):
+    """
+    Spooled readings reached the datastore: report them to the history
+    cache (their timestamps may be older than its high-water mark) and
+    check thresholds on the newest reading, skipped while spooling.
+    """
+    site_id, name = split_site_collection(collection)
+    if name != "sensors":
+        return
+    _history_caches[site_id].note_write(_oldest(docs)["timestamp"])
+    await check_sensor_thresholds(_newest(docs), site_id)
+
+
+ingest_spool.on_replayed(_on_spool_replayed)
+
+
 # -------------------------------------------------
 # USER + ADMIN — Latest Reading
 # -------------------------------------------------
+def _read_latest(site_id: str) -> dict | None:
+    cache = _latest_caches[site_id]
+    cached = cache.get("latest")
+    if cached is not None:
+        return cached
+
+    version = cache.version()
+    query = (
+        _sensors(site_id)
+        .order_by("timestamp", direction=DESCENDING)
+        .limit(1)
+    )
+
+    latest_data = None
+    for doc in query.stream():
+        latest_data = doc.to_dict()
+        latest_data["id"] = doc.id
+    if latest_data is not None:
+        cache.set("latest", latest_data, version)
+    return latest_data
+
+
 @router.get("/latest", dependencies=[Depends(require_user_or_admin)])
-async def get_latest_sensor_data():
+async def get_latest_sensor_data(site_id: str = Depends(current_site)):
     """
     Fetch most recent sensor reading for dashboard.
     """
 
     try:
-        query = (
-            db.collection("sensors")
-            .order_by("timestamp", direction=firestore.Query.DESCENDING)
-            .limit(1)
-        )
-
-        docs = query.stream()
-
-        latest_data = None
-        for doc in docs:
-            latest_data = doc.to_dict()
-            latest_data["id"] = doc.id
+        # Concurrent dashboards share one query
+        latest_data = await _reads.do(("latest", site_id), _read_latest, site_id)
 
         if not latest_data:
             raise HTTPException(
@@ -106,42 +252,32 @@ async def get_latest_sensor_data():
 # -------------------------------------------------
 @router.get("/history", dependencies=[Depends(require_user_or_admin)])
 async def get_sensor_history(
-    range: str = Query("24h", enum=["24h", "7d", "30d"])
+    request: Request,
+    range: str = Query("24h", enum=["24h", "7d", "30d"]),
+    site_id: str = Depends(current_site)
 ):
     """
     Fetch historical sensor readings for analytics.
+    Conditional: If-None-Match with the current ETag returns 304 without a read.
     """
 
-    try:
-        now = datetime.now(timezone.utc)
+    key = version_key([site_collection("sensors", site_id)], site_id, range, window=True)
+    etag = served_etag(key)
+    if etag and is_not_modified(request, etag):
+        return not_modified(etag)
 
-        if range == "24h":
-            start_time = now - timedelta(hours=24)
-        elif range == "7d":
-            start_time = now - timedelta(days=7)
-        else:
-            start_time = now - timedelta(days=30)
-
-        query = (
-            db.collection("sensors")
-            .where("timestamp", ">=", start_time)
-            .order_by("timestamp", direction=firestore.Query.ASCENDING)
+    try:
+        # Sliding window: only readings newer than the cached ones are read
+        history = await _reads.do(
+            ("history", site_id, range), _history_caches[site_id].get, RANGE_SECONDS[range]
         )
 
-        docs = query.stream()
-
-        history = []
-        for doc in docs:
-            data = doc.to_dict()
-            data["id"] = doc.id
-            history.append(data)
-
-        return {
+        return content_response(request, key, {
             "status": "success",
             "range": range,
             "count": len(history),
             "data": history
-        }
+        })
 
     except Exception as e:
         raise HTTPException(
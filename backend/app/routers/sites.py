@@ -0,0 +1,59 @@
+"""
+sites.py
+--------
+Greenhouse sites (tenants) served by this deployment.
+
+- GET  /   → Admin + User (sites the caller may use)
+- POST /   → Admin only (register a site)
+
+Site data is selected per request with the X-Site-Id header
+(see site_service / rbac.current_site).
+"""
+
+from fastapi import APIRouter, HTTPException, Depends
+from datetime import datetime, timezone
+from pydantic import BaseModel
+
+from app.services.firebase_service import db
+from app.services.site_service import DEFAULT_SITE_ID, SITE_ID_PATTERN, list_sites
+from app.utils.rbac import require_admin, require_user_or_admin, allowed_sites
+
+router = APIRouter()
+
+
+class SiteCreate(BaseModel):
+    site_id: str
+    name: str
+    location: str | None = None
+
+
+@router.get("/")
+def get_sites(user: dict = Depends(require_user_or_admin)):
+    try:
+        sites = list_sites()
+        allowed = allowed_sites(user)
+        if allowed is not None:
+            sites = [s for s in sites if s["site_id"] in allowed]
+        return {"status": "success", "data": sites}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list sites: {str(e)}")
+
+
+@router.post("/", dependencies=[Depends(require_admin)])
+def create_site(data: SiteCreate):
+    if not SITE_ID_PATTERN.match(data.site_id) or data.site_id == DEFAULT_SITE_ID:
+        raise HTTPException(
+            status_code=400,
+            detail="site_id must be lowercase letters, digits, '-' or '_' (max 63) and not the default site"
+        )
+
+    ref = db.collection("sites").document(data.site_id)
+    if ref.get().exists:
+        raise HTTPException(status_code=409, detail="Site already exists")
+
+    ref.set({
+        "name": data.name,
+        "location": data.location,
+        "created_at": datetime.now(timezone.utc)
+    })
+    return {"status": "success", "site_id": data.site_id}
@@ -3,19 +3,29 @@ USERS ROUTER
 ------------
 Handles user management.
 Only Admin can:
-- Create users
+- Create users (single or bulk import)
 - List users
 - Deactivate users
+- Restrict users to sites
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, EmailStr
+import os
+import csv
+import io
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, EmailStr, ValidationError
 from datetime import datetime
 from datetime import timezone
 from app.services.firebase_service import db
-from app.services.auth_service import hash_password
+from app.services.auth_service import hash_password, hash_passwords
+from app.services.site_service import SITE_ID_PATTERN, get_site
 from app.utils.rbac import require_admin
 from app.utils.rbac import get_current_user
+from app.utils.pagination import PageParams, page_params, paginate
+from app.utils.responses import json_response
 from app.models import Role
 
 router = APIRouter()
@@ -32,6 +42,20 @@ class CreateUserRequest(BaseModel):
     role: Role = Role.user
 
 
+class UserSitesUpdate(BaseModel):
+    # None = the default site only
+    sites: list[str] | None
+
+
+# Firestore limits: "in" filters take at most 30 values,
+# a batched write holds at most 500 operations.
+BULK_LOOKUP_CHUNK = 30
+BULK_WRITE_CHUNK = 500
+
+# Rows accepted per bulk import request
+BULK_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", "5000"))
+
+
 # -----------------------------
 # CREATE USER (Admin Only)
 # -----------------------------
@@ -69,33 +93,209 @@ def create_user(data: CreateUserRequest):
     }
 
 
+# -----------------------------
+# BULK IMPORT HELPERS
+# -----------------------------
+
+def _parse_bulk_rows(body: bytes, content_type: str) -> list:
+    """
+    Accepts either:
+    - text/csv with a header row: username,email,password[,role]
+    - JSON: [{...}, ...] or {"users": [{...}, ...]}
+    """
+    if "csv" in content_type:
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        # Empty CSV cells mean "use the default" (e.g. role); cells beyond
+        # the header land under the None key and are rejected per row
+        return [{k: v for k, v in row.items() if v not in (None, "")} for row in reader]
+
+    payload = json.loads(body or b"null")
+    if isinstance(payload, dict):
+        payload = payload.get("users")
+    if not isinstance(payload, list):
+        raise ValueError('Expected a JSON list of users or {"users": [...]}')
+    return payload
+
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+    )
+
+
+def _find_existing(field: str, values: list[str]) -> set[str]:
+    """
+    Returns which of `values` already exist in users.<field>,
+    using chunked "in" queries instead of one query per row.
+    """
+    found = set()
+    for i in range(0, len(values), BULK_LOOKUP_CHUNK):
+        chunk = values[i:i + BULK_LOOKUP_CHUNK]
+        docs = db.collection("users") \
+            .where(field, "in", chunk) \
+            .select([field]) \
+            .stream()
+        for doc in docs:
+            found.add((doc.to_dict() or {}).get(field))
+    return found
+
+
+def _bulk_create_users(rows: list) -> list[dict]:
+    """
+    1. Validate every row and reject duplicates inside the upload
+    2. Check username/email uniqueness for all rows in batched lookups
+    3. Hash passwords in parallel
+    4. Commit users in Firestore batched writes
+    Returns one result entry per input row (1-based row numbers).
+    """
+    results: list[dict | None] = [None] * len(rows)
+    candidates = []
+    seen_usernames, seen_emails = set(), set()
+
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[i] = {"row": i + 1, "status": "error", "detail": "Row must be an object"}
+            continue
+        if None in row:
+            results[i] = {"row": i + 1, "status": "error", "detail": "Row has more cells than the header"}
+            continue
+        try:
+            user = CreateUserRequest(**row)
+        except ValidationError as e:
+            results[i] = {"row": i + 1, "status": "error", "detail": _format_validation_error(e)}
+            continue
+
+        if user.username in seen_usernames:
+            results[i] = {"row": i + 1, "status": "error", "username": user.username,
+                          "detail": "Duplicate username in upload"}
+            continue
+        if user.email in seen_emails:
+            results[i] = {"row": i + 1, "status": "error", "username": user.username,
+                          "detail": "Duplicate email in upload"}
+            continue
+
+        seen_usernames.add(user.username)
+        seen_emails.add(user.email)
+        candidates.append((i, user))
+
+    existing_usernames = _find_existing("username", [u.username for _, u in candidates])
+    existing_emails = _find_existing("email", [u.email for _, u in candidates])
+
+    to_create = []
+    for i, user in candidates:
+        if user.username in existing_usernames:
+            results[i] = {"row": i + 1, "status": "error", "username": user.username,
+                          "detail": "Username already exists"}
+        elif user.email in existing_emails:
+            results[i] = {"row": i + 1, "status": "error", "username": user.username,
+                          "detail": "Email already exists"}
+        else:
+            to_create.append((i, user))
+
+    password_hashes = hash_passwords([u.password for _, u in to_create])
+    now = datetime.utcnow()
+
+    for start in range(0, len(to_create), BULK_WRITE_CHUNK):
+        chunk = to_create[start:start + BULK_WRITE_CHUNK]
+        chunk_hashes = password_hashes[start:start + BULK_WRITE_CHUNK]
+
+        batch = db.batch()
+        refs = []
+        for (i, user), pw_hash in zip(chunk, chunk_hashes):
+            ref = db.collection("users").document()
+            batch.set(ref, {
+                "username": user.username,
+                "email": user.email,
+                "password_hash": pw_hash,
+                "role": user.role.value,
+                "is_active": True,
+                "created_at": now,
+                "last_login_at": None
+            })
+            refs.append(ref)
+
+        try:
+            batch.commit()
+            for (i, user), ref in zip(chunk, refs):
+                results[i] = {"row": i + 1, "status": "created", "username": user.username,
+                              "user_id": ref.id}
+        except Exception as e:
+            for i, user in chunk:
+                results[i] = {"row": i + 1, "status": "error", "username": user.username,
+                              "detail": f"Write failed: {str(e)}"}
+
+    return results
+
+
+# -----------------------------
+# BULK CREATE USERS (Admin Only)
+# -----------------------------
+
+@router.post("/bulk", dependencies=[Depends(require_admin)])
+async def bulk_create_users(request: Request):
+    """
+    Creates many users in one request (JSON or CSV body).
+    Returns a per-row report; invalid rows do not block valid ones.
+    At most BULK_IMPORT_MAX_ROWS rows (default 5000) per request.
+    """
+
+    try:
+        rows = _parse_bulk_rows(await request.body(), request.headers.get("content-type", ""))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid import payload: {str(e)}")
+
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {BULK_MAX_ROWS} users per import (got {len(rows)}), split the file"
+        )
+
+    try:
+        results = await run_in_threadpool(_bulk_create_users, rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Bulk import failed: {str(e)}")
+
+    created = sum(1 for r in results if r["status"] == "created")
+
+    return json_response({
+        "status": "success",
+        "created": created,
+        "failed": len(results) - created,
+        "data": results
+    })
+
+
 # -----------------------------
 # LIST USERS (Admin Only)
 # -----------------------------
 
 @router.get("/", dependencies=[Depends(require_admin)])
-def list_users():
+def list_users(
+    role: Role | None = Query(None),
+    is_active: bool | None = Query(None),
+    page: PageParams = Depends(page_params())
+):
     """
-    Returns all users (excluding password hashes).
+    Returns users (excluding password hashes), one page at a time.
     """
 
-    docs = db.collection("users").stream()
-    users = []
+    query = db.collection("users")
+    if role is not None:
+        query = query.where("role", "==", role.value)
+    if is_active is not None:
+        query = query.where("is_active", "==", is_active)
 
-    for doc in docs:
-        data = doc.to_dict()
-        data["id"] = doc.id
+    users, next_cursor = paginate(query, page)
 
-        # Never expose password hash
+    # Never expose password hash
+    for data in users:
         data.pop("password_hash", None)
 
-        users.append(data)
-
-    return {
+    return json_response({
         "status": "success",
-        "data": users
-    }
-
+        "data": users,
+        "next_cursor": next_cursor
+    })
 
 
 # -----------------------------
@@ -139,4 +339,30 @@ def reactivate_user(user_id: str):
         "deactivated_at": None
     }, merge=True)
 
-    return {"status": "success", "message": "User reactivated"}
\ No newline at end of file
+    return {"status": "success", "message": "User reactivated"}
+
+# -----------------------------
+# SITE ACCESS
+# -----------------------------
+@router.put("/{user_id}/sites", dependencies=[Depends(require_admin)])
+def update_user_sites(user_id: str, body: UserSitesUpdate):
+    """
+    Limits a user to the given registered sites (null = the default site
+    only). Admins always have every site.
+    """
+    sites = list(dict.fromkeys(body.sites)) if body.sites is not None else None
+    if sites is not None:
+        invalid = [s for s in sites if not SITE_ID_PATTERN.match(s)]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Invalid site ids: {', '.join(invalid)}")
+        unknown = [s for s in sites if get_site(s) is None]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown sites: {', '.join(unknown)}")
+
+    ref = db.collection("users").document(user_id)
+    if not ref.get().exists:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    ref.set({"sites": sites}, merge=True)
+
+    return {"status": "success", "sites": sites}
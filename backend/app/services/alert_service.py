@@ -4,24 +4,46 @@
 # It compares live readings against the goals set by the user in the config.
 # If something is wrong (like the water being too acidic), it automatically
 # creates an entry in the 'alerts' collection for the UI to display.
+# Everything here is per site: alerts and config live in the site's
+# partition (see site_service.py).
+
+from google.api_core.exceptions import NotFound
 
 from app.services.firebase_service import db
 from app.models import Alert
-from datetime import datetime
+from app.services.metrics_service import ALERT_EVALUATIONS, ALERTS_TRIGGERED
+from app.services.site_service import DEFAULT_SITE_ID, PerSite, site_collection, site_alert_config
+from app.services.version_service import VersionedCache
+from datetime import datetime, timezone
+
+# Firestore batched writes hold at most 500 operations
+ALERT_BATCH_SIZE = 500
+
+# Per site: status -> alert count; dropped whenever the site's alerts
+# change (here or on another worker), short TTL as a backstop
+_alert_counts = PerSite(
+    lambda site_id: VersionedCache(site_collection("alerts", site_id), ttl_seconds=10),
+    name="alert_count"
+)
+
+
+def _alerts(site_id: str):
+    return db.collection(site_collection("alerts", site_id))
 
-async def check_sensor_thresholds(sensor_data: dict):
+
+async def check_sensor_thresholds(sensor_data: dict, site_id: str = DEFAULT_SITE_ID):
     """
-    Compares incoming sensor readings against the configured greenhouse
+    Compares incoming sensor readings against the site's configured
     thresholds and generates alerts when violations are detected.
     """
 
-    # Fetch system configuration (targets and thresholds)
-    config_ref = db.collection("controls").document("system_config").get()
-    if not config_ref.exists:
+    # Site configuration (targets and thresholds), cached per site
+    config = site_alert_config(site_id)
+    if config is None:
         return
 
-    config = config_ref.to_dict()
     triggered_alerts = []
+    ALERT_EVALUATIONS.inc()
 
     # --- pH check ---
     current_ph = sensor_data.get("ph")
@@ -61,4 +83,121 @@ async def check_sensor_thresholds(sensor_data: dict):
 
     # Persist triggered alerts
     for alert in triggered_alerts:
-        db.collection("alerts").add(alert.dict())
+        _alerts(site_id).add(alert.dict())
+        ALERTS_TRIGGERED.labels(alert.sensor_type).inc()
+
+
+# -----------------------------
+# ALERT COUNTER
+# -----------------------------
+
+def count_alerts(status: str = "Active", site_id: str = DEFAULT_SITE_ID) -> int:
+    """
+    Number of alerts with this status, using a Firestore count()
+    aggregation (no documents are transferred), cached until alerts change.
+    """
+    cache = _alert_counts[site_id]
+    cached = cache.get(status)
+    if cached is not None:
+        return cached
+
+    version = cache.version()
+    result = _alerts(site_id).where("status", "==", status).count().get()
+    total = int(result[0][0].value)
+    cache.set(status, total, version)
+    return total
+
+
+# -----------------------------
+# BULK DISMISS
+# -----------------------------
+
+def _dismissal_fields() -> dict:
+    return {"status": "Dismissed", "dismissed_at": datetime.now(timezone.utc)}
+
+
+def dismiss_alerts_by_id(alert_ids: list[str], site_id: str = DEFAULT_SITE_ID) -> dict:
+    """
+    Dismisses the given alerts with chunked batched writes.
+    Returns {"dismissed": [...ids], "not_found": [...ids]}.
+    Other datastore errors (timeouts, permissions, outages) are raised.
+    """
+    dismissed, not_found = [], []
+    fields = _dismissal_fields()
+
+    for i in range(0, len(alert_ids), ALERT_BATCH_SIZE):
+        chunk = alert_ids[i:i + ALERT_BATCH_SIZE]
+        batch = db.batch()
+        for alert_id in chunk:
+            batch.update(_alerts(site_id).document(alert_id), fields)
+        try:
+            batch.commit()
+            dismissed.extend(chunk)
+        except NotFound:
+            # update() fails the whole batch if one id is unknown;
+            # fall back to per-document updates for this chunk
+            for alert_id in chunk:
+                try:
+                    _alerts(site_id).document(alert_id).update(fields)
+                    dismissed.append(alert_id)
+                except NotFound:
+                    not_found.append(alert_id)
+
+    return {"dismissed": dismissed, "not_found": not_found}
+
+
+def dismiss_alerts_by_filter(sensor_type: str | None = None,
+                             since: datetime | None = None,
+                             until: datetime | None = None,
+                             site_id: str = DEFAULT_SITE_ID) -> int:
+    """
+    Dismisses every Active alert matching the filters, one page of
+    ALERT_BATCH_SIZE at a time. Dismissed alerts drop out of the query,
+    so re-running it walks forward without a cursor.
+    Returns the number of alerts dismissed.
+    """
+    query = _alerts(site_id).where("status", "==", "Active")
+    if sensor_type:
+        query = query.where("sensor_type", "==", sensor_type)
+    if since:
+        query = query.where("timestamp", ">=", since)
+    if until:
+        query = query.where("timestamp", "<=", until)
+
+    total = 0
+    fields = _dismissal_fields()
+    while True:
+        docs = list(query.select(["status"]).limit(ALERT_BATCH_SIZE).stream())
+        if not docs:
+            break
+
+        batch = db.batch()
+        for doc in docs:
+            batch.update(doc.reference, fields)
+        batch.commit()
+        total += len(docs)
+
+        if len(docs) < ALERT_BATCH_SIZE:
+            break
+
+    return total
+
+
+# -----------------------------
+# INGEST RATE ALERTS
+# -----------------------------
+
+def raise_ingest_rate_alert(source: str, rejected: int, limit: str, site_id: str = DEFAULT_SITE_ID):
+    """
+    Records that an ingest source keeps exceeding its rate limit
+    (called by the ingest limiter, at most once per source per cooldown).
+    """
+    alert = Alert(
+        sensor_type="Ingest Rate",
+        measured_value=rejected,
+        exceeded_threshold=f"{limit} ({source})",
+        timestamp=datetime.now(),
+        status="Active"
+    )
+    _alerts(site_id).add(alert.dict())
+    ALERTS_TRIGGERED.labels(alert.sensor_type).inc()
@@ -18,27 +18,29 @@ Why timezone-aware UTC?
 import os
 import secrets
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
 from passlib.context import CryptContext
-from dotenv import load_dotenv
 from app.services.firebase_service import db
 
-# Load environment variables from .env
-load_dotenv()
-
 # Password hashing engine (bcrypt)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Load security configs from .env
+# Security configs (.env is loaded once by app.main)
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_MINUTES = int(os.getenv("ACCESS_TOKEN_MINUTES", "15"))
 REFRESH_TOKEN_DAYS = int(os.getenv("REFRESH_TOKEN_DAYS", "14"))
 
-# Fail fast if secret is not configured (enterprise hygiene)
-if not JWT_SECRET:
-    raise RuntimeError("JWT_SECRET is missing. Set it in your .env file.")
+
+def validate_auth_config():
+    """
+    Fail fast at startup (app lifespan) if the secret is not configured
+    (enterprise hygiene), rather than crashing on import.
+    """
+    if not JWT_SECRET:
+        raise RuntimeError("JWT_SECRET is missing. Set it in your .env file.")
 
 
 # -----------------------------
@@ -59,6 +61,20 @@ def verify_password(password: str, password_hash: str) -> bool:
     return pwd_context.verify(password, password_hash)
 
 
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """
+    Hashes many passwords in parallel (bulk user import).
+    bcrypt releases the GIL while hashing, so a thread pool
+    spreads the work across all CPU cores. Order is preserved.
+    """
+    if not passwords:
+        return []
+
+    workers = min(len(passwords), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_password, passwords))
+
+
 # -----------------------------
 # ACCESS TOKEN (JWT)
 # -----------------------------
@@ -0,0 +1,445 @@
+"""
+AUTOMATION SERVICE
+------------------
+In-process automation engine (replaces external cron scripts).
+
+Acts on what ModeUpdate stores in settings/system_config:
+- Light schedule: light_on_time / light_off_time switch LIGHT_DEVICE_ID
+- Closed-loop dosing: pH / EC readings vs target_ph / target_ec
+
+Per-device light schedules can also be stored in the
+"automation_schedules" collection (doc id = device_id,
+fields: on_time, off_time).
+
+Automation runs for the default site (see site_service); other sites are
+controlled manually or by their own devices.
+
+Design:
+- One timer heap (heapq) holds every job keyed by name; a single asyncio
+  task sleeps until the earliest due time. Light jobs only wake up at the
+  next on/off boundary, so thousands of schedules cost nothing in between.
+- Jobs return their next due time; re-scheduling a key supersedes the old
+  heap entry (lazy deletion).
+- Tick lag (actual run time - due time) is recorded for monitoring.
+- Dosing actions are written to controls and nutrient_events.
+
+Dosing safety:
+- No pulse from a reading older than AUTOMATION_DOSING_MAX_READING_AGE_SECONDS
+  (default 120, twice a one-minute reporting interval): a sensor that went
+  offline must not keep dosing on its last value
+- The pump-off job is scheduled before the pump is switched on, and retried
+  every AUTOMATION_PUMP_OFF_RETRY_SECONDS (default 2) until it succeeds
+
+Single leader: only the process holding an exclusive lock on
+AUTOMATION_LOCK_PATH (default automation.lock) runs the engine, so with
+several workers a dosing pulse fires once whatever WEB_CONCURRENCY says;
+the others stand by and retry the lock every
+AUTOMATION_LEADER_RETRY_SECONDS (default 10) in case the leader exits.
+The lock is per host: with workers on several hosts, enable automation on
+one host only.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+try:
+    import fcntl
+except ImportError:  # not on Windows: no election there, run single-worker
+    fcntl = None
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.firebase_service import db, DESCENDING
+from app.services.mirror_service import settings_mirror
+from app.services.control_service import apply_control
+
+AUTOMATION_ENABLED = os.getenv("AUTOMATION_ENABLED", "false").lower() == "true"
+AUTOMATION_TZ = ZoneInfo(os.getenv("AUTOMATION_TZ", "UTC"))
+AUTOMATION_MAX_CONCURRENCY = int(os.getenv("AUTOMATION_MAX_CONCURRENCY", "32"))
+
+AUTOMATION_LOCK_PATH = os.getenv("AUTOMATION_LOCK_PATH", "automation.lock")
+LEADER_RETRY_SECONDS = float(os.getenv("AUTOMATION_LEADER_RETRY_SECONDS", "10"))
+
+LIGHT_DEVICE_ID = os.getenv("AUTOMATION_LIGHT_DEVICE_ID", "grow_light")
+# Global schedule is re-read at least this often, so edits from any writer apply
+LIGHT_RESYNC_SECONDS = float(os.getenv("AUTOMATION_LIGHT_RESYNC_SECONDS", "60"))
+
+DOSING_ENABLED = os.getenv("AUTOMATION_DOSING_ENABLED", "false").lower() == "true"
+DOSING_INTERVAL_SECONDS = float(os.getenv("AUTOMATION_DOSING_INTERVAL_SECONDS", "60"))
+DOSING_PULSE_SECONDS = float(os.getenv("AUTOMATION_DOSING_PULSE_SECONDS", "5"))
+DOSING_PULSE_ML = float(os.getenv("AUTOMATION_DOSING_PULSE_ML", "10"))
+PH_DEADBAND = float(os.getenv("AUTOMATION_PH_DEADBAND", "0.2"))
+EC_DEADBAND = float(os.getenv("AUTOMATION_EC_DEADBAND", "0.1"))
+DOSING_MAX_READING_AGE_SECONDS = float(os.getenv("AUTOMATION_DOSING_MAX_READING_AGE_SECONDS", "120"))
+PUMP_OFF_RETRY_SECONDS = float(os.getenv("AUTOMATION_PUMP_OFF_RETRY_SECONDS", "2"))
+
+NUTRIENT_PUMP_ID = "dosing_pump_a"
+PH_DOWN_PUMP_ID = "ph_down_pump"
+PH_UP_PUMP_ID = "ph_up_pump"
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# TIMER HEAP SCHEDULER
+# -----------------------------
+
+class TimerHeap:
+    """
+    Min-heap of (due_epoch, seq, key). Each key has at most one live entry;
+    stale entries are skipped when popped.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._jobs = {}   # key -> (seq, callback)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._slots = asyncio.Semaphore(AUTOMATION_MAX_CONCURRENCY)
+        self._lags = deque(maxlen=1000)
+        self.stats = {"runs": 0, "errors": 0, "max_lag_ms": 0.0}
+
+    def schedule(self, key: str, due: float, callback):
+        """
+        callback: async () -> next due epoch seconds, or None to stop.
+        """
+        seq = next(self._seq)
+        self._jobs[key] = (seq, callback)
+        heapq.heappush(self._heap, (due, seq, key))
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def cancel(self, key: str):
+        self._jobs.pop(key, None)
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def _is_live(self, entry) -> bool:
+        job = self._jobs.get(entry[2])
+        return job is not None and job[0] == entry[1]
+
+    async def _run(self):
+        while True:
+            while self._heap and not self._is_live(self._heap[0]):
+                heapq.heappop(self._heap)
+
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due, seq, key = heapq.heappop(self._heap)
+            _, callback = self._jobs.pop(key)
+
+            lag_ms = (time.time() - due) * 1000
+            self._lags.append(lag_ms)
+            self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], round(lag_ms, 1))
+
+            await self._slots.acquire()
+            asyncio.create_task(self._execute(key, callback))
+
+    async def _execute(self, key: str, callback):
+        try:
+            next_due = await callback()
+            self.stats["runs"] += 1
+        except Exception:
+            self.stats["errors"] += 1
+            logger.exception("Automation job %s failed", key)
+            next_due = time.time() + 60  # retry later instead of dropping the job
+        finally:
+            self._slots.release()
+
+        # Only re-arm if nobody re-scheduled the key while it ran
+        if next_due is not None and key not in self._jobs:
+            self.schedule(key, next_due, callback)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        lags = sorted(self._lags)
+        p95 = lags[min(len(lags) - 1, int(0.95 * len(lags)))] if lags else None
+        return {
+            **self.stats,
+            "scheduled_jobs": len(self._jobs),
+            "last_lag_ms": round(self._lags[-1], 1) if self._lags else None,
+            "p95_lag_ms": None if p95 is None else round(p95, 1),
+        }
+
+
+# -----------------------------
+# LIGHT SCHEDULES
+# -----------------------------
+
+def _parse_hhmm(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value), "%H:%M").time()
+    except ValueError:
+        return None
+
+
+def light_window(on_time, off_time, now: datetime) -> tuple[bool, datetime]:
+    """
+    Returns (should_be_on, next_boundary) for a daily on/off window
+    in AUTOMATION_TZ. Windows may cross midnight (e.g. 20:00 -> 06:00).
+    """
+    local = now.astimezone(AUTOMATION_TZ)
+    t = local.time()
+
+    if on_time < off_time:
+        on = on_time <= t < off_time
+    else:
+        on = t >= on_time or t < off_time
+
+    boundaries = []
+    for day in (local.date(), local.date() + timedelta(days=1)):
+        for bt in (on_time, off_time):
+            candidate = datetime.combine(day, bt, tzinfo=AUTOMATION_TZ)
+            if candidate > local:
+                boundaries.append(candidate)
+
+    return on, min(boundaries)
+
+
+def _read_settings() -> dict:
+    mirrored = settings_mirror.snapshot()
+    if mirrored is not None:
+        return mirrored.get("system_config", {})
+    doc = db.collection("settings").document("system_config").get()
+    return doc.to_dict() if doc.exists else {}
+
+
+class AutomationEngine:
+
+    def __init__(self):
+        self.timers: TimerHeap | None = None
+        self._applied: dict[str, bool] = {}   # last state we set per device
+        self._lock_file = None
+        self._standby: asyncio.Task | None = None
+
+    async def _switch(self, device_id: str, on: bool):
+        # Avoid a Firestore write when the state is already what we set
+        if self._applied.get(device_id) == on:
+            return
+        await apply_control(device_id, on, source="automation")
+        self._applied[device_id] = on
+
+    def _light_job(self, device_id: str, on_time=None, off_time=None):
+        """
+        Fixed schedule when on/off are given, else follows system_config.
+        """
+        async def run():
+            start, stop = on_time, off_time
+            resync = None
+            if start is None:
+                settings = await run_in_threadpool(_read_settings)
+                start = _parse_hhmm(settings.get("light_on_time"))
+                stop = _parse_hhmm(settings.get("light_off_time"))
+                resync = time.time() + LIGHT_RESYNC_SECONDS
+
+            if start is None or stop is None or start == stop:
+                return resync
+
+            on, next_change = light_window(start, stop, datetime.now(timezone.utc))
+            await self._switch(device_id, on)
+
+            next_due = next_change.timestamp()
+            return next_due if resync is None else min(next_due, resync)
+
+        return run
+
+    def set_light_schedule(self, device_id: str, on_time: str, off_time: str):
+        start, stop = _parse_hhmm(on_time), _parse_hhmm(off_time)
+        if start is None or stop is None:
+            raise ValueError("on_time/off_time must be HH:MM")
+        self.timers.schedule(f"light:{device_id}", time.time(), self._light_job(device_id, start, stop))
+
+    def refresh_global_schedule(self):
+        """
+        Re-evaluate the system_config light schedule now (after a local edit).
+        """
+        if self.timers is not None:
+            self.timers.schedule(f"light:{LIGHT_DEVICE_ID}", time.time(), self._light_job(LIGHT_DEVICE_ID))
+
+    # -----------------------------
+    # CLOSED-LOOP DOSING
+    # -----------------------------
+
+    async def _dose(self, pump_id: str, reason: str):
+        async def pump_off():
+            try:
+                await self._switch(pump_id, False)
+            except Exception:
+                logger.exception("Failed to switch off %s, retrying", pump_id)
+                return time.time() + PUMP_OFF_RETRY_SECONDS
+            return None
+
+        # Armed first: whatever fails below, the pump is switched off again
+        self.timers.schedule(f"dose-off:{pump_id}", time.time() + DOSING_PULSE_SECONDS, pump_off)
+        await self._switch(pump_id, True)
+
+        await run_in_threadpool(db.collection("nutrient_events").add, {
+            "nutrient_ml": DOSING_PULSE_ML,
+            "source": f"auto:{reason}",
+            "timestamp": datetime.now(timezone.utc),
+        })
+
+    async def _dosing_tick(self):
+        settings = await run_in_threadpool(_read_settings)
+        latest = await run_in_threadpool(_latest_reading)
+        next_due = time.time() + DOSING_INTERVAL_SECONDS
+        if not latest:
+            return next_due
+
+        age = _reading_age_seconds(latest)
+        if age is None or age > DOSING_MAX_READING_AGE_SECONDS:
+            logger.warning("Skipping dosing: latest reading is %s old",
+                           "of unknown age" if age is None else f"{age:.0f}s")
+            return next_due
+
+        ph, ec = latest.get("ph"), latest.get("ec")
+        target_ph, target_ec = settings.get("target_ph"), settings.get("target_ec")
+
+        # One corrective pulse per tick; the next tick sees its effect
+        if ec is not None and target_ec is not None and ec < target_ec - EC_DEADBAND:
+            await self._dose(NUTRIENT_PUMP_ID, "ec_low")
+        elif ph is not None and target_ph is not None and ph > target_ph + PH_DEADBAND:
+            await self._dose(PH_DOWN_PUMP_ID, "ph_high")
+        elif ph is not None and target_ph is not None and ph < target_ph - PH_DEADBAND:
+            await self._dose(PH_UP_PUMP_ID, "ph_low")
+
+        return next_due
+
+    # -----------------------------
+    # LIFECYCLE
+    # -----------------------------
+
+    async def start(self):
+        if not AUTOMATION_ENABLED or self.timers is not None or self._standby is not None:
+            return
+
+        if not self._acquire_leadership():
+            logger.info("Automation runs in another worker, standing by")
+            self._standby = asyncio.create_task(self._wait_for_leadership())
+            return
+
+        await self._start_engine()
+
+    def _acquire_leadership(self) -> bool:
+        if fcntl is None:
+            logger.warning("No fcntl: automation runs without leader election (single worker only)")
+            return True
+        handle = open(AUTOMATION_LOCK_PATH, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        # Held until stop() or process exit (the OS releases it)
+        self._lock_file = handle
+        return True
+
+    async def _wait_for_leadership(self):
+        while not self._acquire_leadership():
+            await asyncio.sleep(LEADER_RETRY_SECONDS)
+        logger.info("Automation leadership acquired")
+        await self._start_engine()
+
+    async def _start_engine(self):
+        self.timers = TimerHeap()
+        self.timers.start()
+
+        self.refresh_global_schedule()
+
+        try:
+            docs = await run_in_threadpool(lambda: list(db.collection("automation_schedules").stream()))
+            for d in docs:
+                row = d.to_dict() or {}
+                try:
+                    self.set_light_schedule(d.id, row.get("on_time"), row.get("off_time"))
+                except ValueError:
+                    logger.warning("Skipping invalid automation schedule %s", d.id)
+        except Exception:
+            logger.exception("Failed to load automation_schedules")
+
+        if DOSING_ENABLED:
+            self.timers.schedule("dosing", time.time(), self._dosing_tick)
+
+    async def stop(self):
+        if self._standby is not None:
+            self._standby.cancel()
+            try:
+                await self._standby
+            except asyncio.CancelledError:
+                pass
+            self._standby = None
+        if self.timers is not None:
+            await self.timers.stop()
+            self.timers = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def status(self) -> dict:
+        return {
+            "enabled": AUTOMATION_ENABLED,
+            "dosing_enabled": DOSING_ENABLED,
+            "leader": self.timers is not None,
+            **(self.timers.status() if self.timers is not None else {}),
+        }
+
+
+def _reading_age_seconds(reading: dict) -> float | None:
+    timestamp = reading.get("timestamp")
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+        except ValueError:
+            return None
+    if not isinstance(timestamp, datetime):
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - timestamp).total_seconds()
+
+
+def _latest_reading() -> dict | None:
+    docs = (
+        db.collection("sensors")
+        .order_by("timestamp", direction=DESCENDING)
+        .limit(1)
+        .stream()
+    )
+    doc = next(docs, None)
+    return doc.to_dict() if doc else None
+
+
+automation_engine = AutomationEngine()
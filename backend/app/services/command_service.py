@@ -0,0 +1,292 @@
+"""
+COMMAND SERVICE
+---------------
+Push channel for device control commands.
+
+Devices keep a WebSocket open (see control.py); when a control change is
+issued it is delivered immediately instead of waiting for the device to
+poll Firestore.
+
+Responsibilities:
+- Keep a per-device queue of pending (unacknowledged) commands; devices
+  are keyed by (site_id, device_id), since device ids only need to be
+  unique within a site
+- Deliver new commands to connected devices at once
+- Re-deliver unacknowledged commands (retries) and flush the queue on reconnect
+- Expire commands after too many attempts
+- Track delivery/ack counters and command-to-ack latency
+
+All state lives on the event loop thread, so no locks are needed.
+The controls collection stays the source of truth; this is the fast path.
+
+Several workers: a device's socket is held by whichever worker it
+connected to, so the hubs talk over the invalidation bus
+(invalidation_service). Pending queues stay with the worker that issued
+the command (it retries and expires them):
+- connects/disconnects are announced, so every hub knows which devices
+  are online elsewhere; a connect also closes an older socket for the
+  device on another worker and makes the issuers flush their queues
+- a command for a device without a local socket goes on the bus; the
+  worker holding the socket delivers it
+- an ack for a command issued elsewhere goes back the same way
+Cross-worker delivery adds up to two bus poll intervals.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+import functools
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timezone
+
+from app.services.invalidation_service import invalidation_bus
+
+COMMAND_ACK_TIMEOUT_SECONDS = float(os.getenv("COMMAND_ACK_TIMEOUT_SECONDS", "2"))
+COMMAND_MAX_ATTEMPTS = int(os.getenv("COMMAND_MAX_ATTEMPTS", "5"))
+COMMAND_RETRY_SCAN_SECONDS = float(os.getenv("COMMAND_RETRY_SCAN_SECONDS", "0.5"))
+COMMAND_QUEUE_LIMIT = int(os.getenv("COMMAND_QUEUE_LIMIT", "50"))
+
+logger = logging.getLogger(__name__)
+
+
+class CommandHub:
+
+    def __init__(self):
+        self._pending: dict[tuple[str, str], OrderedDict] = defaultdict(OrderedDict)
+        self._sockets: dict[tuple[str, str], object] = {}
+        self._remote: set[tuple[str, str]] = set()      # devices connected to another worker
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._ack_latencies = deque(maxlen=1000)
+        self.stats = {"issued": 0, "delivered": 0, "forwarded": 0, "acked": 0, "retried": 0,
+                      "expired": 0, "dropped": 0}
+
+    # -----------------------------
+    # CONNECTIONS
+    # -----------------------------
+
+    async def connect(self, site_id: str, device_id: str, websocket):
+        """
+        Registers a device socket (replacing an older one) and flushes
+        everything still pending for it.
+        """
+        device = (site_id, device_id)
+        old = self._sockets.get(device)
+        self._sockets[device] = websocket
+        if old is not None and old is not websocket:
+            try:
+                await old.close(code=1012)
+            except Exception:
+                pass
+
+        self._remote.discard(device)
+        invalidation_bus.send_message("device_connected", self._address(device))
+
+        for command in list(self._pending[device].values()):
+            await self._send(device, command)
+
+    def disconnect(self, site_id: str, device_id: str, websocket):
+        device = (site_id, device_id)
+        if self._sockets.get(device) is websocket:
+            del self._sockets[device]
+            invalidation_bus.send_message("device_disconnected", self._address(device))
+
+    def is_connected(self, site_id: str, device_id: str) -> bool:
+        device = (site_id, device_id)
+        return device in self._sockets or device in self._remote
+
+    # -----------------------------
+    # COMMANDS
+    # -----------------------------
+
+    async def issue(self, site_id: str, device_id: str, status: bool) -> dict:
+        """
+        Queues a command and pushes it right away if the device is online.
+        """
+        device = (site_id, device_id)
+        command = {
+            "id": uuid.uuid4().hex,
+            "site_id": site_id,
+            "device_id": device_id,
+            "status": status,
+            "issued_at": datetime.now(timezone.utc).isoformat(),
+            "attempts": 0,
+            "_issued_mono": time.monotonic(),
+            "_sent_mono": None,
+        }
+        queue = self._pending[device]
+        queue[command["id"]] = command
+        self.stats["issued"] += 1
+
+        # Bound memory for devices that stay offline: oldest commands go first
+        while len(queue) > COMMAND_QUEUE_LIMIT:
+            queue.popitem(last=False)
+            self.stats["dropped"] += 1
+
+        await self._send(device, command)
+        return self._public(command)
+
+    def ack(self, site_id: str, device_id: str, command_id: str) -> bool:
+        """
+        Acknowledges a command; one issued by another worker is passed on
+        to it. True when it was pending here.
+        """
+        device = (site_id, device_id)
+        if self._ack_local(device, command_id):
+            return True
+        invalidation_bus.send_message("ack", {**self._address(device), "id": command_id})
+        return False
+
+    def _ack_local(self, device: tuple[str, str], command_id: str) -> bool:
+        command = self._pending.get(device, {}).pop(command_id, None)
+        if command is None:
+            return False
+
+        self.stats["acked"] += 1
+        self._ack_latencies.append(time.monotonic() - command["_issued_mono"])
+        return True
+
+    def pending(self, site_id: str, device_id: str) -> list[dict]:
+        return [self._public(c) for c in self._pending.get((site_id, device_id), {}).values()]
+
+    async def _send(self, device: tuple[str, str], command: dict):
+        websocket = self._sockets.get(device)
+        if websocket is None:
+            # The worker holding the socket (if any) delivers it; attempts
+            # only count for a device known to be connected there
+            if device in self._remote:
+                command["attempts"] += 1
+                command["_sent_mono"] = time.monotonic()
+            if invalidation_bus.send_message("command", {**self._address(device), "command": self._public(command)}):
+                self.stats["forwarded"] += 1
+            return
+
+        command["attempts"] += 1
+        command["_sent_mono"] = time.monotonic()
+        try:
+            await websocket.send_json({"type": "command", **self._public(command)})
+            self.stats["delivered"] += 1
+        except Exception:
+            # Socket is gone; the command stays pending for the next connect
+            self.disconnect(*device, websocket)
+
+    @staticmethod
+    def _public(command: dict) -> dict:
+        return {k: v for k, v in command.items() if not k.startswith("_")}
+
+    @staticmethod
+    def _address(device: tuple[str, str]) -> dict:
+        return {"site_id": device[0], "device_id": device[1]}
+
+    # -----------------------------
+    # OTHER WORKERS (bus thread -> event loop)
+    # -----------------------------
+
+    def _from_bus(self, kind: str, payload: dict):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._on_remote(kind, payload), self._loop)
+
+    async def _on_remote(self, kind: str, payload: dict):
+        device = (payload["site_id"], payload["device_id"])
+
+        if kind == "device_connected":
+            self._remote.add(device)
+            # The device moved: drop our socket (without announcing a disconnect)
+            old = self._sockets.pop(device, None)
+            if old is not None:
+                try:
+                    await old.close(code=1012)
+                except Exception:
+                    pass
+            for command in list(self._pending.get(device, {}).values()):
+                await self._send(device, command)
+
+        elif kind == "device_disconnected":
+            self._remote.discard(device)
+
+        elif kind == "command":
+            websocket = self._sockets.get(device)
+            if websocket is None:
+                return
+            try:
+                await websocket.send_json({"type": "command", **payload["command"]})
+                self.stats["delivered"] += 1
+            except Exception:
+                self.disconnect(*device, websocket)
+
+        elif kind == "ack":
+            self._ack_local(device, payload["id"])
+
+    # -----------------------------
+    # RETRY LOOP
+    # -----------------------------
+
+    async def _retry_loop(self):
+        while True:
+            await asyncio.sleep(COMMAND_RETRY_SCAN_SECONDS)
+            try:
+                await self._retry_due()
+            except Exception:
+                logger.exception("Command retry scan failed")
+
+    async def _retry_due(self):
+        now = time.monotonic()
+        for device, queue in list(self._pending.items()):
+            if not queue:
+                continue
+            for command in list(queue.values()):
+                sent = command["_sent_mono"]
+                if sent is None or now - sent < COMMAND_ACK_TIMEOUT_SECONDS:
+                    continue
+
+                if command["attempts"] >= COMMAND_MAX_ATTEMPTS:
+                    queue.pop(command["id"], None)
+                    self.stats["expired"] += 1
+                    logger.warning("Command %s to %s/%s expired unacknowledged", command["id"], *device)
+                elif self.is_connected(*device):
+                    self.stats["retried"] += 1
+                    await self._send(device, command)
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._retry_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._loop = None
+
+    # -----------------------------
+    # METRICS
+    # -----------------------------
+
+    def status(self) -> dict:
+        latencies = sorted(self._ack_latencies)
+
+        def pct(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            **self.stats,
+            "connected_devices": len(self._sockets),
+            "remote_devices": len(self._remote),
+            "pending_commands": sum(len(q) for q in self._pending.values()),
+            "ack_latency_ms_p50": pct(0.50),
+            "ack_latency_ms_p95": pct(0.95),
+        }
+
+
+command_hub = CommandHub()
+
+for _kind in ("device_connected", "device_disconnected", "command", "ack"):
+    invalidation_bus.on_message(_kind, functools.partial(command_hub._from_bus, _kind))
@@ -0,0 +1,77 @@
+"""
+CONTROL SERVICE
+---------------
+Single place that changes an actuator state, used by the control router
+and by the automation engine.
+
+Applying a control:
+1. Write controls/{device_id} of the site in Firestore (source of truth)
+2. Merge it into the in-memory mirror (read-your-writes; default site)
+3. Push a command to the device over the command channel
+
+apply_controls does the same for many devices with one atomic
+batched write (scenes / whole-zone switching).
+"""
+
+from datetime import datetime, timezone
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.firebase_service import db
+from app.services.mirror_service import controls_mirror
+from app.services.command_service import command_hub
+from app.services.site_service import DEFAULT_SITE_ID, site_collection
+
+
+async def apply_control(device_id: str, status: bool, source: str = "manual",
+                        site_id: str = DEFAULT_SITE_ID) -> dict:
+    """
+    Returns the issued command (id, attempts, ...).
+    """
+    fields = {
+        "status": status,
+        "last_updated": datetime.now(timezone.utc),
+        "source": source
+    }
+
+    await run_in_threadpool(
+        db.collection(site_collection("controls", site_id)).document(device_id).set, fields, merge=True
+    )
+    if site_id == DEFAULT_SITE_ID:
+        controls_mirror.merge(device_id, fields)
+
+    return await command_hub.issue(site_id, device_id, status)
+
+
+# Firestore batched writes hold at most 500 operations
+MAX_BULK_CONTROLS = 500
+
+
+async def apply_controls(changes: list[tuple[str, bool]], source: str = "manual",
+                         site_id: str = DEFAULT_SITE_ID) -> list[dict]:
+    """
+    Applies all (device_id, status) changes atomically: either every
+    controls document is written or none is (the batch commit raises).
+    Returns the issued command per change, in input order.
+    """
+    if len(changes) > MAX_BULK_CONTROLS:
+        raise ValueError(f"At most {MAX_BULK_CONTROLS} controls per request")
+
+    now = datetime.now(timezone.utc)
+    controls = db.collection(site_collection("controls", site_id))
+    batch = db.batch()
+    for device_id, status in changes:
+        batch.set(
+            controls.document(device_id),
+            {"status": status, "last_updated": now, "source": source},
+            merge=True
+        )
+
+    await run_in_threadpool(batch.commit)
+
+    issued = []
+    for device_id, status in changes:
+        if site_id == DEFAULT_SITE_ID:
+            controls_mirror.merge(device_id, {"status": status, "last_updated": now, "source": source})
+        issued.append(await command_hub.issue(site_id, device_id, status))
+    return issued
@@ -1,13 +1,37 @@
 # FILE: firebase_service.py
+#
+# Storage backend selection (STORAGE_BACKEND):
+# - "firestore" (default): Google Firestore via firebase_admin
+# - "sqlite": embedded local store (app/services/local_store.py),
+#   no Google credentials needed. SQLITE_PATH picks the file
+#   (":memory:" for a throwaway database).
+#
+# Either way, `db` exposes the same Firestore client API to the routers.
+# It is wrapped by InstrumentedClient so datastore operations are counted
+# and timed (see metrics_service.py).
+#
+# `db` is created lazily on first use (the app lifespan forces it at
+# startup), and firebase_admin is only imported for the Firestore backend,
+# so importing this module is cheap and cannot fail on bad credentials.
 import os
 import json
-import firebase_admin
-from firebase_admin import credentials, firestore
-from dotenv import load_dotenv
+import time
+
+from app.services.instrumented_client import InstrumentedClient, InstrumentedTransaction
+
+# Same values as firestore.Query.ASCENDING / DESCENDING (and local_store)
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+
+def storage_backend() -> str:
+    return os.getenv("STORAGE_BACKEND", "firestore").lower()
 
-load_dotenv()
 
 def initialize_firebase():
+    import firebase_admin
+    from firebase_admin import credentials
+
     if firebase_admin._apps:
         return
 
@@ -25,6 +49,52 @@ def initialize_firebase():
     cred = credentials.Certificate(firebase_key_path)
     firebase_admin.initialize_app(cred)
 
-initialize_firebase()
 
-db = firestore.client()
+def create_client():
+    backend = storage_backend()
+
+    if backend == "sqlite":
+        from app.services.local_store import LocalStore
+        return LocalStore(os.getenv("SQLITE_PATH", "greenhouse.db"))
+
+    if backend != "firestore":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND: {backend}")
+
+    from firebase_admin import firestore
+
+    initialize_firebase()
+    return firestore.client()
+
+
+def transactional(fn):
+    """
+    Backend-neutral firestore.transactional: works with a transaction
+    from either db.transaction() implementation.
+    """
+    def call(transaction, *args, **kwargs):
+        from app.services.local_store import LocalTransaction
+
+        # db.transaction() is instrumented: run the backend's transaction,
+        # hand fn the wrapper and report its writes once it is over
+        instrumented = transaction if isinstance(transaction, InstrumentedTransaction) else None
+        inner = transaction.raw if instrumented else transaction
+        body = instrumented.attempt(fn) if instrumented else fn
+
+        start = time.perf_counter()
+        error = False
+        try:
+            if isinstance(inner, LocalTransaction):
+                return inner.run(body, *args, **kwargs)
+            from firebase_admin import firestore
+            return firestore.transactional(body)(inner, *args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            if instrumented:
+                instrumented.finished(time.perf_counter() - start, error)
+
+    return call
+
+
+db = InstrumentedClient(create_client)
@@ -0,0 +1,139 @@
+"""
+HISTORY CACHE
+-------------
+Sliding-window cache for relative-range history queries ("last 24h").
+
+Per collection it keeps the ordered rows of the widest range (30d) in
+memory; narrower ranges are slices of it:
+- first request: one full read of the window
+- later requests: only documents at or after the high-water mark (the
+  newest timestamp held) are read; rows that slid out of the window are
+  evicted from the front
+- writers report timestamps with note_write(): a row older than the
+  high-water mark (a late reading, a backfilled event) cannot be seen by
+  an incremental read, so it forces a full re-read on the next request
+- a full re-read every HISTORY_CACHE_RESYNC_SECONDS also picks up what
+  nobody reported (edits, deletes, writes made elsewhere)
+
+Memory is bounded: a window holding more than HISTORY_CACHE_MAX_ROWS rows
+is not cached (served straight from the datastore instead).
+
+Returned rows are shared with the cache: treat them as read-only.
+"""
+
+import os
+import time
+import bisect
+import threading
+from datetime import datetime, timedelta, timezone
+
+from app.services.firebase_service import db, ASCENDING
+from app.utils.cache import register_cache
+
+RESYNC_SECONDS = float(os.getenv("HISTORY_CACHE_RESYNC_SECONDS", "300"))
+MAX_ROWS = int(os.getenv("HISTORY_CACHE_MAX_ROWS", "100000"))
+
+RANGE_SECONDS = {"24h": 24 * 3600, "7d": 7 * 24 * 3600, "30d": 30 * 24 * 3600}
+
+
+class WindowCache:
+
+    def __init__(self, collection: str, time_field: str, span_seconds: int = RANGE_SECONDS["30d"],
+                 name: str | None = None):
+        self.collection = collection
+        self.time_field = time_field
+        self.span_seconds = span_seconds
+        self._rows: list[dict] | None = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0          # served with an incremental read
+        self.misses = 0        # full window read
+        self.rows_read = 0
+        if name:
+            register_cache(name, self)
+
+    def _read(self, since: datetime) -> list[dict]:
+        query = (
+            db.collection(self.collection)
+            .where(self.time_field, ">=", since)
+            .order_by(self.time_field, direction=ASCENDING)
+        )
+        rows = []
+        for doc in query.stream():
+            row = doc.to_dict()
+            row["id"] = doc.id
+            rows.append(row)
+        self.rows_read += len(rows)
+        return rows
+
+    def _index(self, rows: list[dict], since: datetime) -> int:
+        return bisect.bisect_left(rows, since, key=lambda row: row[self.time_field])
+
+    def get(self, window_seconds: int) -> list[dict]:
+        """
+        Rows of the last `window_seconds`, oldest first.
+        """
+        now = datetime.now(timezone.utc)
+        start = now - timedelta(seconds=window_seconds)
+        if window_seconds > self.span_seconds:
+            return self._read(start)
+        span_start = now - timedelta(seconds=self.span_seconds)
+        field = self.time_field
+
+        with self._lock:
+            if self._rows is None or time.monotonic() - self._loaded_at > RESYNC_SECONDS:
+                self.misses += 1
+                rows = self._read(span_start)
+                if len(rows) > MAX_ROWS:
+                    self._rows = None
+                    return rows[self._index(rows, start):]
+                self._rows = rows
+                self._loaded_at = time.monotonic()
+            else:
+                self.hits += 1
+                rows = self._rows
+                if rows:
+                    # Re-read the newest timestamp too: other documents may share it
+                    mark = rows[-1][field]
+                    seen = set()
+                    for row in reversed(rows):
+                        if row[field] != mark:
+                            break
+                        seen.add(row["id"])
+                    rows.extend(r for r in self._read(mark) if r["id"] not in seen)
+                else:
+                    rows.extend(self._read(span_start))
+
+                if len(rows) > MAX_ROWS:
+                    self._rows = None
+                    return rows[self._index(rows, start):]
+
+            rows = self._rows
+            del rows[:self._index(rows, span_start)]
+            return rows[self._index(rows, start):]
+
+    def note_write(self, timestamp: datetime | None):
+        """
+        Called after writing a row with this timestamp. Rows behind the
+        high-water mark are invisible to incremental reads: drop the window.
+        """
+        if timestamp is None:
+            return
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        with self._lock:
+            rows = self._rows
+            if rows and timestamp < rows[-1][self.time_field]:
+                self._rows = None
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self._rows or ()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rows_read": self.rows_read,
+        }
@@ -0,0 +1,156 @@
+"""
+INGEST RATE SERVICE
+-------------------
+Token-bucket rate limiting for sensor ingest, at two levels:
+
+- device: the credential's subject plus the X-Device-Id header, when the
+  device sends one (a fleet sharing one credential gets a bucket per
+  device)
+- credential: every request made with the credential, whatever device id
+  it claims. Sized for a whole fleet; it is what limits clients that send
+  no device id, and rotating X-Device-Id cannot get around it
+
+Cost: one token from each applicable bucket per request, single reading or
+batch, so a device that batches its readings is never limited for it.
+Tokens are taken after the body validated: a rejected (422) request costs
+nothing.
+
+Config:
+- INGEST_RATE_PER_SECOND   refill rate per device (default 1.0)
+- INGEST_BURST             device bucket size (default 10)
+- INGEST_CREDENTIAL_RATE_PER_SECOND  refill rate per credential
+                           (default 500)
+- INGEST_CREDENTIAL_BURST  credential bucket size (default 5000)
+- INGEST_RATE_MAX_KEYS     keys kept in memory (default 100000)
+- INGEST_MAX_BATCH         readings per batch request (default 100)
+- INGEST_RATE_LIMIT_ALERTS create an "Ingest Rate" alert when a key keeps
+                           hitting its limit (default false), at most once
+                           per INGEST_RATE_ALERT_COOLDOWN seconds (600) and
+                           after INGEST_RATE_ALERT_AFTER rejections (10)
+
+Every response carries RateLimit-Limit / RateLimit-Remaining for the
+tightest bucket; once it is half used, or on rejection, X-Ingest-Hint
+tells the device to batch (and where). Rejections are 429 with
+Retry-After.
+"""
+
+import os
+import math
+import logging
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.alert_service import raise_ingest_rate_alert
+from app.services.metrics_service import INGEST_RATE_LIMITED
+from app.services.site_service import DEFAULT_SITE_ID
+from app.utils.cache import TTLCache
+from app.utils.rate_limit import TokenBucketLimiter
+
+logger = logging.getLogger(__name__)
+
+RATE_PER_SECOND = float(os.getenv("INGEST_RATE_PER_SECOND", "1.0"))
+BURST = float(os.getenv("INGEST_BURST", "10"))
+CREDENTIAL_RATE_PER_SECOND = float(os.getenv("INGEST_CREDENTIAL_RATE_PER_SECOND", "500"))
+CREDENTIAL_BURST = float(os.getenv("INGEST_CREDENTIAL_BURST", "5000"))
+MAX_KEYS = int(os.getenv("INGEST_RATE_MAX_KEYS", "100000"))
+MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "100"))
+
+ALERTS_ENABLED = os.getenv("INGEST_RATE_LIMIT_ALERTS", "false").lower() == "true"
+ALERT_COOLDOWN_SECONDS = float(os.getenv("INGEST_RATE_ALERT_COOLDOWN", "600"))
+ALERT_AFTER = int(os.getenv("INGEST_RATE_ALERT_AFTER", "10"))
+
+BATCH_PATH = "/api/sensor/batch"
+
+device_limiter = TokenBucketLimiter(RATE_PER_SECOND, BURST, max_keys=MAX_KEYS)
+credential_limiter = TokenBucketLimiter(CREDENTIAL_RATE_PER_SECOND, CREDENTIAL_BURST, max_keys=MAX_KEYS)
+
+# key -> rejections since the last alert; key -> True while cooling down
+_rejections = TTLCache(ttl_seconds=ALERT_COOLDOWN_SECONDS, max_entries=MAX_KEYS)
+_alerted = TTLCache(ttl_seconds=ALERT_COOLDOWN_SECONDS, max_entries=MAX_KEYS)
+
+
+def ingest_keys(user: dict, device_id: str | None) -> list[tuple[TokenBucketLimiter, str]]:
+    """
+    (limiter, key) pairs a request is charged to, device bucket first.
+    """
+    subject = str(user.get("sub") or "anonymous")
+    keys = [(credential_limiter, subject)]
+    if device_id:
+        keys.insert(0, (device_limiter, f"{subject}:{device_id[:128]}"))
+    return keys
+
+
+def _hint(limiter: TokenBucketLimiter) -> str:
+    return f'batch; url="{BATCH_PATH}"; max={MAX_BATCH}; min-interval={math.ceil(1 / limiter.rate)}'
+
+
+def _limit_description(limiter: TokenBucketLimiter) -> str:
+    return f"{limiter.rate:g}/s, burst {limiter.burst:g}"
+
+
+async def check_ingest_rate(user: dict, device_id: str | None, route: str, site_id: str = DEFAULT_SITE_ID) -> dict:
+    """
+    Takes one token from each of the request's buckets. Returns the
+    headers for a successful response, or raises HTTPException 429 (with
+    Retry-After) when a bucket is empty.
+    """
+    tightest = None
+    for limiter, key in ingest_keys(user, device_id):
+        allowed, remaining, retry_after = limiter.take(key)
+        headers = {
+            "RateLimit-Limit": f"{limiter.burst:g}",
+            "RateLimit-Remaining": str(int(remaining)),
+        }
+        if not allowed:
+            await _reject(limiter, key, route, headers, retry_after, site_id)
+        share = remaining / limiter.burst
+        if tightest is None or share < tightest[0]:
+            tightest = (share, limiter, headers)
+
+    share, limiter, headers = tightest
+    if share < 0.5:
+        headers["X-Ingest-Hint"] = _hint(limiter)
+    return headers
+
+
+async def _reject(limiter: TokenBucketLimiter, key: str, route: str, headers: dict, retry_after: float,
+                  site_id: str):
+    INGEST_RATE_LIMITED.labels(route).inc()
+    if _note_rejection(key):
+        await run_in_threadpool(_alert_rate_limited, key, limiter, site_id)
+
+    headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    headers["X-Ingest-Hint"] = _hint(limiter)
+    raise HTTPException(
+        status_code=429,
+        detail={
+            "message": f"Ingest rate limit exceeded ({_limit_description(limiter)})",
+            "retry_after": round(retry_after, 2),
+            "hint": f"Buffer readings and send them together to {BATCH_PATH} "
+                    f"(up to {MAX_BATCH} per request, one request costs one token)",
+        },
+        headers=headers,
+    )
+
+
+def _note_rejection(key: str) -> bool:
+    """
+    Counts a rejection; True when it should raise an alert now.
+    """
+    if not ALERTS_ENABLED or _alerted.get(key):
+        return False
+    count = (_rejections.get(key) or 0) + 1
+    if count < ALERT_AFTER:
+        _rejections.set(key, count)
+        return False
+    _rejections.invalidate(key)
+    _alerted.set(key, True)
+    return True
+
+
+def _alert_rate_limited(key: str, limiter: TokenBucketLimiter, site_id: str):
+    try:
+        raise_ingest_rate_alert(key, ALERT_AFTER, _limit_description(limiter), site_id)
+    except Exception:
+        logger.exception("Failed to record ingest rate alert for %s", key)
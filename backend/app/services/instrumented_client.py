@@ -0,0 +1,312 @@
+"""
+INSTRUMENTED CLIENT
+-------------------
+Transparent wrapper around the datastore client (`db`) that times every
+operation and reports it to registered hooks (metrics, tracing, ...).
+
+Each hook is called as:
+    hook(collection: str, op: str, docs: int, duration_s: float, error: bool)
+
+op is one of: get, get_all, query, count, set, create, update, delete,
+add, batch_commit, transaction_commit. Operations that raise are reported
+too, with error=True (a failed write may still have been applied).
+
+Transactions (db.transaction()) count their writes per collection like
+batches; firebase_service.transactional reports them once the
+transactional function has committed.
+
+Wrapped objects delegate every other attribute to the real client object,
+so the routers (and the Firestore / local store internals that read
+attributes such as _document_path) keep working unchanged.
+"""
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_hooks: list = []
+
+
+def add_datastore_hook(hook):
+    _hooks.append(hook)
+
+
+def _emit(collection: str, op: str, docs: int, duration: float, error: bool = False):
+    for hook in _hooks:
+        try:
+            hook(collection, op, docs, duration, error)
+        except Exception:
+            logger.exception("Datastore hook failed")
+
+
+def _timed(collection: str, op: str, count_docs, fn, *args, **kwargs):
+    """
+    fn(*args, **kwargs), reported with count_docs(result) documents
+    (0 when it raised).
+    """
+    start = time.perf_counter()
+    result = None
+    error = False
+    try:
+        result = fn(*args, **kwargs)
+        return result
+    except Exception:
+        error = True
+        raise
+    finally:
+        docs = 0 if error else count_docs(result)
+        _emit(collection, op, docs, time.perf_counter() - start, error)
+
+
+def _exists(snapshot) -> int:
+    return int(bool(getattr(snapshot, "exists", False)))
+
+
+def _unwrap(obj):
+    return obj._inner if isinstance(obj, _Proxy) else obj
+
+
+class _Proxy:
+
+    __slots__ = ("_inner", "_collection")
+
+    def __init__(self, inner, collection: str):
+        self._inner = inner
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+    def __eq__(self, other):
+        return self._inner == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._inner)
+
+
+class InstrumentedQuery(_Proxy):
+
+    __slots__ = ()
+
+    def _wrap(self, inner):
+        return InstrumentedQuery(inner, self._collection)
+
+    def where(self, *args, **kwargs):
+        return self._wrap(self._inner.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return self._wrap(self._inner.order_by(*args, **kwargs))
+
+    def limit(self, *args, **kwargs):
+        return self._wrap(self._inner.limit(*args, **kwargs))
+
+    def select(self, *args, **kwargs):
+        return self._wrap(self._inner.select(*args, **kwargs))
+
+    def start_after(self, *args, **kwargs):
+        return self._wrap(self._inner.start_after(*args, **kwargs))
+
+    def count(self, *args, **kwargs):
+        return InstrumentedAggregation(self._inner.count(*args, **kwargs), self._collection)
+
+    def sum(self, *args, **kwargs):
+        return InstrumentedAggregation(self._inner.sum(*args, **kwargs), self._collection)
+
+    def avg(self, *args, **kwargs):
+        return InstrumentedAggregation(self._inner.avg(*args, **kwargs), self._collection)
+
+    def stream(self, *args, **kwargs):
+        """
+        Timed until the caller has consumed the results.
+        """
+        start = time.perf_counter()
+        docs = 0
+        error = False
+        try:
+            for doc in self._inner.stream(*args, **kwargs):
+                docs += 1
+                yield doc
+        except Exception:
+            error = True
+            raise
+        finally:
+            _emit(self._collection, "query", docs, time.perf_counter() - start, error)
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+    # CollectionReference only
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self._inner.document(*args, **kwargs), self._collection)
+
+    def add(self, *args, **kwargs):
+        update_time, ref = _timed(self._collection, "add", lambda _: 1, self._inner.add, *args, **kwargs)
+        return update_time, InstrumentedDocument(ref, self._collection)
+
+
+class InstrumentedAggregation(_Proxy):
+
+    __slots__ = ()
+
+    def get(self, *args, **kwargs):
+        return _timed(self._collection, "count", lambda _: 0, self._inner.get, *args, **kwargs)
+
+
+class InstrumentedDocument(_Proxy):
+
+    __slots__ = ()
+
+    def _timed(self, op: str, fn, *args, **kwargs):
+        return _timed(self._collection, op, lambda _: 1, fn, *args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        if "transaction" in kwargs:
+            kwargs["transaction"] = _unwrap(kwargs["transaction"])
+        return _timed(self._collection, "get", _exists, self._inner.get, *args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self._timed("set", self._inner.set, *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._timed("create", self._inner.create, *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._timed("update", self._inner.update, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._timed("delete", self._inner.delete, *args, **kwargs)
+
+
+def _collection_path(reference) -> str:
+    # Full path ("sites/x/alerts"), not just the last segment (parent.id)
+    return reference.path.rsplit("/", 1)[0]
+
+
+class InstrumentedBatch(_Proxy):
+    """
+    Counts writes per collection; reported when committed.
+    """
+
+    __slots__ = ("_writes",)
+
+    def __init__(self, inner):
+        super().__init__(inner, "")
+        self._writes: dict[str, int] = {}
+
+    def _record(self, reference):
+        collection = getattr(reference, "_collection", None)
+        if not isinstance(collection, str):
+            collection = _collection_path(reference)
+        self._writes[collection] = self._writes.get(collection, 0) + 1
+
+    def set(self, reference, *args, **kwargs):
+        self._record(reference)
+        self._inner.set(_unwrap(reference), *args, **kwargs)
+        return self
+
+    def create(self, reference, *args, **kwargs):
+        self._record(reference)
+        self._inner.create(_unwrap(reference), *args, **kwargs)
+        return self
+
+    def update(self, reference, *args, **kwargs):
+        self._record(reference)
+        self._inner.update(_unwrap(reference), *args, **kwargs)
+        return self
+
+    def delete(self, reference, *args, **kwargs):
+        self._record(reference)
+        self._inner.delete(_unwrap(reference), *args, **kwargs)
+        return self
+
+    def commit(self, *args, **kwargs):
+        start = time.perf_counter()
+        error = False
+        try:
+            return self._inner.commit(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._report("batch_commit", time.perf_counter() - start, error)
+
+    def _report(self, op: str, duration: float, error: bool):
+        writes, self._writes = self._writes, {}
+        for collection, count in writes.items():
+            _emit(collection, op, count, duration, error)
+
+
+class InstrumentedTransaction(InstrumentedBatch):
+    """
+    Counts writes per collection like a batch; the transactional function
+    receives this wrapper and firebase_service.transactional reports the
+    writes after the commit (or failure).
+    """
+
+    __slots__ = ()
+
+    def attempt(self, fn):
+        """
+        fn(transaction, ...) as called by the backend's transaction runner,
+        which may retry it: each attempt starts from zero writes.
+        """
+        def body(_inner, *args, **kwargs):
+            self._writes = {}
+            return fn(self, *args, **kwargs)
+        return body
+
+    @property
+    def raw(self):
+        return self._inner
+
+    def finished(self, duration: float, error: bool):
+        self._report("transaction_commit", duration, error)
+
+
+class InstrumentedClient:
+    """
+    Wraps the client returned by `factory`, created on first use.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    @property
+    def raw(self):
+        """
+        The unwrapped client (for code that needs exact client types).
+        """
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def collection(self, name: str):
+        return InstrumentedQuery(self.raw.collection(name), name)
+
+    def batch(self):
+        return InstrumentedBatch(self.raw.batch())
+
+    def transaction(self, *args, **kwargs):
+        return InstrumentedTransaction(self.raw.transaction(*args, **kwargs))
+
+    def get_all(self, references, *args, **kwargs):
+        references = [_unwrap(r) for r in references]
+        collection = _collection_path(references[0]) if references else ""
+        if "transaction" in kwargs:
+            kwargs["transaction"] = _unwrap(kwargs["transaction"])
+        docs = _timed(
+            collection, "get_all", lambda docs: sum(1 for d in docs if d.exists),
+            lambda: list(self.raw.get_all(references, *args, **kwargs))
+        )
+        return iter(docs)
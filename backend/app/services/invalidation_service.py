@@ -0,0 +1,305 @@
+"""
+INVALIDATION SERVICE
+--------------------
+Cache coherence across worker processes (uvicorn --workers N).
+
+Every worker keeps its own in-memory state (collection versions behind
+ETags and VersionedCache, config mirrors, short-lived caches). Each write
+a worker makes through `db` is published on a bus; the other workers bump
+the collection's version and run the listeners registered for it with
+on_remote_change(), e.g. re-reading a config mirror.
+
+Bus backends (INVALIDATION_BUS):
+- memory  single process, nothing to publish (default with one worker)
+- sqlite  local stand-in for Redis: a shared SQLite file
+          (INVALIDATION_BUS_PATH, default invalidation_bus.db) that every
+          worker on the host appends to and polls; no extra service
+          (default when WEB_CONCURRENCY > 1)
+- redis   Redis pub/sub at REDIS_URL, for workers on several hosts
+          (requires the `redis` package)
+
+Publishes are coalesced: one message per INVALIDATION_POLL_MS (default
+100) carries every collection written meanwhile, so a busy ingest path
+costs at most a few messages per second. Messages from this worker are
+ignored on receipt.
+
+The bus also carries small typed messages between workers (send_message /
+on_message), e.g. the device command channel routing a command to the
+worker that holds the device's socket. They ride in the same coalesced
+message, so they arrive within about two poll intervals.
+
+A message that fails to send is kept (collections and typed messages go
+back into the queue) and retried with the next one; send_errors counts
+those failures.
+
+If the bus fails, the first message after it recovers invalidates
+everything (versions and listeners), since changes may have been missed.
+
+The default is one worker (Procfile). With several, the bus keeps caches
+coherent and routes device commands (command_service), and automation
+runs in one worker only (automation_service). The following stay per
+worker:
+- the presence index: each worker flushes the heartbeats it received, and
+  its online/offline view only covers those heartbeats
+- ingest token buckets: a device can get up to N x its limit if its
+  requests spread over N workers
+- the profiler's stored profiles, and /metrics (Prometheus counters and
+  cache/service gauges describe the worker that answered the scrape)
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+from app.services.instrumented_client import add_datastore_hook
+from app.services.version_service import bump, bump_all
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_BACKEND = "sqlite" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else "memory"
+BUS_BACKEND = os.getenv("INVALIDATION_BUS", _DEFAULT_BACKEND).lower()
+BUS_PATH = os.getenv("INVALIDATION_BUS_PATH", "invalidation_bus.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+POLL_SECONDS = float(os.getenv("INVALIDATION_POLL_MS", "100")) / 1000
+
+REDIS_CHANNEL = "greenhouse:invalidate"
+# SQLite bus rows older than this are trimmed (workers poll far more often)
+RETAIN_SECONDS = 60
+
+_WRITE_OPS = {"set", "create", "update", "delete", "add", "batch_commit", "transaction_commit"}
+
+
+# -----------------------------
+# TRANSPORTS
+# -----------------------------
+
+class _SqliteTransport:
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bus ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " origin TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " at REAL NOT NULL)"
+        )
+        # Only changes from now on matter: our caches start empty
+        self._last_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM bus").fetchone()[0]
+        self._trimmed_at = 0.0
+
+    def send(self, origin: str, payload: dict):
+        now = time.time()
+        self._conn.execute(
+            "INSERT INTO bus (origin, payload, at) VALUES (?, ?, ?)",
+            (origin, json.dumps(payload), now),
+        )
+        if now - self._trimmed_at > RETAIN_SECONDS:
+            self._trimmed_at = now
+            self._conn.execute("DELETE FROM bus WHERE at < ?", (now - RETAIN_SECONDS,))
+
+    def receive(self) -> list[tuple[str, dict]]:
+        rows = self._conn.execute(
+            "SELECT id, origin, payload FROM bus WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        if rows:
+            self._last_id = rows[-1][0]
+        return [(origin, json.loads(payload)) for _, origin, payload in rows]
+
+    def close(self):
+        self._conn.close()
+
+
+class _RedisTransport:
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only for INVALIDATION_BUS=redis
+
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(REDIS_CHANNEL)
+
+    def send(self, origin: str, payload: dict):
+        self._client.publish(REDIS_CHANNEL, json.dumps({"origin": origin, "payload": payload}))
+
+    def receive(self) -> list[tuple[str, dict]]:
+        messages = []
+        while (message := self._pubsub.get_message(timeout=0)) is not None:
+            data = json.loads(message["data"])
+            messages.append((data["origin"], data["payload"]))
+        return messages
+
+    def close(self):
+        self._pubsub.close()
+        self._client.close()
+
+
+# -----------------------------
+# BUS
+# -----------------------------
+
+class InvalidationBus:
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.origin = uuid.uuid4().hex
+        self._transport = None
+        self._pending: set[str] = set()
+        self._outbox: list[list] = []          # [kind, payload] typed messages
+        self._lock = threading.Lock()
+        self._listeners: dict[str, list] = {}
+        self._handlers: dict[str, list] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._failed = False
+        self.stats = {"published": 0, "received": 0, "errors": 0, "send_errors": 0, "resyncs": 0}
+
+    def on_remote_change(self, collection: str, callback):
+        """
+        callback() runs on the bus thread after another worker wrote to
+        `collection` (its version is already bumped by then).
+        """
+        self._listeners.setdefault(collection, []).append(callback)
+
+    def on_message(self, kind: str, callback):
+        """
+        callback(payload) runs on the bus thread for every `kind` message
+        sent by another worker.
+        """
+        self._handlers.setdefault(kind, []).append(callback)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def publish(self, collection: str):
+        if self._thread is None:
+            return
+        with self._lock:
+            self._pending.add(collection)
+
+    def send_message(self, kind: str, payload: dict) -> bool:
+        """
+        Queues a typed message for the other workers (JSON-serializable
+        payload). False when there is no bus (single worker).
+        """
+        if self._thread is None:
+            return False
+        with self._lock:
+            self._outbox.append([kind, payload])
+        return True
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            outbox, self._outbox = self._outbox, []
+        if not pending and not outbox:
+            return
+        try:
+            self._transport.send(self.origin, {"collections": sorted(pending), "messages": outbox})
+        except Exception:
+            # Keep them for the next attempt, ahead of anything queued since
+            with self._lock:
+                self._pending |= pending
+                self._outbox[:0] = outbox
+            self.stats["send_errors"] += 1
+            raise
+        self.stats["published"] += 1
+
+    def _deliver(self, collections):
+        for collection in collections:
+            bump(collection)
+        for collection in collections:
+            for callback in self._listeners.get(collection, ()):
+                try:
+                    callback()
+                except Exception:
+                    logger.exception("Invalidation listener for %s failed", collection)
+
+    def _run(self):
+        while not self._stop.wait(POLL_SECONDS):
+            try:
+                self._flush()
+                messages = self._transport.receive()
+            except Exception:
+                self.stats["errors"] += 1
+                if not self._failed:
+                    logger.exception("Invalidation bus (%s) failed", self.backend)
+                self._failed = True
+                continue
+
+            if self._failed:
+                # Messages may have been lost while the bus was down
+                self._failed = False
+                self.stats["resyncs"] += 1
+                bump_all()
+                self._deliver(list(self._listeners))
+                logger.warning("Invalidation bus (%s) recovered, caches invalidated", self.backend)
+
+            for origin, payload in messages:
+                if origin == self.origin:
+                    continue
+                self.stats["received"] += 1
+                self._deliver(payload["collections"])
+                self._dispatch(payload["messages"])
+
+    def _dispatch(self, messages):
+        for kind, payload in messages:
+            for callback in self._handlers.get(kind, ()):
+                try:
+                    callback(payload)
+                except Exception:
+                    logger.exception("Bus handler for %s failed", kind)
+
+    def start(self):
+        if self._thread is not None or self.backend == "memory":
+            return
+        if self.backend == "sqlite":
+            self._transport = _SqliteTransport(BUS_PATH)
+        elif self.backend == "redis":
+            self._transport = _RedisTransport(REDIS_URL)
+        else:
+            raise RuntimeError(f"Unknown INVALIDATION_BUS: {self.backend}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout=POLL_SECONDS * 10)
+        try:
+            self._flush()
+        except Exception:
+            pass
+        self._transport.close()
+        self._transport = None
+
+    def status(self) -> dict:
+        return {
+            "backend": self.backend,
+            "running": self._thread is not None,
+            "healthy": not self._failed,
+            **self.stats,
+        }
+
+
+invalidation_bus = InvalidationBus(BUS_BACKEND)
+on_remote_change = invalidation_bus.on_remote_change
+
+
+def _on_datastore_op(collection: str, op: str, docs: int, duration: float, error: bool):
+    # Failed writes publish too: they may have been applied before the error
+    if op in _WRITE_OPS:
+        invalidation_bus.publish(collection)
+
+
+add_datastore_hook(_on_datastore_op)
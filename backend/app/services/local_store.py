@@ -0,0 +1,631 @@
+"""
+LOCAL STORE
+-----------
+Embedded SQLite storage backend exposing the subset of the Firestore
+client API this app uses. Selected with STORAGE_BACKEND=sqlite
+(see firebase_service.py); every router keeps using `db` unchanged.
+
+Why?
+- Run the API, benchmarks and load tests locally without Google credentials
+- Time-series reads (sensor/growth/nutrient history) become indexed SQL
+  range scans, and count/sum/avg aggregations run in SQL
+
+Storage model:
+- One table: docs(collection, id, data JSON)
+- Expression indexes on json_extract(data, '$."<field>"') for the fields
+  routers filter/order on (timestamp, changed_at, email, ...)
+- Datetimes are stored as fixed-width UTC strings, so SQL comparisons and
+  ORDER BY behave like Firestore timestamps
+
+Supported API:
+- collection(), document(), get_all(), batch(), transaction()
+- Query: where (==, !=, <, <=, >, >=, in), order_by, limit, select,
+  start_after, stream/get, count/sum/avg, on_snapshot
+- DocumentReference: get, set (merge), create, update, delete, on_snapshot
+"""
+
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+# Fields that get an expression index (per collection)
+INDEXED_FIELDS = ("timestamp", "changed_at", "email", "username", "token_hash", "owner_id", "status")
+
+_DT_PREFIX = "\u0001dt:"
+_OPS = {"==": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+try:
+    # Same exception types as the Firestore client, so callers catch either backend
+    from google.api_core.exceptions import NotFound as _NotFoundBase, AlreadyExists as _AlreadyExistsBase
+except ImportError:
+    _NotFoundBase = _AlreadyExistsBase = Exception
+
+
+class NotFound(_NotFoundBase):
+    pass
+
+
+class AlreadyExists(_AlreadyExistsBase):
+    pass
+
+
+# -----------------------------
+# VALUE ENCODING
+# -----------------------------
+
+def _encode(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            # Firestore treats naive datetimes as UTC
+            value = value.replace(tzinfo=timezone.utc)
+        return _DT_PREFIX + value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, str) and value.startswith(_DT_PREFIX):
+        return datetime.strptime(value[len(_DT_PREFIX):], "%Y-%m-%dT%H:%M:%S.%f").replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _json_path(field: str) -> str:
+    parts = field.split(".")
+    return "$" + "".join('."' + p.replace('"', '""') + '"' for p in parts)
+
+
+def _field_sql(field: str) -> str:
+    if field == "__name__":
+        return "id"
+    # Inlined literal (not a bound parameter) so expression indexes apply
+    return "json_extract(data, '" + _json_path(field).replace("'", "''") + "')"
+
+
+def _param(value):
+    if isinstance(value, DocumentReference):
+        return value.id
+    return _encode(value)
+
+
+def _merge(base: dict, updates: dict) -> dict:
+    out = dict(base)
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(out.get(key), dict):
+            out[key] = _merge(out[key], value)
+        else:
+            out[key] = value
+    return out
+
+
+def _apply_field_paths(base: dict, updates: dict) -> dict:
+    """
+    update() semantics: "a.b" addresses nested fields.
+    """
+    out = json.loads(json.dumps(base))
+    for path, value in updates.items():
+        target = out
+        parts = path.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return out
+
+
+# -----------------------------
+# SNAPSHOTS / REFERENCES
+# -----------------------------
+
+class DocumentSnapshot:
+
+    def __init__(self, reference, data: dict | None, read_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.read_time = read_time
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        return _decode(self._data)
+
+    def get(self, field: str):
+        value = self.to_dict() or {}
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+
+
+class DocumentReference:
+
+    def __init__(self, store, collection: str, doc_id: str):
+        self._store = store
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection}/{self.id}"
+
+    @property
+    def parent(self):
+        return CollectionReference(self._store, self._collection)
+
+    def get(self, field_paths=None, transaction=None):
+        return self._store._get(self, transaction)
+
+    def set(self, data: dict, merge: bool = False):
+        batch = self._store.batch()
+        batch.set(self, data, merge=merge)
+        batch.commit()
+
+    def create(self, data: dict):
+        batch = self._store.batch()
+        batch.create(self, data)
+        batch.commit()
+
+    def update(self, data: dict):
+        batch = self._store.batch()
+        batch.update(self, data)
+        batch.commit()
+
+    def delete(self):
+        batch = self._store.batch()
+        batch.delete(self)
+        batch.commit()
+
+    def on_snapshot(self, callback):
+        return self._store._listen(("doc", self._collection, self.id), callback)
+
+
+class AggregationResult:
+
+    def __init__(self, alias: str, value):
+        self.alias = alias
+        self.value = value
+
+
+class AggregationQuery:
+
+    def __init__(self, query, aggregations: list):
+        self._query = query
+        self._aggregations = aggregations
+
+    def _with(self, kind, field, alias):
+        return AggregationQuery(self._query, self._aggregations + [(kind, field, alias)])
+
+    def count(self, alias=None):
+        return self._with("COUNT", None, alias)
+
+    def sum(self, field, alias=None):
+        return self._with("SUM", field, alias)
+
+    def avg(self, field, alias=None):
+        return self._with("AVG", field, alias)
+
+    def get(self, transaction=None):
+        where_sql, params = self._query._where_sql()
+        columns = []
+        for kind, field, _ in self._aggregations:
+            if kind == "COUNT":
+                columns.append("COUNT(*)")
+            else:
+                columns.append(f"{kind}({_field_sql(field)})")
+        inner = f"SELECT id, data FROM docs WHERE {where_sql}"
+        if self._query._limit is not None:
+            inner += f" LIMIT {int(self._query._limit)}"
+        row = self._query._store._fetchone(f"SELECT {', '.join(columns)} FROM ({inner})", params)
+        results = []
+        for i, (kind, field, alias) in enumerate(self._aggregations):
+            value = row[i]
+            if kind == "SUM" and value is None:
+                value = 0
+            results.append(AggregationResult(alias or f"field_{i + 1}", value))
+        return [results]
+
+    stream = get
+
+
+class Query:
+
+    def __init__(self, store, collection: str):
+        self._store = store
+        self._collection = collection
+        self._filters: list = []
+        self._orders: list = []
+        self._limit: int | None = None
+        self._projection: list | None = None
+        self._start_after: list | None = None
+
+    def _copy(self, **changes):
+        q = Query(self._store, self._collection)
+        q._filters = list(self._filters)
+        q._orders = list(self._orders)
+        q._limit = self._limit
+        q._projection = self._projection
+        q._start_after = self._start_after
+        for key, value in changes.items():
+            setattr(q, key, value)
+        return q
+
+    # -----------------------------
+    # BUILDERS
+    # -----------------------------
+
+    def where(self, field: str, op: str, value):
+        if op not in _OPS and op != "in":
+            raise ValueError(f"Unsupported operator: {op}")
+        return self._copy(_filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field: str, direction: str = ASCENDING):
+        return self._copy(_orders=self._orders + [(field, direction)])
+
+    def limit(self, count: int):
+        return self._copy(_limit=count)
+
+    def select(self, field_paths):
+        return self._copy(_projection=list(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        cursor = document_fields_or_snapshot
+        if isinstance(cursor, DocumentSnapshot):
+            data = cursor.to_dict() or {}
+            values = [cursor.id if f == "__name__" else data.get(f) for f, _ in self._orders]
+        else:
+            values = [cursor[f] for f, _ in self._orders if f in cursor]
+        return self._copy(_start_after=values)
+
+    def count(self, alias=None):
+        return AggregationQuery(self, []).count(alias)
+
+    def sum(self, field, alias=None):
+        return AggregationQuery(self, []).sum(field, alias)
+
+    def avg(self, field, alias=None):
+        return AggregationQuery(self, []).avg(field, alias)
+
+    # -----------------------------
+    # SQL
+    # -----------------------------
+
+    def _where_sql(self):
+        clauses = ["collection = ?"]
+        params = [self._collection]
+
+        for field, op, value in self._filters:
+            column = _field_sql(field)
+            if op == "in":
+                values = list(value)
+                if not values:
+                    clauses.append("0")
+                    continue
+                clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+                params.extend(_param(v) for v in values)
+            elif value is None and op in ("==", "!="):
+                clauses.append(f"{column} IS {'NOT ' if op == '!=' else ''}NULL")
+            else:
+                clauses.append(f"{column} {_OPS[op]} ?")
+                params.append(_param(value))
+
+        # Firestore: ordering by a field excludes documents without it
+        for field, _ in self._orders:
+            if field != "__name__":
+                clauses.append(f"{_field_sql(field)} IS NOT NULL")
+
+        if self._start_after:
+            keyset, keyset_params = self._keyset_sql()
+            clauses.append(keyset)
+            params.extend(keyset_params)
+
+        return " AND ".join(clauses), params
+
+    def _keyset_sql(self):
+        """
+        (f1, f2, ...) strictly after the cursor, honouring each direction.
+        """
+        ors, params = [], []
+        orders = self._orders[:len(self._start_after)]
+        for i, (field, direction) in enumerate(orders):
+            ands = []
+            for prev_field, _ in orders[:i]:
+                ands.append(f"{_field_sql(prev_field)} = ?")
+            cmp = "<" if direction == DESCENDING else ">"
+            ands.append(f"{_field_sql(field)} {cmp} ?")
+            ors.append("(" + " AND ".join(ands) + ")")
+            params.extend(_param(v) for v in self._start_after[:i])
+            params.append(_param(self._start_after[i]))
+        return "(" + " OR ".join(ors) + ")", params
+
+    def _select_sql(self):
+        where_sql, params = self._where_sql()
+        sql = f"SELECT id, data FROM docs WHERE {where_sql}"
+        if self._orders:
+            parts = [
+                f"{_field_sql(f)} {'DESC' if d == DESCENDING else 'ASC'}" for f, d in self._orders
+            ]
+            sql += " ORDER BY " + ", ".join(parts)
+        if self._limit is not None:
+            sql += f" LIMIT {int(self._limit)}"
+        return sql, params
+
+    def stream(self, transaction=None):
+        sql, params = self._select_sql()
+        rows = self._store._fetchall(sql, params)
+        for doc_id, raw in rows:
+            data = json.loads(raw)
+            if self._projection is not None:
+                data = {k: v for k, v in data.items() if k in self._projection}
+            yield DocumentSnapshot(DocumentReference(self._store, self._collection, doc_id), data)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction))
+
+    def on_snapshot(self, callback):
+        return self._store._listen(("query", self), callback)
+
+
+class CollectionReference(Query):
+
+    @property
+    def id(self) -> str:
+        return self._collection
+
+    def document(self, document_id: str | None = None):
+        return DocumentReference(self._store, self._collection, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, data: dict, document_id: str | None = None):
+        ref = self.document(document_id)
+        ref.create(data)
+        return datetime.now(timezone.utc), ref
+
+
+# -----------------------------
+# WRITES
+# -----------------------------
+
+class WriteBatch:
+    """
+    Buffered writes applied atomically in one SQLite transaction.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._writes: list = []
+
+    def set(self, reference, document_data: dict, merge: bool = False):
+        self._writes.append(("set_merge" if merge else "set", reference, document_data))
+        return self
+
+    def create(self, reference, document_data: dict):
+        self._writes.append(("create", reference, document_data))
+        return self
+
+    def update(self, reference, field_updates: dict):
+        self._writes.append(("update", reference, field_updates))
+        return self
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference, None))
+        return self
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        self._store._commit(writes)
+        return []
+
+
+class LocalTransaction(WriteBatch):
+    """
+    Reads inside run() see a consistent view: the store lock is held
+    and SQLite is in an IMMEDIATE transaction until commit.
+    """
+
+    def run(self, fn, *args, **kwargs):
+        return self._store._run_transaction(self, fn, *args, **kwargs)
+
+
+def transactional(fn):
+    """
+    Local counterpart of firestore.transactional.
+    """
+    def call(transaction, *args, **kwargs):
+        return transaction.run(fn, *args, **kwargs)
+    return call
+
+
+class _Watch:
+
+    def __init__(self, store, key):
+        self._store = store
+        self._key = key
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._store._unlisten(self)
+
+
+# -----------------------------
+# STORE
+# -----------------------------
+
+class LocalStore:
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._listeners: list = []   # (watch, callback)
+        self._in_transaction = False
+
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                " collection TEXT NOT NULL,"
+                " id TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " PRIMARY KEY (collection, id))"
+            )
+            for field in INDEXED_FIELDS:
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_docs_{field} ON docs (collection, {_field_sql(field)})"
+                )
+
+    # Firestore client surface
+    def collection(self, name: str) -> CollectionReference:
+        return CollectionReference(self, name)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs) -> LocalTransaction:
+        return LocalTransaction(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for ref in references:
+            yield self._get(ref, transaction)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # -----------------------------
+    # INTERNALS
+    # -----------------------------
+
+    def _fetchall(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _fetchone(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def _get(self, ref: DocumentReference, transaction=None) -> DocumentSnapshot:
+        row = self._fetchone(
+            "SELECT data FROM docs WHERE collection = ? AND id = ?", (ref._collection, ref.id)
+        )
+        return DocumentSnapshot(ref, json.loads(row[0]) if row else None, datetime.now(timezone.utc))
+
+    def _apply(self, writes):
+        """
+        Applies writes on the open SQLite transaction; returns touched keys.
+        """
+        touched = []
+        for kind, ref, data in writes:
+            key = (ref._collection, ref.id)
+            row = self._conn.execute("SELECT data FROM docs WHERE collection = ? AND id = ?", key).fetchone()
+            current = json.loads(row[0]) if row else None
+
+            if kind == "delete":
+                self._conn.execute("DELETE FROM docs WHERE collection = ? AND id = ?", key)
+                touched.append(key)
+                continue
+
+            if kind == "create" and current is not None:
+                raise AlreadyExists(f"Document already exists: {ref.path}")
+            if kind == "update" and current is None:
+                raise NotFound(f"No document to update: {ref.path}")
+
+            encoded = _encode(data)
+            if kind == "set_merge" and current is not None:
+                new = _merge(current, encoded)
+            elif kind == "update":
+                new = _apply_field_paths(current, encoded)
+            else:
+                new = encoded
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO docs (collection, id, data) VALUES (?, ?, ?)",
+                (ref._collection, ref.id, json.dumps(new, separators=(",", ":")))
+            )
+            touched.append(key)
+        return touched
+
+    def _commit(self, writes):
+        if not writes:
+            return
+        with self._lock:
+            nested = self._in_transaction
+            if not nested:
+                self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                touched = self._apply(writes)
+                if not nested:
+                    self._conn.execute("COMMIT")
+            except Exception:
+                if not nested:
+                    self._conn.execute("ROLLBACK")
+                raise
+        self._notify(touched)
+
+    def _run_transaction(self, transaction: LocalTransaction, fn, *args, **kwargs):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._in_transaction = True
+            try:
+                result = fn(transaction, *args, **kwargs)
+                writes, transaction._writes = transaction._writes, []
+                touched = self._apply(writes)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._in_transaction = False
+        self._notify(touched)
+        return result
+
+    # -----------------------------
+    # LISTENERS (on_snapshot)
+    # -----------------------------
+
+    def _listen(self, key, callback):
+        watch = _Watch(self, key)
+        with self._lock:
+            self._listeners.append((watch, callback))
+        self._fire(watch, callback)
+        return watch
+
+    def _unlisten(self, watch):
+        with self._lock:
+            self._listeners = [(w, cb) for w, cb in self._listeners if w is not watch]
+
+    def _fire(self, watch, callback):
+        key = watch._key
+        now = datetime.now(timezone.utc)
+        if key[0] == "doc":
+            docs = [self._get(DocumentReference(self, key[1], key[2]))]
+        else:
+            docs = key[1].get()
+        callback(docs, [], now)
+
+    def _notify(self, touched):
+        if not self._listeners:
+            return
+        collections = {c for c, _ in touched}
+        for watch, callback in list(self._listeners):
+            key = watch._key
+            hit = (key[0] == "doc" and (key[1], key[2]) in touched) or \
+                  (key[0] == "query" and key[1]._collection in collections)
+            if hit and watch.is_active:
+                self._fire(watch, callback)
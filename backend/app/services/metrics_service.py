@@ -0,0 +1,248 @@
+"""
+METRICS SERVICE
+---------------
+Prometheus metrics for the API (scraped at GET /metrics).
+
+- HTTP: per-route latency histogram, labelled by method/route/status
+- Ingest: readings ingested, alert evaluations and alerts triggered
+- Datastore: per-collection operation counts, errors, documents and
+  durations, fed by the instrumented db client (instrumented_client.py)
+- Caches and background services: read at scrape time by a collector,
+  so the hot paths only bump plain counters
+"""
+
+import time
+
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+
+from app.services.instrumented_client import add_datastore_hook
+from app.services.startup_service import startup_status
+from app.utils.cache import all_caches
+
+# -----------------------------
+# HTTP
+# -----------------------------
+HTTP_LATENCY = Histogram(
+    "greenhouse_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+
+# -----------------------------
+# INGEST / ALERTS
+# -----------------------------
+READINGS_INGESTED = Counter(
+    "greenhouse_sensor_readings_ingested_total",
+    "Sensor readings accepted by the ingest endpoint",
+)
+INGEST_RATE_LIMITED = Counter(
+    "greenhouse_ingest_rate_limited_total",
+    "Ingest requests rejected by the per-device rate limiter",
+    ["route"],
+)
+ALERT_EVALUATIONS = Counter(
+    "greenhouse_alert_evaluations_total",
+    "Readings evaluated against alert thresholds",
+)
+ALERTS_TRIGGERED = Counter(
+    "greenhouse_alerts_triggered_total",
+    "Alerts created by threshold checks",
+    ["sensor_type"],
+)
+
+# -----------------------------
+# DATASTORE
+# -----------------------------
+DATASTORE_OPS = Counter(
+    "greenhouse_datastore_operations_total",
+    "Datastore operations by collection and type",
+    ["collection", "op"],
+)
+DATASTORE_DOCS = Counter(
+    "greenhouse_datastore_documents_total",
+    "Documents read or written by datastore operations",
+    ["collection", "op"],
+)
+DATASTORE_LATENCY = Histogram(
+    "greenhouse_datastore_operation_duration_seconds",
+    "Datastore operation duration",
+    ["collection", "op"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+DATASTORE_ERRORS = Counter(
+    "greenhouse_datastore_errors_total",
+    "Datastore operations that raised (timeouts, outages, missing documents)",
+    ["collection", "op"],
+)
+
+
+def _record_datastore_op(collection: str, op: str, docs: int, duration: float, error: bool):
+    # One label per collection, not per site partition (sites/{id}/sensors)
+    collection = collection.rsplit("/", 1)[-1]
+    DATASTORE_OPS.labels(collection, op).inc()
+    DATASTORE_DOCS.labels(collection, op).inc(docs)
+    DATASTORE_LATENCY.labels(collection, op).observe(duration)
+    if error:
+        DATASTORE_ERRORS.labels(collection, op).inc()
+
+
+add_datastore_hook(_record_datastore_op)
+
+
+# -----------------------------
+# CACHES + BACKGROUND SERVICES
+# -----------------------------
+
+class _ServiceCollector:
+    """
+    Reads counters that services already keep (no extra work per request).
+    """
+
+    def collect(self):
+        from app.services.mirror_service import controls_mirror, settings_mirror
+        from app.services.command_service import command_hub
+        from app.services.presence_service import presence_tracker
+        from app.services.automation_service import automation_engine
+
+        cache = CounterMetricFamily(
+            "greenhouse_cache_requests", "Cache lookups by result", labels=["cache", "result"]
+        )
+        for name, c in all_caches().items():
+            cache.add_metric([name, "hit"], c.hits)
+            cache.add_metric([name, "miss"], c.misses)
+        for mirror in (controls_mirror, settings_mirror):
+            cache.add_metric([f"mirror_{mirror.name}", "hit"], mirror.hits)
+            cache.add_metric([f"mirror_{mirror.name}", "miss"], mirror.misses)
+        yield cache
+
+        staleness = GaugeMetricFamily(
+            "greenhouse_mirror_staleness_seconds", "Seconds the replica may lag (-1 = never synced)",
+            labels=["mirror"]
+        )
+        for mirror in (controls_mirror, settings_mirror):
+            value = mirror.staleness_seconds()
+            staleness.add_metric([mirror.name], -1 if value is None else value)
+        yield staleness
+
+        commands = command_hub.status()
+        yield GaugeMetricFamily("greenhouse_command_connected_devices", "Devices on the command channel",
+                                value=commands["connected_devices"])
+        yield GaugeMetricFamily("greenhouse_command_pending", "Unacknowledged device commands",
+                                value=commands["pending_commands"])
+        events = CounterMetricFamily("greenhouse_command_events", "Command channel events", labels=["event"])
+        for event in ("issued", "delivered", "acked", "retried", "expired", "dropped"):
+            events.add_metric([event], commands[event])
+        yield events
+
+        presence = presence_tracker.status()
+        yield GaugeMetricFamily("greenhouse_presence_tracked_devices", "Devices with a recorded heartbeat",
+                                value=presence["tracked_devices"])
+        yield CounterMetricFamily("greenhouse_presence_heartbeats", "Device heartbeats received",
+                                  value=presence["heartbeats"])
+
+        from app.services.workload_service import workload_status
+
+        lanes = workload_status()
+        active = GaugeMetricFamily("greenhouse_workload_active", "Requests running per lane", labels=["lane"])
+        waiting = GaugeMetricFamily("greenhouse_workload_waiting", "Requests queued per lane", labels=["lane"])
+        shed = CounterMetricFamily("greenhouse_workload_shed", "Requests shed per lane", labels=["lane", "reason"])
+        for lane, s in lanes.items():
+            active.add_metric([lane], s["active"])
+            waiting.add_metric([lane], s["waiting"])
+            shed.add_metric([lane, "queue_full"], s["shed_queue_full"])
+            shed.add_metric([lane, "timeout"], s["shed_timeout"])
+        yield active
+        yield waiting
+        yield shed
+
+        from app.services.spool_service import ingest_spool
+
+        spool = ingest_spool.status()
+        yield GaugeMetricFamily("greenhouse_ingest_spool_pending", "Readings waiting in the local spool",
+                                value=spool["pending"])
+        yield GaugeMetricFamily("greenhouse_ingest_spool_lag_seconds", "Age of the oldest spooled reading",
+                                value=spool["lag_seconds"])
+        yield GaugeMetricFamily("greenhouse_ingest_spool_bytes", "Size of the spool file on disk",
+                                value=spool["bytes"])
+        yield GaugeMetricFamily("greenhouse_ingest_datastore_healthy", "1 while ingest writes go to the datastore",
+                                value=int(spool["healthy"]))
+        spooled = CounterMetricFamily("greenhouse_ingest_spool_events", "Ingest spool events", labels=["event"])
+        for event in ("direct", "spooled", "replayed", "write_failures", "replay_failures"):
+            spooled.add_metric([event], spool[event])
+        yield spooled
+
+        from app.services.invalidation_service import invalidation_bus
+
+        bus = invalidation_bus.status()
+        messages = CounterMetricFamily("greenhouse_invalidation_messages", "Cross-worker invalidation messages",
+                                       labels=["event"])
+        for event in ("published", "received", "errors", "resyncs"):
+            messages.add_metric([event], bus[event])
+        yield messages
+        yield GaugeMetricFamily("greenhouse_invalidation_bus_healthy", "0 while the invalidation bus is failing",
+                                value=int(bus["healthy"]))
+
+        startup = GaugeMetricFamily("greenhouse_startup_seconds", "Startup phase timings", labels=["phase"])
+        for phase, seconds in startup_status().items():
+            startup.add_metric([phase.removesuffix("_seconds")], seconds)
+        yield startup
+
+        automation = automation_engine.status()
+        if "scheduled_jobs" in automation:
+            yield GaugeMetricFamily("greenhouse_automation_jobs", "Scheduled automation jobs",
+                                    value=automation["scheduled_jobs"])
+            yield GaugeMetricFamily("greenhouse_automation_tick_lag_p95_ms", "p95 lag of automation ticks",
+                                    value=automation["p95_lag_ms"] or 0)
+
+
+REGISTRY.register(_ServiceCollector())
+
+
+# -----------------------------
+# MIDDLEWARE + EXPOSITION
+# -----------------------------
+
+def _route_template(scope) -> str:
+    """
+    Full route template of the matched endpoint. Routes of included routers
+    only know their own path; FastAPI keeps the prefixed one in its
+    effective route context.
+    """
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    if context is not None:
+        return context.path
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no per-request task overhead like BaseHTTPMiddleware).
+    Labels by route template (e.g. /api/devices/{device_id}) to keep
+    label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_LATENCY.labels(scope["method"], _route_template(scope), str(status)).observe(time.perf_counter() - start)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
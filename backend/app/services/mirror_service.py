@@ -0,0 +1,218 @@
+"""
+MIRROR SERVICE
+--------------
+Process-wide in-memory replica of small, hot Firestore data:
+- controls                (whole collection)
+- settings/system_config  (single document)
+
+Firestore on_snapshot listeners push every change (from any writer)
+into memory, so dashboard reads become dictionary lookups. Writes by
+other workers also trigger a re-read through the invalidation bus (the
+SQLite backend's listeners only see their own process).
+
+Responsibilities:
+- Start/stop listeners (called from the app lifespan)
+- Re-subscribe when a listener dies (reconnect supervisor)
+- Report staleness so a lagging replica is visible
+- Fall back to Firestore (return None) when the replica is not trustworthy
+"""
+
+import os
+import time
+import logging
+import threading
+
+from app.services.firebase_service import db
+from app.services.version_service import bump
+from app.services.invalidation_service import on_remote_change
+
+MIRROR_ENABLED = os.getenv("CONFIG_MIRROR_ENABLED", "true").lower() == "true"
+MIRROR_CHECK_SECONDS = float(os.getenv("CONFIG_MIRROR_CHECK_SECONDS", "5"))
+MIRROR_MAX_STALENESS_SECONDS = float(os.getenv("CONFIG_MIRROR_MAX_STALENESS_SECONDS", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotMirror:
+    """
+    Replica of one Firestore collection or document, keyed by document id.
+    """
+
+    def __init__(self, name: str, ref_factory):
+        self.name = name
+        self._ref_factory = ref_factory
+        self._lock = threading.Lock()
+        self._data: dict = {}
+        self._watch = None
+        self._healthy = False
+        self._synced_at: float | None = None  # monotonic time of last confirmed sync
+        self.snapshots = 0
+        self.reconnects = 0
+        self.hits = 0      # reads served from memory
+        self.misses = 0    # reads that fell back to Firestore
+
+    # -----------------------------
+    # LISTENER LIFECYCLE
+    # -----------------------------
+
+    def start(self):
+        # Some backends deliver the first snapshot synchronously,
+        # so subscribe before taking the lock
+        watch = self._ref_factory().on_snapshot(self._on_snapshot)
+        with self._lock:
+            self._watch = watch
+
+    def stop(self):
+        with self._lock:
+            watch, self._watch = self._watch, None
+            self._healthy = False
+        if watch is not None:
+            watch.unsubscribe()
+
+    def is_listening(self) -> bool:
+        watch = self._watch
+        return watch is not None and getattr(watch, "is_active", True)
+
+    def reconnect(self):
+        self.stop()
+        self.reconnects += 1
+        self.start()
+
+    def _on_snapshot(self, docs, changes, read_time):
+        # Snapshots always carry the full current result set,
+        # so rebuilding (copy-on-write) keeps reads lock-free.
+        data = {d.id: d.to_dict() or {} for d in docs if d.exists}
+        with self._lock:
+            self._data = data
+            self._healthy = True
+            self._synced_at = time.monotonic()
+            self.snapshots += 1
+        # Changes may come from other instances: invalidate ETags
+        bump(self.name)
+
+    def refresh(self):
+        """
+        Re-reads the replica (another worker reported a write).
+        """
+        if self._watch is None:
+            return
+        ref = self._ref_factory()
+        docs = list(ref.stream()) if hasattr(ref, "stream") else [ref.get()]
+        self._on_snapshot(docs, None, None)
+
+    def mark_unhealthy(self):
+        self._healthy = False
+
+    # -----------------------------
+    # READS / WRITE-THROUGH
+    # -----------------------------
+
+    def staleness_seconds(self) -> float | None:
+        """
+        0 while the listener is healthy, otherwise seconds since the
+        replica was last known to be in sync (None = never synced).
+        """
+        if self._synced_at is None:
+            return None
+        if self._healthy:
+            return 0.0
+        return time.monotonic() - self._synced_at
+
+    def snapshot(self) -> dict | None:
+        """
+        Returns a copy of the replica (callers may keep or change it),
+        or None when callers should read Firestore.
+        """
+        staleness = self.staleness_seconds()
+        if staleness is None or staleness > MIRROR_MAX_STALENESS_SECONDS:
+            self.misses += 1
+            return None
+        self.hits += 1
+        data = self._data
+        return {doc_id: dict(fields) for doc_id, fields in data.items()}
+
+    def merge(self, doc_id: str, fields: dict):
+        """
+        Applies our own successful write immediately (read-your-writes);
+        the listener will deliver the authoritative version shortly after.
+        """
+        with self._lock:
+            data = dict(self._data)
+            data[doc_id] = {**data.get(doc_id, {}), **fields}
+            self._data = data
+
+    def status(self) -> dict:
+        staleness = self.staleness_seconds()
+        return {
+            "listening": self.is_listening(),
+            "healthy": self._healthy,
+            "documents": len(self._data),
+            "staleness_seconds": None if staleness is None else round(staleness, 3),
+            "snapshots": self.snapshots,
+            "reconnects": self.reconnects,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+controls_mirror = SnapshotMirror("controls", lambda: db.collection("controls"))
+settings_mirror = SnapshotMirror(
+    "settings",
+    lambda: db.collection("settings").document("system_config")
+)
+
+_MIRRORS = [controls_mirror, settings_mirror]
+
+for _mirror in _MIRRORS:
+    on_remote_change(_mirror.name, _mirror.refresh)
+_stop_event = threading.Event()
+_supervisor: threading.Thread | None = None
+
+
+# -----------------------------
+# RECONNECT SUPERVISOR
+# -----------------------------
+
+def _supervise():
+    while not _stop_event.wait(MIRROR_CHECK_SECONDS):
+        for mirror in _MIRRORS:
+            if mirror.is_listening():
+                continue
+            mirror.mark_unhealthy()
+            try:
+                mirror.reconnect()
+                logger.warning("Mirror %s listener restarted", mirror.name)
+            except Exception:
+                logger.exception("Mirror %s reconnect failed", mirror.name)
+
+
+def start_mirrors():
+    global _supervisor
+    if not MIRROR_ENABLED or _supervisor is not None:
+        return
+
+    for mirror in _MIRRORS:
+        try:
+            mirror.start()
+        except Exception:
+            # Supervisor will retry; reads fall back to Firestore meanwhile
+            logger.exception("Mirror %s failed to start", mirror.name)
+
+    _stop_event.clear()
+    _supervisor = threading.Thread(target=_supervise, name="mirror-supervisor", daemon=True)
+    _supervisor.start()
+
+
+def stop_mirrors():
+    global _supervisor
+    _stop_event.set()
+    for mirror in _MIRRORS:
+        mirror.stop()
+    _supervisor = None
+
+
+def mirror_status() -> dict:
+    return {
+        "enabled": MIRROR_ENABLED,
+        **{mirror.name: mirror.status() for mirror in _MIRRORS},
+    }
@@ -0,0 +1,163 @@
+"""
+PRESENCE SERVICE
+----------------
+In-memory fleet presence index.
+
+Device heartbeats are recorded in a dict (O(1), no Firestore write).
+A background task periodically flushes the latest last_seen_at of every
+device that sent a heartbeat since the last flush, as batched writes to
+the devices collection. Many heartbeats per device collapse into one write.
+
+Online/offline is answered from memory:
+online = heartbeat seen within PRESENCE_TIMEOUT_SECONDS.
+
+Failed flushes: a batch that fails because a device document is missing
+is retried one document at a time (unknown ids are dropped); any other
+failure (timeout, outage) puts the devices back for the next flush.
+Devices silent for longer than the timeout are pruned from memory after
+their last write; callers then fall back to the stored last_seen_at.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from fastapi.concurrency import run_in_threadpool
+from google.api_core.exceptions import NotFound
+
+from app.services.firebase_service import db
+
+PRESENCE_TIMEOUT_SECONDS = float(os.getenv("PRESENCE_TIMEOUT_SECONDS", "120"))
+PRESENCE_FLUSH_SECONDS = float(os.getenv("PRESENCE_FLUSH_SECONDS", "30"))
+
+# Firestore batched writes hold at most 500 operations
+FLUSH_CHUNK = 500
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+
+    def __init__(self):
+        self._last_seen: dict[str, float] = {}   # device_id -> epoch seconds
+        self._dirty: set[str] = set()
+        self._task: asyncio.Task | None = None
+        self.stats = {"heartbeats": 0, "flushed_writes": 0, "flushes": 0, "flush_errors": 0}
+
+    def record(self, device_id: str, seen_at: float | None = None):
+        self._last_seen[device_id] = seen_at or time.time()
+        self._dirty.add(device_id)
+        self.stats["heartbeats"] += 1
+
+    def last_seen(self, device_id: str) -> float | None:
+        return self._last_seen.get(device_id)
+
+    def is_online(self, device_id: str, timeout: float | None = None, fallback: datetime | None = None) -> bool:
+        """
+        fallback: last_seen_at stored in Firestore, used for devices
+        that have not sent a heartbeat to this process yet.
+        """
+        seen = self._last_seen.get(device_id)
+        if seen is None and fallback is not None:
+            seen = fallback.timestamp()
+        if seen is None:
+            return False
+        return time.time() - seen <= (timeout or PRESENCE_TIMEOUT_SECONDS)
+
+    def snapshot(self, timeout: float | None = None) -> dict:
+        now = time.time()
+        limit = timeout or PRESENCE_TIMEOUT_SECONDS
+        online, offline = [], []
+        for device_id, seen in self._last_seen.items():
+            row = {"device_id": device_id, "last_seen_seconds_ago": round(now - seen, 1)}
+            (online if now - seen <= limit else offline).append(row)
+        return {"timeout_seconds": limit, "online": online, "offline": offline}
+
+    # -----------------------------
+    # COALESCED FLUSH
+    # -----------------------------
+
+    def flush(self):
+        """
+        Writes last_seen_at for every dirty device (blocking; run in a thread).
+        """
+        self._prune()
+        dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+
+        stamps = {}
+        for device_id in dirty:
+            seen = self._last_seen.get(device_id)
+            if seen is not None:
+                stamps[device_id] = datetime.fromtimestamp(seen, timezone.utc)
+
+        ids = list(stamps)
+        for i in range(0, len(ids), FLUSH_CHUNK):
+            chunk = ids[i:i + FLUSH_CHUNK]
+            batch = db.batch()
+            for device_id in chunk:
+                batch.update(db.collection("devices").document(device_id), {"last_seen_at": stamps[device_id]})
+            try:
+                batch.commit()
+                self.stats["flushed_writes"] += len(chunk)
+            except NotFound:
+                # update() fails the whole batch if one device doc is missing;
+                # retry individually so unknown ids do not block the rest
+                self._flush_individually(chunk, stamps)
+            except Exception as e:
+                self._retry_later(chunk)
+                logger.warning("Presence flush of %d devices failed, retrying: %r", len(chunk), e)
+
+        self.stats["flushes"] += 1
+
+    def _flush_individually(self, device_ids: list[str], stamps: dict):
+        for device_id in device_ids:
+            try:
+                db.collection("devices").document(device_id).update({"last_seen_at": stamps[device_id]})
+                self.stats["flushed_writes"] += 1
+            except NotFound:
+                self.stats["flush_errors"] += 1
+            except Exception:
+                self._retry_later([device_id])
+
+    def _retry_later(self, device_ids: list[str]):
+        self.stats["flush_errors"] += len(device_ids)
+        self._dirty.update(device_ids)
+
+    def _prune(self):
+        cutoff = time.time() - PRESENCE_TIMEOUT_SECONDS
+        for device_id, seen in list(self._last_seen.items()):
+            if seen < cutoff and device_id not in self._dirty:
+                self._last_seen.pop(device_id, None)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(PRESENCE_FLUSH_SECONDS)
+            try:
+                await run_in_threadpool(self.flush)
+            except Exception:
+                logger.exception("Presence flush failed")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Do not lose the last interval of heartbeats on shutdown
+        await run_in_threadpool(self.flush)
+
+    def status(self) -> dict:
+        return {**self.stats, "tracked_devices": len(self._last_seen), "pending_writes": len(self._dirty)}
+
+
+presence_tracker = PresenceTracker()
@@ -0,0 +1,225 @@
+"""
+PROFILER SERVICE
+----------------
+On-demand sampling profiler (stdlib only) for diagnosing a hot worker.
+
+A sampler thread reads every thread's Python stack (sys._current_frames)
+at a fixed interval and counts identical stacks. Output is the "folded"
+/ collapsed-stack format understood by flamegraph.pl, speedscope and
+most flamegraph viewers:
+
+    thread;module:function;module:function <samples>
+
+Two ways to use it (admin only):
+- Whole process for N seconds (GET /api/diagnostics/profile)
+- One request: send "X-Profile: 1" with an admin token; the response
+  carries X-Profile-Id, fetch the result from
+  GET /api/diagnostics/profiles/{id}. Only the threads that serve
+  requests are sampled (the event loop thread and the threadpool
+  workers), not background threads; Python cannot tell which request a
+  thread is working for, so requests running concurrently on those
+  threads show up too (the profile's "scope" says so).
+
+Nothing runs while idle: the sampler thread only exists during a
+profile, and requests without the header only pay a header lookup.
+One profile runs at a time.
+
+Config (env):
+- PROFILER_ENABLED             (default true)
+- PROFILER_MAX_SECONDS         (default 60)
+- PROFILER_DEFAULT_INTERVAL_MS (default 5)
+"""
+
+import os
+import sys
+import time
+import uuid
+import threading
+from collections import Counter, deque
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "true").lower() == "true"
+MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+DEFAULT_INTERVAL_MS = float(os.getenv("PROFILER_DEFAULT_INTERVAL_MS", "5"))
+MIN_INTERVAL_MS = 1.0
+
+# Leaf frames of threads that are parked, not working
+_IDLE_LEAVES = {
+    ("threading", "wait"),
+    ("threading", "_wait_for_tstate_lock"),
+    ("selectors", "select"),
+    ("queue", "get"),
+    ("socket", "accept"),
+}
+
+_RECENT_LIMIT = 20
+
+# Threads that run request code: the event loop and starlette's threadpool
+_THREADPOOL_THREAD = "AnyIO worker thread"
+REQUEST_PROFILE_SCOPE = "event loop + threadpool threads (includes concurrent requests)"
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval_ms: float = DEFAULT_INTERVAL_MS, include_idle: bool = False,
+                 thread_filter=None):
+        """
+        thread_filter(ident, name) -> bool picks the threads to sample
+        (default: all).
+        """
+        self.interval = max(MIN_INTERVAL_MS, interval_ms) / 1000
+        self.include_idle = include_idle
+        self.thread_filter = thread_filter
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if self.thread_filter is not None and not self.thread_filter(ident, names.get(ident, "")):
+                    continue
+                stack = self._fold(frame)
+                if stack is None:
+                    continue
+                self.stacks[f"{names.get(ident, ident)};{stack}"] += 1
+            self.samples += 1
+
+    def _fold(self, frame) -> str | None:
+        leaf = (frame.f_globals.get("__name__", "?").rsplit(".", 1)[-1], frame.f_code.co_name)
+        if not self.include_idle and leaf in _IDLE_LEAVES:
+            return None
+        parts = []
+        while frame is not None:
+            parts.append(f'{frame.f_globals.get("__name__", "?")}:{frame.f_code.co_name}')
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+_profile_lock = threading.Lock()
+_recent: deque = deque(maxlen=_RECENT_LIMIT)   # request profiles, newest last
+
+
+def _acquire():
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler disabled")
+    if not _profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+
+def profile_process(seconds: float, interval_ms: float, include_idle: bool = False) -> str:
+    """
+    Blocking: samples the whole process for `seconds`. Call from the threadpool.
+    """
+    if seconds <= 0 or seconds > MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {MAX_SECONDS:g}]")
+    _acquire()
+    try:
+        profiler = SamplingProfiler(interval_ms, include_idle)
+        profiler.start()
+        time.sleep(seconds)
+        profiler.stop()
+        return profiler.folded()
+    finally:
+        _profile_lock.release()
+
+
+def recent_profiles() -> list[dict]:
+    return [{k: v for k, v in p.items() if k != "folded"} for p in reversed(_recent)]
+
+
+def get_profile(profile_id: str) -> dict | None:
+    for profile in _recent:
+        if profile["id"] == profile_id:
+            return profile
+    return None
+
+
+# -----------------------------
+# PER-REQUEST PROFILING
+# -----------------------------
+
+async def _is_admin(scope) -> bool:
+    from app.utils.rbac import authenticate_token
+
+    headers = dict(scope.get("headers") or [])
+    auth = headers.get(b"authorization", b"").decode()
+    if not auth.lower().startswith("bearer "):
+        return False
+    try:
+        payload = await run_in_threadpool(authenticate_token, auth[7:].strip())
+    except HTTPException:
+        return False
+    return payload.get("role") == "admin"
+
+
+class RequestProfileMiddleware:
+    """
+    Profiles a single request when it carries "X-Profile: 1" and an admin
+    token. Everything else passes straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not PROFILER_ENABLED
+            or (b"x-profile", b"1") not in scope.get("headers", [])
+            or not await _is_admin(scope)
+            or not _profile_lock.acquire(blocking=False)
+        ):
+            return await self.app(scope, receive, send)
+
+        profile_id = uuid.uuid4().hex[:12]
+        loop_thread = threading.get_ident()
+        profiler = SamplingProfiler(
+            MIN_INTERVAL_MS,
+            thread_filter=lambda ident, name: ident == loop_thread or name == _THREADPOOL_THREAD,
+        )
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            _profile_lock.release()
+            _recent.append({
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "samples": profiler.samples,
+                "scope": REQUEST_PROFILE_SCOPE,
+                "folded": profiler.folded(),
+            })
@@ -0,0 +1,206 @@
+"""
+SITE SERVICE
+------------
+Multi-greenhouse tenancy: one deployment serves many sites.
+
+Partitioning:
+- Site data lives in per-site collections: sites/{site_id}/sensors,
+  .../alerts, .../controls, .../settings, .../growth_phase_history,
+  .../nutrient_events. Every query is therefore scoped to one site by
+  construction and uses the same single-field indexes as before.
+- The default site (DEFAULT_SITE_ID, default "default") keeps the
+  original top-level collections, so single-site data needs no migration.
+- Sites are registered in the "sites" collection (document id = site_id);
+  users, devices and auth stay global.
+
+Requests choose a site with the X-Site-Id header (none = default site);
+see current_site in rbac.py.
+
+Caching:
+- Per-site config documents (settings/system_config and the alert
+  config controls/system_config) are cached per site until that site's
+  collection changes (locally or on another worker via the invalidation
+  bus), with SITE_CONFIG_CACHE_SECONDS (default 60) as a backstop. The
+  default site's settings come from the snapshot mirror when it is fresh.
+- PerSite creates one instance of a cache per site on first use (history
+  windows, latest reading, alert counts) and reports their combined
+  hits/misses under one name. At most SITE_CACHE_MAX_SITES (default 64)
+  sites keep their instances; the least recently used one is dropped
+  beyond that and rebuilt on its next request.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from app.services.firebase_service import db
+from app.services.mirror_service import settings_mirror
+from app.services.version_service import VersionedCache, collection_version
+from app.utils.cache import TTLCache, register_cache
+
+DEFAULT_SITE_ID = os.getenv("DEFAULT_SITE_ID", "default")
+SITE_CONFIG_CACHE_SECONDS = float(os.getenv("SITE_CONFIG_CACHE_SECONDS", "60"))
+SITE_CACHE_MAX_SITES = int(os.getenv("SITE_CACHE_MAX_SITES", "64"))
+
+SITE_HEADER = "X-Site-Id"
+SITE_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+
+
+# -----------------------------
+# PARTITIONING
+# -----------------------------
+
+def site_collection(name: str, site_id: str = DEFAULT_SITE_ID) -> str:
+    """
+    Collection path of a site's partition of `name`.
+    """
+    if site_id == DEFAULT_SITE_ID:
+        return name
+    return f"sites/{site_id}/{name}"
+
+
+def split_site_collection(path: str) -> tuple[str, str]:
+    """
+    Inverse of site_collection: (site_id, collection name).
+    """
+    parts = path.split("/")
+    if len(parts) == 3 and parts[0] == "sites":
+        return parts[1], parts[2]
+    return DEFAULT_SITE_ID, path
+
+
+# -----------------------------
+# REGISTRY
+# -----------------------------
+
+_site_cache = VersionedCache("sites", ttl_seconds=300, name="sites")
+
+
+def get_site(site_id: str) -> dict | None:
+    """
+    Registered site document, or None. The default site always exists.
+    """
+    if site_id == DEFAULT_SITE_ID:
+        return {"site_id": DEFAULT_SITE_ID, "name": "Default"}
+
+    cached = _site_cache.get(site_id)
+    if cached is not None:
+        return cached or None
+
+    version = _site_cache.version()
+    doc = db.collection("sites").document(site_id).get()
+    site = {**doc.to_dict(), "site_id": site_id} if doc.exists else {}
+    _site_cache.set(site_id, site, version)
+    return site or None
+
+
+def list_sites() -> list[dict]:
+    sites = [get_site(DEFAULT_SITE_ID)]
+    for doc in db.collection("sites").stream():
+        if doc.id != DEFAULT_SITE_ID:
+            sites.append({**doc.to_dict(), "site_id": doc.id})
+    return sites
+
+
+# -----------------------------
+# PER-SITE CONFIG CACHE
+# -----------------------------
+
+class SiteConfigCache:
+
+    def __init__(self, ttl_seconds: float, name: str | None = None):
+        self._entries = TTLCache(ttl_seconds=ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+        if name:
+            register_cache(name, self)
+
+    def get(self, site_id: str, collection: str, doc_id: str) -> dict | None:
+        """
+        The document's data, or None when it does not exist.
+        """
+        path = site_collection(collection, site_id)
+        version = collection_version(path)
+        entry = self._entries.get((path, doc_id))
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        doc = db.collection(path).document(doc_id).get()
+        data = (doc.to_dict() or {}) if doc.exists else None
+        self._entries.set((path, doc_id), (version, data))
+        return data
+
+
+_config_cache = SiteConfigCache(SITE_CONFIG_CACHE_SECONDS, name="site_config")
+
+
+def site_settings(site_id: str) -> dict:
+    """
+    settings/system_config of a site (mode, targets, light schedule, thresholds).
+    """
+    if site_id == DEFAULT_SITE_ID:
+        mirrored = settings_mirror.snapshot()
+        if mirrored is not None:
+            return mirrored.get("system_config", {})
+    return _config_cache.get(site_id, "settings", "system_config") or {}
+
+
+def site_alert_config(site_id: str) -> dict | None:
+    """
+    controls/system_config of a site (alert targets and thresholds),
+    None when the site has none.
+    """
+    return _config_cache.get(site_id, "controls", "system_config")
+
+
+# -----------------------------
+# PER-SITE CACHE INSTANCES
+# -----------------------------
+
+class PerSite:
+    """
+    factory(site_id) -> cache, created on first use per site; the least
+    recently used site is evicted beyond max_sites.
+    """
+
+    def __init__(self, factory, name: str | None = None, max_sites: int = SITE_CACHE_MAX_SITES):
+        self._factory = factory
+        self._max_sites = max_sites
+        self._instances: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # Counters of evicted instances, so the totals never go backwards
+        self._evicted_hits = 0
+        self._evicted_misses = 0
+        self.evictions = 0
+        if name:
+            register_cache(name, self)
+
+    def __getitem__(self, site_id: str):
+        with self._lock:
+            instance = self._instances.get(site_id)
+            if instance is not None:
+                self._instances.move_to_end(site_id)
+                return instance
+
+            instance = self._instances[site_id] = self._factory(site_id)
+            while len(self._instances) > self._max_sites:
+                _, evicted = self._instances.popitem(last=False)
+                self._evicted_hits += evicted.hits
+                self._evicted_misses += evicted.misses
+                self.evictions += 1
+            return instance
+
+    @property
+    def hits(self) -> int:
+        return self._evicted_hits + sum(i.hits for i in list(self._instances.values()))
+
+    @property
+    def misses(self) -> int:
+        return self._evicted_misses + sum(i.misses for i in list(self._instances.values()))
+
+    def stats(self) -> dict:
+        return {"sites": len(self._instances), "evictions": self.evictions,
+                "hits": self.hits, "misses": self.misses}
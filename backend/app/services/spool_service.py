@@ -0,0 +1,334 @@
+"""
+SPOOL SERVICE
+-------------
+Durable local write-ahead spool for ingest, so readings survive datastore
+latency spikes and outages instead of failing with a 500.
+
+Write path (IngestSpool.write / write_many):
+- the document id is chosen up front, so a write is idempotent
+- normally the write goes straight to the datastore, bounded by
+  INGEST_SPOOL_WRITE_TIMEOUT_MS (default 1000)
+- on a failure or timeout the readings are appended to the spool instead,
+  and the caller still answers 200 ("spooled": true)
+- after INGEST_SPOOL_FAILURE_THRESHOLD consecutive failures (default 3)
+  the datastore counts as unhealthy: writes go to the spool without trying
+- while the spool holds anything, new writes are appended behind it, so
+  the datastore receives readings in arrival order
+
+Replayer (started in the app lifespan):
+- drains the spool oldest first in batched writes of
+  INGEST_SPOOL_REPLAY_BATCH (default 400, under Firestore's 500 limit),
+  re-using the spooled document ids (a write that timed out but landed
+  anyway is simply overwritten with the same data)
+- backs off from 1s to INGEST_SPOOL_MAX_BACKOFF_SECONDS (30) while the
+  datastore keeps failing; a successful batch marks it healthy again
+- polls every second while the spool is empty
+- replay listeners (on_replayed) run after each batch, e.g. to refresh
+  caches and check thresholds on the newest reading
+
+Storage: SQLite in WAL mode at INGEST_SPOOL_PATH (default
+ingest_spool.db), synchronous=FULL, so an accepted reading is on disk.
+Rows are pickled documents; the file is only ever written by this
+service. The spool refuses writes (503) beyond INGEST_SPOOL_MAX_ROWS
+(default 1000000).
+
+Several workers may share one file. A replay lease (a row in the file,
+held for LEASE_SECONDS and renewed by every batch) lets one of them drain
+it at a time; the others re-count the table on every poll, so their
+pending count follows the drain and they write directly again once it is
+empty. Should the lease expire mid-batch, a row replayed twice does no
+harm (replays are idempotent).
+
+Disable with INGEST_SPOOL_ENABLED=false (writes fail as before).
+Pending rows, lag and bytes are in /metrics and GET /api/diagnostics/spool.
+"""
+
+import os
+import time
+import uuid
+import pickle
+import sqlite3
+import asyncio
+import logging
+import threading
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.firebase_service import db
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("INGEST_SPOOL_ENABLED", "true").lower() == "true"
+SPOOL_PATH = os.getenv("INGEST_SPOOL_PATH", "ingest_spool.db")
+WRITE_TIMEOUT_SECONDS = float(os.getenv("INGEST_SPOOL_WRITE_TIMEOUT_MS", "1000")) / 1000
+FAILURE_THRESHOLD = int(os.getenv("INGEST_SPOOL_FAILURE_THRESHOLD", "3"))
+REPLAY_BATCH = int(os.getenv("INGEST_SPOOL_REPLAY_BATCH", "400"))
+MAX_BACKOFF_SECONDS = float(os.getenv("INGEST_SPOOL_MAX_BACKOFF_SECONDS", "30"))
+MAX_ROWS = int(os.getenv("INGEST_SPOOL_MAX_ROWS", "1000000"))
+POLL_SECONDS = 1.0
+LEASE_SECONDS = 30.0
+
+
+class IngestSpool:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        self._listeners = []
+        self.pending = 0
+        self.consecutive_failures = 0
+        self.stats = {"direct": 0, "spooled": 0, "replayed": 0, "write_failures": 0, "replay_failures": 0}
+
+    # -----------------------------
+    # STORAGE
+    # -----------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use: importing the app does no I/O
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=FULL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS spool ("
+                        " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                        " collection TEXT NOT NULL,"
+                        " doc_id TEXT NOT NULL,"
+                        " data BLOB NOT NULL,"
+                        " enqueued_at REAL NOT NULL)"
+                    )
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS replay_lease ("
+                        " id INTEGER PRIMARY KEY CHECK (id = 1),"
+                        " owner TEXT NOT NULL,"
+                        " expires_at REAL NOT NULL)"
+                    )
+                    self.pending = conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+                    self._conn = conn
+        return self._conn
+
+    def _append(self, collection: str, docs: list[tuple[str, dict]]):
+        conn = self._db()
+        with self._lock:
+            if self.pending + len(docs) > MAX_ROWS:
+                raise HTTPException(status_code=503, detail="Ingest spool full, retry later")
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO spool (collection, doc_id, data, enqueued_at) VALUES (?, ?, ?, ?)",
+                    [(collection, doc_id, pickle.dumps(data), now) for doc_id, data in docs],
+                )
+            self.pending += len(docs)
+            self.stats["spooled"] += len(docs)
+
+    def _oldest(self, limit: int) -> list[tuple]:
+        conn = self._db()
+        with self._lock:
+            return conn.execute(
+                "SELECT seq, collection, doc_id, data FROM spool ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+
+    def _remove_through(self, seq: int):
+        conn = self._db()
+        with self._lock:
+            with conn:
+                conn.execute("DELETE FROM spool WHERE seq <= ?", (seq,))
+            self._recount()
+
+    def _recount(self):
+        # Other processes sharing the file append and drain too (caller holds _lock)
+        self.pending = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def _take_lease(self) -> bool:
+        """
+        True when this process may replay: it holds the lease, or took it
+        over because the holder stopped renewing it.
+        """
+        now = time.time()
+        conn = self._db()
+        with self._lock:
+            with conn:
+                conn.execute(
+                    "INSERT INTO replay_lease (id, owner, expires_at) VALUES (1, ?, ?)"
+                    " ON CONFLICT(id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+                    " WHERE replay_lease.owner = excluded.owner OR replay_lease.expires_at < ?",
+                    (self._owner, now + LEASE_SECONDS, now),
+                )
+                owner = conn.execute("SELECT owner FROM replay_lease WHERE id = 1").fetchone()[0]
+            return owner == self._owner
+
+    def _release_lease(self):
+        conn = self._db()
+        with self._lock:
+            with conn:
+                conn.execute("DELETE FROM replay_lease WHERE owner = ?", (self._owner,))
+
+    # -----------------------------
+    # WRITE PATH
+    # -----------------------------
+
+    @property
+    def healthy(self) -> bool:
+        return self.consecutive_failures < FAILURE_THRESHOLD
+
+    async def write(self, collection: str, doc_id: str, data: dict) -> bool:
+        """
+        Stores one document. True when it reached the datastore,
+        False when it was spooled for replay.
+        """
+        return await self.write_many(collection, [(doc_id, data)])
+
+    async def write_many(self, collection: str, docs: list[tuple[str, dict]]) -> bool:
+        if not ENABLED:
+            await run_in_threadpool(_commit, collection, docs)
+            return True
+
+        if self.healthy and self.pending == 0:
+            try:
+                await asyncio.wait_for(
+                    run_in_threadpool(_commit, collection, docs), WRITE_TIMEOUT_SECONDS
+                )
+                self.consecutive_failures = 0
+                self.stats["direct"] += len(docs)
+                return True
+            except Exception as e:
+                self.consecutive_failures += 1
+                self.stats["write_failures"] += 1
+                logger.warning("Datastore write to %s failed, spooling: %r", collection, e)
+
+        await run_in_threadpool(self._append, collection, docs)
+        return False
+
+    # -----------------------------
+    # REPLAYER
+    # -----------------------------
+
+    def on_replayed(self, listener):
+        """
+        listener(collection, docs) coroutine, called after each replayed
+        batch with the documents (dicts) it wrote, oldest first.
+        """
+        self._listeners.append(listener)
+
+    def _replay_batch(self) -> dict[str, list[dict]]:
+        """
+        Replays the oldest rows; {} when there is nothing for this
+        process to replay (empty, or another process holds the lease).
+        """
+        rows = self._oldest(REPLAY_BATCH)
+        if not rows or not self._take_lease():
+            with self._lock:
+                self._recount()
+            return {}
+
+        batch = db.batch()
+        replayed: dict[str, list[dict]] = {}
+        for _, collection, doc_id, blob in rows:
+            data = pickle.loads(blob)
+            batch.set(db.collection(collection).document(doc_id), data)
+            replayed.setdefault(collection, []).append(data)
+        batch.commit()
+
+        self._remove_through(rows[-1][0])
+        self.stats["replayed"] += len(rows)
+        self.consecutive_failures = 0
+        return replayed
+
+    async def _run(self):
+        backoff = POLL_SECONDS
+        while True:
+            try:
+                replayed = await run_in_threadpool(self._replay_batch)
+            except Exception as e:
+                self.consecutive_failures += 1
+                self.stats["replay_failures"] += 1
+                logger.warning("Spool replay failed (%d pending), retrying in %.0fs: %r",
+                               self.pending, backoff, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+                continue
+
+            backoff = POLL_SECONDS
+            if not replayed:
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+
+            for collection, docs in replayed.items():
+                for listener in self._listeners:
+                    try:
+                        await listener(collection, docs)
+                    except Exception:
+                        logger.exception("Spool replay listener failed")
+            if self.pending == 0:
+                logger.info("Ingest spool drained")
+
+    def start(self):
+        if not ENABLED or self._task is not None:
+            return
+        self._db()
+        if self.pending:
+            logger.warning("Ingest spool holds %d readings from a previous run, replaying", self.pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await run_in_threadpool(self._release_lease)
+
+    # -----------------------------
+    # STATUS
+    # -----------------------------
+
+    def lag_seconds(self) -> float:
+        """
+        Age of the oldest spooled reading (0 when empty).
+        """
+        if not self.pending or self._conn is None:
+            return 0.0
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(enqueued_at) FROM spool").fetchone()
+        return max(0.0, time.time() - row[0]) if row and row[0] is not None else 0.0
+
+    def size_bytes(self) -> int:
+        total = 0
+        for suffix in ("", "-wal"):
+            try:
+                total += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return total
+
+    def status(self) -> dict:
+        return {
+            "enabled": ENABLED,
+            "healthy": self.healthy,
+            "pending": self.pending,
+            "lag_seconds": round(self.lag_seconds(), 3),
+            "bytes": self.size_bytes(),
+            **self.stats,
+        }
+
+
+def _commit(collection: str, docs: list[tuple[str, dict]]):
+    if len(docs) == 1:
+        doc_id, data = docs[0]
+        db.collection(collection).document(doc_id).set(data)
+        return
+    batch = db.batch()
+    for doc_id, data in docs:
+        batch.set(db.collection(collection).document(doc_id), data)
+    batch.commit()
+
+
+ingest_spool = IngestSpool(SPOOL_PATH)
@@ -0,0 +1,78 @@
+"""
+STARTUP SERVICE
+---------------
+Startup timing and cache warm-up for scale-out.
+
+Phases (seconds, measured from the start of importing app.main, the
+earliest point the app controls):
+- import_seconds        modules imported and the app object built
+- ready_seconds         lifespan finished (clients connected, caches warm)
+- first_request_seconds first HTTP request received
+Plus warmup_seconds: duration of the lifespan warm-up alone.
+
+Exposed in /metrics, at GET /api/diagnostics/startup and logged once the
+app is ready.
+"""
+
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+_marks: dict[str, float] = {}
+
+
+def mark(phase: str, at: float | None = None):
+    _marks.setdefault(phase, time.perf_counter() if at is None else at)
+
+
+def startup_status() -> dict:
+    origin = _marks.get("import_started")
+    if origin is None:
+        return {}
+    status = {
+        f"{phase}_seconds": round(at - origin, 4)
+        for phase, at in _marks.items()
+        if phase not in ("import_started", "warmup_started")
+    }
+    if "warmup_started" in _marks and "ready" in _marks:
+        status["warmup_seconds"] = round(_marks["ready"] - _marks["warmup_started"], 4)
+    return status
+
+
+async def warm_up(*tasks):
+    """
+    Runs blocking warm-up callables in the threadpool and coroutines
+    as-is, all concurrently. Failures are logged, not raised: a cold
+    cache only costs a datastore read later.
+    """
+    # Imported here: this module is loaded first, before the clock starts
+    from fastapi.concurrency import run_in_threadpool
+
+    async def run(task):
+        try:
+            if asyncio.iscoroutine(task):
+                await task
+            else:
+                await run_in_threadpool(task)
+        except Exception:
+            logger.exception("Startup warm-up task failed")
+
+    await asyncio.gather(*(run(task) for task in tasks))
+
+
+class FirstRequestMiddleware:
+    """
+    Records when the first HTTP request arrives (time-to-first-request).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._seen = False
+
+    async def __call__(self, scope, receive, send):
+        if not self._seen and scope["type"] == "http":
+            self._seen = True
+            mark("first_request")
+        await self.app(scope, receive, send)
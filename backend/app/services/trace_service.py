@@ -0,0 +1,149 @@
+"""
+TRACE SERVICE
+-------------
+Per-request datastore cost tracing.
+
+Every datastore operation made while serving a request (collection, op,
+documents, duration, whether it raised; reported by the instrumented db client) is recorded
+against that request. When the request finishes:
+
+- Response headers carry the totals:
+    X-Datastore-Ops: <ops>
+    Server-Timing: datastore;dur=<ms>;desc="<ops> ops, <docs> docs"
+- A structured (JSON) log line is written on the "app.trace" logger:
+  DEBUG for every request, WARNING when a datastore operation failed,
+  the request goes over the op budget or it repeats the same
+  single-document read many times (likely an N+1 loop)
+
+Background work (mirrors, presence flush, automation) runs outside any
+request and is not traced.
+
+Config (env):
+- DATASTORE_TRACE_ENABLED   (default true)
+- DATASTORE_OP_BUDGET       (default 10 operations per request)
+- DATASTORE_N_PLUS_ONE_MIN  (default 5 repeated reads of one collection)
+"""
+
+import os
+import json
+import time
+import logging
+from collections import Counter
+from contextvars import ContextVar
+
+from app.services.instrumented_client import add_datastore_hook
+
+logger = logging.getLogger("app.trace")
+
+TRACE_ENABLED = os.getenv("DATASTORE_TRACE_ENABLED", "true").lower() == "true"
+OP_BUDGET = int(os.getenv("DATASTORE_OP_BUDGET", "10"))
+N_PLUS_ONE_MIN = int(os.getenv("DATASTORE_N_PLUS_ONE_MIN", "5"))
+
+# Single-document reads: repeating these in a loop is the N+1 pattern
+_POINT_READS = {"get"}
+
+
+class RequestTrace:
+
+    __slots__ = ("ops",)
+
+    def __init__(self):
+        self.ops: list[tuple[str, str, int, float, bool]] = []   # (collection, op, docs, seconds, error)
+
+    def record(self, collection: str, op: str, docs: int, duration: float, error: bool = False):
+        self.ops.append((collection, op, docs, duration, error))
+
+    def summary(self) -> dict:
+        by_op = Counter(f"{collection}.{op}" for collection, op, _, _, _ in self.ops)
+        return {
+            "ops": len(self.ops),
+            "errors": sum(1 for *_, error in self.ops if error),
+            "docs": sum(docs for _, _, docs, _, _ in self.ops),
+            "datastore_ms": round(sum(d for _, _, _, d, _ in self.ops) * 1000, 2),
+            "by_op": dict(by_op),
+        }
+
+    def repeated_reads(self) -> dict:
+        """
+        collection -> count, for point reads repeated N_PLUS_ONE_MIN+ times.
+        """
+        reads = Counter(collection for collection, op, *_ in self.ops if op in _POINT_READS)
+        return {collection: n for collection, n in reads.items() if n >= N_PLUS_ONE_MIN}
+
+
+_current: ContextVar[RequestTrace | None] = ContextVar("datastore_trace", default=None)
+
+
+def current_trace() -> RequestTrace | None:
+    return _current.get()
+
+
+def _record(collection: str, op: str, docs: int, duration: float, error: bool):
+    trace = _current.get()
+    if trace is not None:
+        trace.record(collection, op, docs, duration, error)
+
+
+add_datastore_hook(_record)
+
+
+class DatastoreTraceMiddleware:
+    """
+    Pure ASGI middleware. Sync endpoints run in the threadpool with a copy
+    of the request context, so their datastore calls land in the same trace.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACE_ENABLED:
+            return await self.app(scope, receive, send)
+
+        trace = RequestTrace()
+        token = _current.set(trace)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                summary = trace.summary()
+                headers = list(message.get("headers", []))
+                headers.append((b"x-datastore-ops", str(summary["ops"]).encode()))
+                headers.append((
+                    b"server-timing",
+                    f'datastore;dur={summary["datastore_ms"]};desc="{summary["ops"]} ops, {summary["docs"]} docs"'.encode(),
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            _log_trace(scope, status, trace, time.perf_counter() - start)
+
+
+def _log_trace(scope, status: int, trace: RequestTrace, elapsed: float):
+    summary = trace.summary()
+    repeated = trace.repeated_reads()
+    over_budget = summary["ops"] > OP_BUDGET
+    level = logging.WARNING if over_budget or repeated or summary["errors"] else logging.DEBUG
+    if not logger.isEnabledFor(level):
+        return
+
+    record = {
+        "event": "datastore_trace",
+        "method": scope["method"],
+        "path": scope["path"],
+        "status": status,
+        "duration_ms": round(elapsed * 1000, 2),
+        **summary,
+    }
+    if over_budget:
+        record["over_budget"] = OP_BUDGET
+    if repeated:
+        record["suspected_n_plus_one"] = repeated
+    logger.log(level, json.dumps(record))
@@ -0,0 +1,179 @@
+"""
+VERSION SERVICE
+---------------
+Per-collection version counters for HTTP conditional caching (ETag/304).
+
+- Every write through `db` (set/create/update/delete/add/batch commit,
+  reported by the instrumented client) bumps its collection's version,
+  so routers and background services need no extra calls
+- Config mirrors bump their collection when a snapshot arrives, which
+  also covers writes made by other instances or the console
+
+ETags are a hash of the response body (content_response), so every worker
+(and a restarted one) issues the same ETag for the same data and a 304
+works whichever worker answers. Each worker also remembers the ETag it
+served per version key (version_key: a per-process epoch, the versions of
+the collections a response depends on and the request's own parameters);
+while that key is unchanged, a matching If-None-Match gets its 304
+without a datastore read (served_etag). A worker that has not served the
+key yet reads and hashes once, then answers 304 if the content matches.
+
+Range endpoints ("last 24h") also change as time passes with no writes,
+so their version keys include a time bucket (ETAG_WINDOW_SECONDS,
+default 60).
+
+With several workers, writes made by the others arrive through the
+invalidation bus (invalidation_service) and bump the same counters, so
+remembered ETags and VersionedCache entries never outlive a change made
+anywhere.
+"""
+
+import os
+import time
+import uuid
+import hashlib
+import threading
+
+from fastapi import Request, Response
+
+from app.services.instrumented_client import add_datastore_hook
+from app.utils.cache import TTLCache, register_cache
+from app.utils.responses import dumps
+
+ETAG_WINDOW_SECONDS = int(os.getenv("ETAG_WINDOW_SECONDS", "60"))
+
+# Conditional responses still revalidate every time (no stale config in
+# the browser); authenticated data must not land in shared caches.
+CACHE_CONTROL = "private, no-cache"
+
+_WRITE_OPS = {"set", "create", "update", "delete", "add", "batch_commit", "transaction_commit"}
+
+_epoch = uuid.uuid4().hex[:8]
+# version key -> content ETag this worker last served for it
+_served = TTLCache(ttl_seconds=ETAG_WINDOW_SECONDS * 60, max_entries=10_000)
+_versions: dict[str, int] = {}
+_generation = 0   # added to every version; bump_all() moves them all at once
+_lock = threading.Lock()
+
+
+def bump(collection: str):
+    with _lock:
+        _versions[collection] = _versions.get(collection, 0) + 1
+
+
+def bump_all():
+    """
+    Invalidates everything (e.g. after missing invalidation messages).
+    """
+    global _generation
+    with _lock:
+        _generation += 1
+
+
+def collection_version(collection: str) -> int:
+    return _generation + _versions.get(collection, 0)
+
+
+def _on_datastore_op(collection: str, op: str, docs: int, duration: float, error: bool):
+    # Failed writes bump too: they may have been applied before the error
+    if op in _WRITE_OPS:
+        bump(collection)
+
+
+add_datastore_hook(_on_datastore_op)
+
+
+def version_key(collections: list[str], *parts, window: bool = False) -> str:
+    """
+    Identifies what this worker knows about the response's inputs; it
+    moves on every write to `collections` (and every window).
+    """
+    key = [_epoch, *(f"{c}:{collection_version(c)}" for c in collections), *map(str, parts)]
+    if window:
+        key.append(str(int(time.time() // ETAG_WINDOW_SECONDS)))
+    return "|".join(key)
+
+
+def served_etag(key: str) -> str | None:
+    """
+    ETag this worker served for `key`, still valid while the key is.
+    """
+    return _served.get(key)
+
+
+def content_etag(body: bytes) -> str:
+    return 'W/"' + hashlib.blake2s(body, digest_size=12).hexdigest() + '"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    True when the client's If-None-Match already names this ETag.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip() for tag in header.split(",")}
+    # Weak comparison: W/"x" matches "x"
+    return etag in candidates or etag[2:] in candidates
+
+
+def cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
+
+
+def content_response(request: Request, key: str, content) -> Response:
+    """
+    JSON response (or 304) with an ETag derived from its body,
+    remembered for `key`.
+    """
+    body = dumps(content)
+    etag = content_etag(body)
+    _served.set(key, etag)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    return Response(content=body, media_type="application/json", headers=cache_headers(etag))
+
+
+# -----------------------------
+# VERSIONED CACHE
+# -----------------------------
+
+class VersionedCache:
+    """
+    Cached values that stay valid until their collection's version moves
+    (a write here or, via the bus, on another worker), with a TTL as a
+    backstop. Callers read the version before loading, so a load that
+    races with a write is never served:
+
+        version = cache.version()
+        value = load()
+        cache.set(key, value, version)
+    """
+
+    def __init__(self, collection: str, ttl_seconds: float, max_entries: int = 10_000, name: str | None = None):
+        self.collection = collection
+        self._entries = TTLCache(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.hits = 0
+        self.misses = 0
+        if name:
+            register_cache(name, self)
+
+    def version(self) -> int:
+        return collection_version(self.collection)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == collection_version(self.collection):
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, version: int):
+        self._entries.set(key, (version, value))
@@ -0,0 +1,191 @@
+"""
+WORKLOAD SERVICE
+----------------
+Workload isolation: every HTTP request is classified into a lane, and each
+lane has its own concurrency limit and wait queue, so analytics or admin
+bursts cannot take the worker (or its threadpool) away from ingest.
+
+Lanes (concurrency / queue / max wait / status when shed):
+- ingest     sensor readings, heartbeats      200 / 1000 / 10s / 503
+- control    control + settings writes         50 /  200 / 10s / 503
+- dashboard  other API reads, auth             32 /  128 /  5s / 429
+- analytics  history / usage ranges             4 /   16 /  5s / 429
+- admin      users, provisioning, diagnostics   4 /    8 / 10s / 429
+
+A request waits in its lane's queue while the lane is at its limit. It is
+shed immediately when the queue is full, or when it waited too long, with
+a Retry-After header. The health check, /metrics and WebSockets are not
+limited.
+
+Override per lane with WORKLOAD_<LANE>_CONCURRENCY / _QUEUE / _WAIT_SECONDS.
+
+The shared threadpool (sync endpoints, run_in_threadpool) is sized by
+WORKLOAD_THREADPOOL_SIZE (default 64) so the shedding lanes together
+(4 + 4 + 32) can never occupy every thread: ingest and control always
+find one.
+"""
+
+import os
+import re
+import json
+import asyncio
+from collections import deque
+
+import anyio.to_thread
+
+THREADPOOL_SIZE = int(os.getenv("WORKLOAD_THREADPOOL_SIZE", "64"))
+
+# method set (None = any), path pattern, lane; first match wins
+_RULES = [
+    ({"POST"}, re.compile(r"^/api/sensor/(latest|batch)$"), "ingest"),
+    ({"POST"}, re.compile(r"^/api/devices/[^/]+/heartbeat$"), "ingest"),
+    (None, re.compile(r"^/api/(sensor/history|growth/history|nutrients/usage)$"), "analytics"),
+    (None, re.compile(r"^/api/(users|diagnostics)(/|$)|^/api/devices/provision$"), "admin"),
+    ({"POST", "PUT", "PATCH", "DELETE"}, re.compile(r"^/api/control/"), "control"),
+    (None, re.compile(r"^/api/"), "dashboard"),
+]
+
+_DEFAULTS = {
+    # lane: (concurrency, queue, max wait seconds, status when shed)
+    "ingest": (200, 1000, 10.0, 503),
+    "control": (50, 200, 10.0, 503),
+    "dashboard": (32, 128, 5.0, 429),
+    "analytics": (4, 16, 5.0, 429),
+    "admin": (4, 8, 10.0, 429),
+}
+
+
+class _Shed(Exception):
+
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+class Lane:
+
+    def __init__(self, name: str, limit: int, queue_limit: int, max_wait: float, shed_status: int):
+        self.name = name
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.max_wait = max_wait
+        self.shed_status = shed_status
+        self.active = 0
+        self._waiters: deque = deque()
+        self.stats = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_timeout": 0}
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            return
+
+        if len(self._waiters) >= self.queue_limit:
+            self.stats["shed_queue_full"] += 1
+            raise _Shed(self.shed_status, f"{self.name} capacity exhausted")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self.stats["shed_timeout"] += 1
+            raise _Shed(self.shed_status, f"{self.name} queue wait exceeded")
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the cancel
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.stats["admitted"] += 1
+
+    def release(self):
+        # Hand the slot straight to the next live waiter (FIFO)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def status(self) -> dict:
+        return {
+            **self.stats,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "limit": self.limit,
+            "queue_limit": self.queue_limit,
+        }
+
+
+def _lane_from_env(name: str, defaults: tuple) -> Lane:
+    limit, queue, wait, status = defaults
+    prefix = f"WORKLOAD_{name.upper()}_"
+    return Lane(
+        name,
+        int(os.getenv(prefix + "CONCURRENCY", limit)),
+        int(os.getenv(prefix + "QUEUE", queue)),
+        float(os.getenv(prefix + "WAIT_SECONDS", wait)),
+        status,
+    )
+
+
+lanes: dict[str, Lane] = {name: _lane_from_env(name, d) for name, d in _DEFAULTS.items()}
+
+
+def classify(method: str, path: str) -> str | None:
+    for methods, pattern, lane in _RULES:
+        if (methods is None or method in methods) and pattern.match(path):
+            return lane
+    return None
+
+
+def configure_threadpool():
+    """
+    Call from the running event loop (app lifespan).
+    """
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+
+def workload_status() -> dict:
+    return {name: lane.status() for name, lane in lanes.items()}
+
+
+class WorkloadMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        lane_name = classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if lane_name is None:
+            return await self.app(scope, receive, send)
+
+        lane = lanes[lane_name]
+        try:
+            await lane.acquire()
+        except _Shed as shed:
+            return await _send_shed(send, shed, lane)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release()
+
+
+async def _send_shed(send, shed: _Shed, lane: Lane):
+    body = json.dumps({"detail": f"Server busy ({shed.reason}), retry later"}).encode()
+    retry_after = max(1, int(lane.max_wait)) if shed.status == 503 else 1
+    await send({
+        "type": "http.response.start",
+        "status": shed.status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,74 @@
+"""
+cache.py
+--------
+Small in-process caches shared by routers and services.
+
+TTLCache:
+- get/set with a per-cache time-to-live
+- bounded size (oldest entries evicted first)
+- hit/miss counters for monitoring (named caches are listed by all_caches())
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+_named_caches: dict = {}
+
+
+def all_caches() -> dict:
+    """
+    name -> cache for every cache created with a name (anything with
+    hits/misses counters can be added with register_cache).
+    """
+    return dict(_named_caches)
+
+
+def register_cache(name: str, cache):
+    _named_caches[name] = cache
+
+
+class TTLCache:
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 10_000, name: str | None = None):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if name:
+            register_cache(name, self)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] < time.monotonic():
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """
+        Drop one key, or everything when key is None.
+        """
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
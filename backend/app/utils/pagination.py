@@ -0,0 +1,121 @@
+"""
+pagination.py
+-------------
+Shared cursor pagination for list endpoints.
+
+Why?
+- Streaming a whole collection gets slower (and more expensive) as it grows.
+- Offsets still read (and bill) every skipped document; cursors do not.
+
+How it works:
+- Results are ordered by an optional field, then by document id,
+  so the order is total and stable.
+- The response carries `next_cursor`: an opaque token holding the
+  last row's sort values. Pass it back as `?cursor=` for the next page.
+- page_size is capped at MAX_PAGE_SIZE.
+
+Equality filters combined with an order field need a Firestore
+composite index (Firestore returns a link to create it on first use).
+"""
+
+import json
+import base64
+from datetime import datetime
+
+from fastapi import HTTPException, Query
+from app.services.firebase_service import ASCENDING, DESCENDING
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class PageParams:
+
+    def __init__(self, page_size: int = DEFAULT_PAGE_SIZE, cursor: str | None = None):
+        self.page_size = page_size
+        self.cursor = cursor
+
+
+def page_params(default_size: int = DEFAULT_PAGE_SIZE):
+    """
+    Builds the FastAPI dependency for ?page_size=..&cursor=..
+    Usage: page: PageParams = Depends(page_params(20))
+    """
+
+    def dependency(
+        page_size: int = Query(default_size, ge=1, le=MAX_PAGE_SIZE),
+        cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    ) -> PageParams:
+        return PageParams(page_size, cursor)
+
+    return dependency
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "$dt" in value:
+        return datetime.fromisoformat(value["$dt"])
+    return value
+
+
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps({k: _encode_value(v) for k, v in values.items()}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, dict):
+            raise ValueError
+        return {k: _decode_value(v) for k, v in values.items()}
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(query, page: PageParams, order_field: str | None = None, descending: bool = False):
+    """
+    Runs one page of `query`.
+
+    Returns (rows, next_cursor); rows are dicts with "id" added,
+    next_cursor is None on the last page.
+    """
+    direction = DESCENDING if descending else ASCENDING
+
+    if order_field:
+        query = query.order_by(order_field, direction=direction)
+    query = query.order_by("__name__", direction=direction)
+
+    if page.cursor:
+        values = decode_cursor(page.cursor)
+        keys = ([order_field] if order_field else []) + ["__name__"]
+        if set(values) != set(keys):
+            raise HTTPException(status_code=400, detail="Cursor does not match this listing")
+        query = query.start_after({k: values[k] for k in keys})
+
+    # One extra row tells us whether another page exists
+    docs = list(query.limit(page.page_size + 1).stream())
+    has_more = len(docs) > page.page_size
+    docs = docs[:page.page_size]
+
+    rows = []
+    for doc in docs:
+        row = doc.to_dict() or {}
+        row["id"] = doc.id
+        rows.append(row)
+
+    next_cursor = None
+    if has_more and docs:
+        last = docs[-1]
+        values = {"__name__": last.id}
+        if order_field:
+            values[order_field] = (last.to_dict() or {}).get(order_field)
+        next_cursor = encode_cursor(values)
+
+    return rows, next_cursor
@@ -0,0 +1,50 @@
+"""
+rate_limit.py
+-------------
+In-memory token buckets, one per key (device, credential, ...).
+
+TokenBucketLimiter:
+- each key refills at `rate` tokens/second up to `burst`
+- take() is O(1): one dict lookup and a little arithmetic
+- bounded: the least recently used keys are dropped beyond max_keys
+  (a dropped key simply starts again with a full bucket)
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()   # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def take(self, key, cost: float = 1.0) -> tuple[bool, float, float]:
+        """
+        Returns (allowed, tokens_left, retry_after_seconds).
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [self.burst, now]
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return True, bucket[0], 0.0
+            return False, bucket[0], (cost - bucket[0]) / self.rate
+
+    def stats(self) -> dict:
+        return {"keys": len(self._buckets), "rate": self.rate, "burst": self.burst}
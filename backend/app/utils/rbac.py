@@ -7,23 +7,59 @@ Responsibilities:
 - Extract JWT from request header
 - Validate token
 - Enforce role restrictions
+- Resolve the site (tenant) a request is scoped to
+
+Sites: X-Site-Id picks the site (none = the default site). Admins may
+use any registered site; users only the sites in their "sites" list, or
+the default site when they have none.
+
+User status (exists / is_active / sites) is cached per user until the users
+collection changes, here or on another worker (VersionedCache), for at
+most USER_STATUS_CACHE_SECONDS (default 30).
 """
 
-from fastapi import Depends, HTTPException
+import os
+
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.services.auth_service import decode_access_token
 from app.services.firebase_service import db
+from app.services.version_service import VersionedCache
+from app.services.site_service import DEFAULT_SITE_ID, SITE_HEADER, SITE_ID_PATTERN, get_site
 
 
 # HTTPBearer automatically reads: Authorization: Bearer <token>
 security = HTTPBearer()
 
+_user_status_cache = VersionedCache(
+    "users", ttl_seconds=float(os.getenv("USER_STATUS_CACHE_SECONDS", "30")), name="user_status"
+)
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
-) -> dict:
-    token = credentials.credentials
 
+def _user_status(user_id: str) -> dict | None:
+    """
+    {"is_active": bool, "sites": list | None} for an existing user,
+    None for an unknown one.
+    """
+    cached = _user_status_cache.get(user_id)
+    if cached is not None:
+        return cached or None
+
+    version = _user_status_cache.version()
+    doc = db.collection("users").document(user_id).get()
+    status = {}
+    if doc.exists:
+        data = doc.to_dict() or {}
+        status = {"is_active": data.get("is_active", True), "sites": data.get("sites")}
+    _user_status_cache.set(user_id, status, version)
+    return status or None
+
+
+def authenticate_token(token: str) -> dict:
+    """
+    Validates a raw access token and checks the user is still active.
+    Shared by HTTP routes (via get_current_user) and WebSocket channels.
+    """
     try:
         payload = decode_access_token(token)
 
@@ -32,12 +68,11 @@ def get_current_user(
             raise HTTPException(status_code=401, detail="Invalid token subject")
 
         # 🔥 CHECK if user is still active
-        doc = db.collection("users").document(user_id).get()
-        if not doc.exists:
+        user_data = _user_status(user_id)
+        if user_data is None:
             raise HTTPException(status_code=401, detail="User not found")
 
-        user_data = doc.to_dict()
-        if not user_data.get("is_active", True):
+        if not user_data["is_active"]:
             raise HTTPException(status_code=403, detail="User disabled")
 
         return payload
@@ -49,6 +84,12 @@ def get_current_user(
         )
 
 
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> dict:
+    return authenticate_token(credentials.credentials)
+
+
 
 def require_user_or_admin(user: dict = Depends(get_current_user)) -> dict:
     """
@@ -72,3 +113,39 @@ def require_admin(user: dict = Depends(get_current_user)) -> dict:
             detail="Admin role required"
         )
     return user
+
+
+def allowed_sites(user: dict) -> list[str] | None:
+    """
+    Sites a user may use; None = any (admins). A user without a "sites"
+    list only gets the default site.
+    """
+    if user.get("role") == "admin":
+        return None
+    sites = (_user_status(user["sub"]) or {}).get("sites")
+    return sites if sites is not None else [DEFAULT_SITE_ID]
+
+
+def current_site(request: Request, user: dict = Depends(get_current_user)) -> str:
+    """
+    Site the request is scoped to (X-Site-Id header, else the default site).
+    """
+    return resolve_site(request.headers.get(SITE_HEADER), user)
+
+
+def resolve_site(site_id: str | None, user: dict) -> str:
+    """
+    Validates a requested site for a user (None = the default site).
+    Shared by current_site and WebSocket channels.
+    """
+    site_id = site_id or DEFAULT_SITE_ID
+    if not SITE_ID_PATTERN.match(site_id):
+        raise HTTPException(status_code=400, detail="Invalid site id")
+
+    allowed = allowed_sites(user)
+    if allowed is not None and site_id not in allowed:
+        raise HTTPException(status_code=403, detail="No access to this site")
+
+    if get_site(site_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown site")
+    return site_id
@@ -0,0 +1,50 @@
+"""
+singleflight.py
+---------------
+Request coalescing for identical concurrent reads.
+
+SingleFlight.do(key, fn, *args):
+- the first caller for a key runs fn (blocking, in the threadpool)
+- callers arriving while it is in flight await the same call and share
+  its result (or exception) instead of issuing their own query
+- nothing is cached: once the call finishes the next caller runs fn again
+
+A caller that disconnects does not cancel the shared call for the others.
+Shared results are handed to every waiter: treat them as read-only.
+"""
+
+import asyncio
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.utils.cache import register_cache
+
+
+class SingleFlight:
+
+    def __init__(self, name: str | None = None):
+        self._inflight: dict = {}
+        self.hits = 0       # callers that joined an in-flight call
+        self.misses = 0     # calls actually executed
+        if name:
+            register_cache(name, self)
+
+    async def do(self, key, fn, *args):
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(run_in_threadpool(fn, *args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.hits += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()   # mark retrieved even if every waiter left
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,313 @@
+"""
+LOAD GENERATOR
+--------------
+Synthetic greenhouse fleet: many devices posting readings plus many
+dashboards polling, all at once, against the whole FastAPI app.
+
+By default it starts a local uvicorn server backed by the embedded SQLite
+store (STORAGE_BACKEND=sqlite, temporary file), seeds an admin user and
+mints its own token. Use --base-url/--token to target a running server.
+
+Devices:
+- Diurnal air/water temperature and light (sine over a simulated day)
+- pH and EC random-walk drift
+- Failures: dropouts (skipped posts), stuck sensors, spikes
+
+Dashboards poll latest, history (24h), alerts, controls and settings.
+
+Reports per-endpoint request count, error rate and latency
+percentiles (JSON with --output).
+
+The local server runs with the temporary directory as its working
+directory, so every file it creates (database, local state) stays there.
+
+Usage (from backend/, requires httpx: pip install -r requirements-dev.txt):
+    python -m benchmarks.load_generator --devices 500 --dashboards 50 --duration 60
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+import httpx
+from dotenv import load_dotenv
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# -----------------------------
+# DEVICE MODEL
+# -----------------------------
+
+class SimulatedDevice:
+
+    def __init__(self, index: int, rng: random.Random, day_seconds: float):
+        self.index = index
+        self.rng = rng
+        self.day_seconds = day_seconds
+        self.phase = rng.uniform(0, 0.05)   # devices are not perfectly in sync
+        self.ph = rng.uniform(5.8, 6.2)
+        self.ec = rng.uniform(1.6, 2.0)
+        self.stuck: dict | None = None
+
+    def reading(self, elapsed: float) -> dict | None:
+        """
+        Returns a SensorReading payload, or None for a dropout.
+        """
+        rng = self.rng
+
+        if rng.random() < 0.01:
+            return None
+
+        day = (elapsed / self.day_seconds + self.phase) % 1.0
+        sun = math.sin(2 * math.pi * (day - 0.25))      # peaks mid-day
+
+        self.ph = min(8.0, max(4.5, self.ph + rng.gauss(0.002, 0.02)))
+        self.ec = min(3.5, max(0.5, self.ec + rng.gauss(-0.001, 0.01)))
+
+        payload = {
+            "ph": round(self.ph, 2),
+            "ec": round(self.ec, 2),
+            "water_temp": round(21 + 3 * sun + rng.gauss(0, 0.2), 2),
+            "air_temp": round(22 + 6 * sun + rng.gauss(0, 0.4), 2),
+            "humidity": round(65 - 15 * sun + rng.gauss(0, 1.5), 1),
+            "flow_rate": round(max(0.0, 1.8 + rng.gauss(0, 0.1)), 2),
+            "light_intensity": round(max(0.0, 100 * sun), 1),
+        }
+
+        # Stuck sensor: repeats the same values for a while
+        if self.stuck is None and rng.random() < 0.002:
+            self.stuck = {"payload": payload, "left": rng.randint(5, 30)}
+        if self.stuck is not None:
+            self.stuck["left"] -= 1
+            payload = self.stuck["payload"]
+            if self.stuck["left"] <= 0:
+                self.stuck = None
+
+        # Spike: one wild value (triggers alerts)
+        if rng.random() < 0.005:
+            payload = {**payload, "ph": round(rng.uniform(3, 9), 2)}
+
+        return payload
+
+
+# -----------------------------
+# STATS
+# -----------------------------
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = "exception"
+        self.latencies[name].append((time.perf_counter() - start) * 1000)
+        self.statuses[name][str(status)] += 1
+        if status == "exception" or status >= 400:
+            self.errors[name] += 1
+
+    def report(self, duration: float) -> dict:
+        endpoints = {}
+        for name, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            n = len(samples)
+
+            def pct(p):
+                return round(samples[min(n - 1, int(p * n))], 2)
+
+            endpoints[name] = {
+                "requests": n,
+                "rps": round(n / duration, 1),
+                "error_rate": round(self.errors[name] / n, 4),
+                "p50_ms": pct(0.50),
+                "p90_ms": pct(0.90),
+                "p99_ms": pct(0.99),
+                "max_ms": round(samples[-1], 2),
+                "statuses": dict(self.statuses[name]),
+            }
+        return endpoints
+
+
+# -----------------------------
+# CLIENTS
+# -----------------------------
+
+async def device_loop(device: SimulatedDevice, client, recorder, headers, interval, deadline, started):
+    await asyncio.sleep(device.rng.uniform(0, interval))   # spread the fleet
+    # One admin token for the whole fleet: the ingest rate limit is per device
+    device_headers = {**headers, "X-Device-Id": f"sim-{device.index}"}
+    while time.monotonic() < deadline:
+        payload = device.reading(time.monotonic() - started)
+        if payload is not None:
+            await recorder.call(client, "POST /api/sensor/latest", "POST", "/api/sensor/latest",
+                                json=payload, headers=device_headers)
+        await asyncio.sleep(interval)
+
+
+DASHBOARD_CALLS = [
+    ("GET /api/sensor/latest", "/api/sensor/latest"),
+    ("GET /api/alerts/", "/api/alerts/"),
+    ("GET /api/control/control", "/api/control/control"),
+    ("GET /api/control/settings", "/api/control/settings"),
+    ("GET /api/sensor/history?range=24h", "/api/sensor/history?range=24h"),
+]
+
+
+async def dashboard_loop(rng, client, recorder, headers, interval, deadline):
+    await asyncio.sleep(rng.uniform(0, interval))
+    while time.monotonic() < deadline:
+        for name, url in DASHBOARD_CALLS:
+            # History is the heavy call; dashboards refresh it less often
+            if "history" in url and rng.random() > 0.2:
+                continue
+            await recorder.call(client, name, "GET", url, headers=headers)
+        await asyncio.sleep(interval)
+
+
+# -----------------------------
+# LOCAL SERVER
+# -----------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_server(workdir: str):
+    """
+    Starts uvicorn in `workdir` on a temporary SQLite file and returns
+    (process, base_url, token).
+    """
+    env = {
+        **os.environ,
+        "STORAGE_BACKEND": "sqlite",
+        "SQLITE_PATH": os.path.join(workdir, "load.db"),
+        "JWT_SECRET": os.environ.get("JWT_SECRET", "load-generator-secret"),
+        "ACCESS_TOKEN_MINUTES": "600",
+    }
+    os.environ.update({k: env[k] for k in ("STORAGE_BACKEND", "SQLITE_PATH", "JWT_SECRET", "ACCESS_TOKEN_MINUTES")})
+
+    # Seed through the same store the server will open
+    from app.services.firebase_service import db
+    from app.services.auth_service import create_access_token
+
+    db.collection("users").document("load-admin").set({
+        "username": "load-admin", "email": "load@greenhouse.local", "role": "admin", "is_active": True
+    })
+    db.collection("settings").document("system_config").set({"target_ph": 6.0, "target_ec": 1.8})
+    db.collection("controls").document("system_config").set({"target_ph": 6.0, "target_ec": 1.8})
+    token = create_access_token(user_id="load-admin", role="admin")
+
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--app-dir", BACKEND_DIR,
+         "--port", str(port), "--log-level", "warning"],
+        env=env,
+        cwd=workdir,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    for _ in range(100):
+        try:
+            httpx.get(base_url + "/", timeout=0.5)
+            return process, base_url, token
+        except httpx.HTTPError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError("Local server did not start")
+
+
+async def run(args, base_url: str, token: str) -> dict:
+    headers = {"Authorization": f"Bearer {token}"}
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        started = time.monotonic()
+        deadline = started + args.duration
+
+        tasks = [
+            device_loop(SimulatedDevice(i, random.Random(rng.random()), args.day_seconds),
+                        client, recorder, headers, args.device_interval, deadline, started)
+            for i in range(args.devices)
+        ]
+        tasks += [
+            dashboard_loop(random.Random(rng.random()), client, recorder, headers, args.dashboard_interval, deadline)
+            for _ in range(args.dashboards)
+        ]
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("token", "output")},
+        "duration_s": round(elapsed, 2),
+        "endpoints": recorder.report(elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic greenhouse fleet load generator")
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--dashboards", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--device-interval", type=float, default=5.0, help="seconds between readings per device")
+    parser.add_argument("--dashboard-interval", type=float, default=3.0, help="seconds between dashboard refreshes")
+    parser.add_argument("--day-seconds", type=float, default=600, help="length of a simulated day")
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--base-url", help="target an already running server")
+    parser.add_argument("--token", help="admin access token (with --base-url)")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    process = None
+    workdir = tempfile.TemporaryDirectory()
+    try:
+        if args.base_url:
+            if not args.token:
+                parser.error("--token is required with --base-url")
+            base_url, token = args.base_url, args.token
+        else:
+            process, base_url, token = start_local_server(workdir.name)
+
+        report = asyncio.run(run(args, base_url, token))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        workdir.cleanup()
+
+    print(f"{'endpoint':36} {'reqs':>7} {'err%':>6} {'p50':>8} {'p90':>8} {'p99':>8}")
+    for name, r in report["endpoints"].items():
+        print(f"{name:36} {r['requests']:>7} {r['error_rate'] * 100:>5.1f}% "
+              f"{r['p50_ms']:>7.1f}ms {r['p90_ms']:>7.1f}ms {r['p99_ms']:>7.1f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
@@ -0,0 +1,310 @@
+"""
+BENCHMARKS
+----------
+Reproducible micro-benchmarks for the hot paths.
+
+Runs against the embedded SQLite store (STORAGE_BACKEND=sqlite, in memory),
+so no Firestore credentials are needed and every run starts from the same
+seeded data.
+
+Covers:
+- save_sensor_data throughput
+- check_sensor_thresholds cost
+- get_sensor_history latency for 24h / 7d / 30d, warm (cached window)
+  and cold (window invalidated before each call)
+- JWT decode and get_current_user (authenticate_token) overhead, with the
+  user status cached and cold
+- JSON serialization of a large history response (default encoder vs
+  the orjson path the list/history endpoints use)
+
+Usage (from backend/):
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench_old.json --fail-on-regression
+
+Results are JSON (one entry per benchmark: iterations, mean/p50/p95/max in
+ms, ops/sec) so two runs can be diffed with --compare.
+"""
+
+import os
+
+# Must be set before anything imports app.services.firebase_service
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+os.environ["CONFIG_MIRROR_ENABLED"] = "false"
+os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.models import SensorReading
+from app.services.firebase_service import db
+from app.services.alert_service import check_sensor_thresholds
+from app.services.auth_service import create_access_token, decode_access_token
+from app.services.version_service import bump
+from app.services.site_service import DEFAULT_SITE_ID
+from app.routers.sensor import save_sensor_data, get_sensor_history, _history_caches
+from app.utils.rbac import authenticate_token
+from app.utils.responses import dumps
+
+# Plain request (no If-None-Match) for endpoints that take one
+_REQUEST = Request({"type": "http", "headers": []})
+_ADMIN = {"sub": "bench-admin", "role": "admin"}
+
+
+# -----------------------------
+# MEASUREMENT
+# -----------------------------
+
+def _summarize(name: str, samples_ns: list[int], **extra) -> dict:
+    samples_ms = sorted(s / 1e6 for s in samples_ns)
+    n = len(samples_ms)
+    total_s = sum(samples_ns) / 1e9
+    return {
+        "name": name,
+        "iterations": n,
+        "mean_ms": round(statistics.fmean(samples_ms), 4),
+        "p50_ms": round(samples_ms[n // 2], 4),
+        "p95_ms": round(samples_ms[min(n - 1, int(n * 0.95))], 4),
+        "max_ms": round(samples_ms[-1], 4),
+        "ops_per_sec": round(n / total_s, 1) if total_s else None,
+        **extra,
+    }
+
+
+def measure(name: str, fn, iterations: int, warmup: int = 5, **extra) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - start)
+    return _summarize(name, samples, **extra)
+
+
+async def measure_async(name: str, fn, iterations: int, warmup: int = 5, **extra) -> dict:
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        await fn()
+        samples.append(time.perf_counter_ns() - start)
+    return _summarize(name, samples, **extra)
+
+
+# -----------------------------
+# FIXTURES
+# -----------------------------
+
+def _reading(rng: random.Random, ts: datetime | None = None) -> dict:
+    return {
+        "ph": round(rng.uniform(5.5, 6.8), 2),
+        "ec": round(rng.uniform(1.2, 2.4), 2),
+        "water_temp": round(rng.uniform(18, 30), 1),
+        "air_temp": round(rng.uniform(16, 32), 1),
+        "humidity": round(rng.uniform(40, 90), 1),
+        "flow_rate": round(rng.uniform(0.5, 3.0), 2),
+        "light_intensity": round(rng.uniform(0, 100), 1),
+        "timestamp": ts,
+    }
+
+
+def seed(readings_per_hour: int, rng: random.Random) -> dict:
+    """
+    30 days of history + config + one active user.
+    """
+    now = datetime.now(timezone.utc)
+    step = timedelta(hours=1) / readings_per_hour
+    total = 30 * 24 * readings_per_hour
+
+    batch = db.batch()
+    for i in range(total):
+        batch.set(db.collection("sensors").document(), _reading(rng, now - i * step))
+        if (i + 1) % 500 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+    db.collection("controls").document("system_config").set({"target_ph": 6.0, "target_ec": 1.8})
+    db.collection("settings").document("system_config").set({"target_ph": 6.0, "target_ec": 1.8})
+    db.collection("users").document("bench-admin").set({
+        "username": "bench", "email": "bench@greenhouse.local", "role": "admin", "is_active": True
+    })
+    return {"seeded_readings": total}
+
+
+# -----------------------------
+# BENCHMARKS
+# -----------------------------
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    meta = seed(args.readings_per_hour, rng)
+    results = []
+
+    # Ingest (write + threshold check)
+    results.append(await measure_async(
+        "save_sensor_data",
+        lambda: save_sensor_data(SensorReading(**_reading(rng)), _REQUEST, Response(), _ADMIN, site_id=DEFAULT_SITE_ID),
+        args.iterations,
+    ))
+
+    # Threshold check alone
+    results.append(await measure_async(
+        "check_sensor_thresholds",
+        lambda: check_sensor_thresholds(_reading(rng, datetime.now(timezone.utc))),
+        args.iterations,
+    ))
+
+    # History reads by range size: warm (incremental read of the cached
+    # window) and cold (window dropped before every call: full read)
+    async def cold_history(range_):
+        _history_caches[DEFAULT_SITE_ID].invalidate()
+        return await get_sensor_history(_REQUEST, range=range_, site_id=DEFAULT_SITE_ID)
+
+    history_sizes = {}
+    for range_ in ("24h", "7d", "30d"):
+        response = orjson.loads((await get_sensor_history(_REQUEST, range=range_, site_id=DEFAULT_SITE_ID)).body)
+        history_sizes[range_] = response["count"]
+        iterations = max(5, args.iterations // (10 if range_ == "30d" else 4))
+        results.append(await measure_async(
+            f"get_sensor_history[{range_}]",
+            lambda r=range_: get_sensor_history(_REQUEST, range=r, site_id=DEFAULT_SITE_ID),
+            iterations,
+            warmup=1,
+            rows=response["count"],
+        ))
+        results.append(await measure_async(
+            f"get_sensor_history_cold[{range_}]",
+            lambda r=range_: cold_history(r),
+            iterations,
+            warmup=1,
+            rows=response["count"],
+        ))
+
+    # Auth
+    token = create_access_token(user_id="bench-admin", role="admin")
+    results.append(measure("decode_access_token", lambda: decode_access_token(token), args.iterations * 10))
+    results.append(measure("get_current_user", lambda: authenticate_token(token), args.iterations * 5))
+
+    # Cold: a users write (here or on another worker) drops the cached user status
+    def cold_current_user():
+        bump("users")
+        return authenticate_token(token)
+
+    results.append(measure("get_current_user_cold", cold_current_user, args.iterations * 5))
+
+    # Serialization of the largest response
+    big = orjson.loads((await get_sensor_history(_REQUEST, range="30d", site_id=DEFAULT_SITE_ID)).body)
+    for row in big["data"]:
+        row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+    results.append(measure(
+        "json_serialize[history_30d]",
+        lambda: json.dumps(jsonable_encoder(big)),
+        max(5, args.iterations // 10),
+        warmup=1,
+        rows=big["count"],
+        bytes=len(json.dumps(jsonable_encoder(big))),
+    ))
+    results.append(measure(
+        "orjson_serialize[history_30d]",
+        lambda: dumps(big),
+        max(5, args.iterations // 10),
+        warmup=1,
+        rows=big["count"],
+        bytes=len(dumps(big)),
+    ))
+
+    return {
+        "meta": {
+            **meta,
+            "history_rows": history_sizes,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git_commit": _git_commit(),
+            "iterations": args.iterations,
+            "readings_per_hour": args.readings_per_hour,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+# -----------------------------
+# COMPARISON
+# -----------------------------
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[dict]:
+    """
+    Flags benchmarks whose p50 got slower than baseline by more than `threshold`.
+    """
+    old = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"\n{'benchmark':32} {'old p50':>10} {'new p50':>10} {'change':>8}")
+    for r in current["results"]:
+        before = old.get(r["name"])
+        if not before or not before["p50_ms"]:
+            continue
+        change = r["p50_ms"] / before["p50_ms"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{r['name']:32} {before['p50_ms']:>10.3f} {r['p50_ms']:>10.3f} {change:>+7.1%}{flag}")
+        if flag:
+            regressions.append({"name": r["name"], "change": round(change, 4)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Greenhouse backend benchmarks")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--readings-per-hour", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="baseline JSON from a previous run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed p50 slowdown (0.10 = 10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    for r in report["results"]:
+        print(f"{r['name']:32} p50={r['p50_ms']:.3f}ms p95={r['p95_ms']:.3f}ms ops/s={r['ops_per_sec']}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    main()
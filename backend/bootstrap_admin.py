@@ -4,6 +4,11 @@ Run this ONCE, then delete it.
 """
 
 from datetime import datetime
+from dotenv import load_dotenv
+
+# Before the app imports: they read settings from the environment
+load_dotenv()
+
 from app.services.firebase_service import db
 from app.services.auth_service import hash_password
 
@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+# Set before any app module is imported: embedded store, no Google credentials
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+# Local state files go to a scratch directory, not the working tree
+os.environ.setdefault("INGEST_SPOOL_PATH", os.path.join(tempfile.mkdtemp(prefix="greenhouse-tests-"), "ingest_spool.db"))
+
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client():
+    """
+    The app without its lifespan (no background services), signed in as
+    an admin.
+    """
+    from app.main import app
+    from app.utils.rbac import get_current_user
+
+    app.dependency_overrides[get_current_user] = lambda: {"sub": "admin-1", "role": "admin"}
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
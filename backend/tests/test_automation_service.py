@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services import automation_service
+from app.services.automation_service import (
+    AutomationEngine, TimerHeap, NUTRIENT_PUMP_ID, PH_DOWN_PUMP_ID, PH_UP_PUMP_ID,
+)
+
+SETTINGS = {"target_ph": 6.0, "target_ec": 1.8}
+
+
+def _reading(age_seconds=10, **values):
+    return {"timestamp": datetime.now(timezone.utc) - timedelta(seconds=age_seconds), **values}
+
+
+def _tick(monkeypatch, reading, settings=SETTINGS):
+    monkeypatch.setattr(automation_service, "_read_settings", lambda: settings)
+    monkeypatch.setattr(automation_service, "_latest_reading", lambda: reading)
+
+    engine = AutomationEngine()
+    doses = []
+
+    async def dose(pump_id, reason):
+        doses.append((pump_id, reason))
+
+    engine._dose = dose
+    asyncio.run(engine._dosing_tick())
+    return doses
+
+
+@pytest.mark.parametrize("reading, expected", [
+    ({"ph": 6.0, "ec": 1.8}, []),
+    ({"ph": 6.1, "ec": 1.75}, []),                           # inside the deadbands
+    ({"ph": 6.0, "ec": 1.5}, [(NUTRIENT_PUMP_ID, "ec_low")]),
+    ({"ph": 6.5, "ec": 1.8}, [(PH_DOWN_PUMP_ID, "ph_high")]),
+    ({"ph": 5.5, "ec": 1.8}, [(PH_UP_PUMP_ID, "ph_low")]),
+    ({"ph": 6.5, "ec": 1.5}, [(NUTRIENT_PUMP_ID, "ec_low")]),  # one pulse per tick, EC first
+    ({"ph": None, "ec": None}, []),
+])
+def test_dosing_decision(monkeypatch, reading, expected):
+    assert _tick(monkeypatch, _reading(**reading)) == expected
+
+
+def test_no_dosing_without_targets(monkeypatch):
+    assert _tick(monkeypatch, _reading(ph=4.0, ec=0.1), settings={}) == []
+
+
+def test_no_dosing_from_a_stale_reading(monkeypatch):
+    stale = _reading(age_seconds=automation_service.DOSING_MAX_READING_AGE_SECONDS + 60, ph=4.0)
+    assert _tick(monkeypatch, stale) == []
+
+
+def test_no_dosing_from_a_reading_without_timestamp(monkeypatch):
+    assert _tick(monkeypatch, {"ph": 4.0, "ec": 0.1}) == []
+
+
+def test_pump_off_is_armed_and_retried(monkeypatch):
+    calls = []
+
+    async def apply_control(device_id, status, source="manual"):
+        calls.append(status)
+        if status is False and calls.count(False) == 1:
+            raise RuntimeError("datastore unavailable")
+
+    monkeypatch.setattr(automation_service, "apply_control", apply_control)
+    monkeypatch.setattr(automation_service, "run_in_threadpool", _failing_event_log)
+    monkeypatch.setattr(automation_service, "DOSING_PULSE_SECONDS", 0)
+    monkeypatch.setattr(automation_service, "PUMP_OFF_RETRY_SECONDS", 0)
+
+    async def run():
+        engine = AutomationEngine()
+        engine.timers = TimerHeap()
+        engine.timers.start()
+        # Logging the dose fails after the pump went on: it still goes off
+        with pytest.raises(RuntimeError):
+            await engine._dose(PH_DOWN_PUMP_ID, "ph_high")
+        for _ in range(50):
+            if calls == [True, False, False]:
+                break
+            await asyncio.sleep(0.01)
+        await engine.timers.stop()
+
+    asyncio.run(run())
+    assert calls == [True, False, False]
+
+
+async def _failing_event_log(fn, *args, **kwargs):
+    raise RuntimeError("nutrient_events write failed")
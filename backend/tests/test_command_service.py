@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from app.services import command_service
+from app.services.command_service import CommandHub
+
+
+class Socket:
+
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    """
+    Two hubs joined by a fake bus: a message sent by one is handed to the
+    other (the real bus skips a worker's own messages too).
+    """
+    a, b = CommandHub(), CommandHub()
+    outbox = []
+
+    class Bus:
+        def send_message(self, kind, payload):
+            outbox.append((current[0], kind, payload))
+            return True
+
+    current = [a]
+    monkeypatch.setattr(command_service, "invalidation_bus", Bus())
+
+    async def deliver():
+        while outbox:
+            sender, kind, payload = outbox.pop(0)
+            receiver = b if sender is a else a
+            current[0] = receiver
+            await receiver._on_remote(kind, payload)
+
+    def on(hub):
+        current[0] = hub
+        return hub
+
+    return a, b, on, deliver
+
+
+def test_command_reaches_the_worker_holding_the_socket(workers):
+    a, b, on, deliver = workers
+
+    async def scenario():
+        socket = Socket()
+        await on(b).connect("default", "pump", socket)
+        await deliver()
+        assert a.is_connected("default", "pump")
+
+        command = await on(a).issue("default", "pump", True)
+        await deliver()
+        assert socket.sent == [{"type": "command", **command, "attempts": 1}]
+
+        # The device acks on B; A issued the command and drops it
+        assert on(b).ack("default", "pump", command["id"]) is False
+        await deliver()
+        assert a.pending("default", "pump") == []
+        assert a.stats["acked"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_reconnect_elsewhere_closes_the_old_socket_and_flushes(workers):
+    a, b, on, deliver = workers
+
+    async def scenario():
+        old = Socket()
+        await on(a).connect("default", "pump", old)
+        await deliver()
+        command = await on(a).issue("default", "light", False)
+        await deliver()   # nobody holds a "light" socket yet
+
+        new = Socket()
+        await on(b).connect("default", "light", new)
+        await on(b).connect("default", "pump", new)
+        await deliver()
+
+        assert old.closed == 1012
+        assert not a._sockets and a.is_connected("default", "pump")
+        # A flushed its pending "light" command to the device's new worker
+        assert [m["id"] for m in new.sent] == [command["id"]]
+
+    asyncio.run(scenario())
+
+
+def test_same_device_id_on_two_sites_stays_apart(workers):
+    a, b, on, deliver = workers
+
+    async def scenario():
+        north, south = Socket(), Socket()
+        await on(b).connect("north", "pump", north)
+        await deliver()
+        assert a.is_connected("north", "pump")
+        assert not a.is_connected("south", "pump")
+
+        await on(b).connect("south", "pump", south)
+        await deliver()
+        assert north.closed is None
+
+        command = await on(a).issue("south", "pump", True)
+        await deliver()
+        assert north.sent == []
+        assert [m["id"] for m in south.sent] == [command["id"]]
+        assert command["site_id"] == "south"
+
+    asyncio.run(scenario())
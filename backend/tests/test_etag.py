@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+
+from app.services.firebase_service import db
+
+
+def test_settings_304_until_written(client):
+    first = client.get("/api/control/settings")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    again = client.get("/api/control/settings", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert again.content == b""
+
+    db.collection("settings").document("system_config").set({"mode": "manual"})
+
+    changed = client.get("/api/control/settings", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["data"]["mode"] == "manual"
+
+
+def test_history_etag_depends_on_range_and_writes(client):
+    day = client.get("/api/sensor/history?range=24h")
+    week = client.get("/api/sensor/history?range=7d")
+    assert day.headers["etag"] != week.headers["etag"]
+
+    # Weak comparison: the strong form of the tag matches too
+    strong = day.headers["etag"].removeprefix("W/")
+    assert client.get("/api/sensor/history?range=24h", headers={"If-None-Match": strong}).status_code == 304
+
+    db.collection("sensors").add({"temperature": 21.5, "timestamp": datetime.now(timezone.utc)})
+
+    after = client.get("/api/sensor/history?range=24h", headers={"If-None-Match": day.headers["etag"]})
+    assert after.status_code == 200
+    assert after.json()["count"] == day.json()["count"] + 1
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services.firebase_service import db
+from app.services.history_cache import WindowCache, RANGE_SECONDS
+
+DAY = RANGE_SECONDS["24h"]
+WEEK = RANGE_SECONDS["7d"]
+
+
+@pytest.fixture
+def cache(request):
+    # A collection per test: the in-memory store is shared
+    return WindowCache(f"history_{request.node.name}", "timestamp")
+
+
+def _add(cache, ago: timedelta, **fields):
+    ts = datetime.now(timezone.utc) - ago
+    ref = db.collection(cache.collection).document()
+    ref.set({"timestamp": ts, **fields})
+    cache.note_write(ts)
+    return ref.id
+
+
+def test_repeat_reads_are_incremental(cache):
+    for hours in (30, 20, 10):
+        _add(cache, timedelta(hours=hours))
+
+    assert len(cache.get(WEEK)) == 3
+    assert (cache.misses, cache.rows_read) == (1, 3)
+
+    new_id = _add(cache, timedelta(minutes=1))
+    rows = cache.get(WEEK)
+
+    assert [r["id"] for r in rows][-1] == new_id
+    assert cache.misses == 1
+    # Only the high-water mark row and the new one were read
+    assert cache.rows_read == 3 + 2
+
+
+def test_narrow_ranges_are_slices_of_the_widest(cache):
+    for hours in (200, 30, 5, 1):
+        _add(cache, timedelta(hours=hours))
+
+    assert len(cache.get(RANGE_SECONDS["30d"])) == 4
+    reads = cache.rows_read
+
+    assert len(cache.get(WEEK)) == 3
+    day = cache.get(DAY)
+    assert len(day) == 2
+    assert day == sorted(day, key=lambda r: r["timestamp"])
+    assert cache.misses == 1
+    assert cache.rows_read == reads + 2
+
+
+def test_out_of_order_insert_is_visible(cache):
+    _add(cache, timedelta(hours=2))
+    _add(cache, timedelta(hours=1))
+    assert len(cache.get(DAY)) == 2
+
+    late_id = _add(cache, timedelta(hours=3))
+    rows = cache.get(DAY)
+
+    assert [r["id"] for r in rows][0] == late_id
+    assert len(rows) == 3
+    assert cache.misses == 2
+
+
+def test_in_order_write_keeps_the_window(cache):
+    _add(cache, timedelta(hours=2))
+    cache.get(DAY)
+
+    _add(cache, timedelta(hours=1))
+    assert len(cache.get(DAY)) == 2
+    assert cache.misses == 1
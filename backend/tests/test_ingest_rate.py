@@ -0,0 +1,70 @@
+import pytest
+
+from app.services import ingest_rate_service
+from app.utils.rate_limit import TokenBucketLimiter
+
+READING = {
+    "ph": 6.0, "ec": 1.8, "water_temp": 22.0, "air_temp": 24.0,
+    "humidity": 60.0, "flow_rate": 1.5, "light_intensity": 50.0,
+}
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def set_limits(device_burst: float, credential_burst: float):
+        # Next to no refill: the buckets only drain during a test
+        monkeypatch.setattr(ingest_rate_service, "device_limiter", TokenBucketLimiter(0.01, device_burst))
+        monkeypatch.setattr(ingest_rate_service, "credential_limiter", TokenBucketLimiter(0.01, credential_burst))
+    return set_limits
+
+
+def _post(client, device_id=None, body=READING):
+    headers = {"X-Device-Id": device_id} if device_id else {}
+    return client.post("/api/sensor/latest", json=body, headers=headers)
+
+
+def test_device_over_its_burst_gets_429_with_retry_after(client, limits):
+    limits(device_burst=2, credential_burst=100)
+
+    assert [_post(client, "dev-1").status_code for _ in range(2)] == [200, 200]
+    rejected = _post(client, "dev-1")
+
+    assert rejected.status_code == 429
+    assert int(rejected.headers["retry-after"]) >= 1
+    assert rejected.headers["ratelimit-limit"] == "2"
+    assert "/api/sensor/batch" in rejected.headers["x-ingest-hint"]
+    # Another device on the same credential has its own bucket
+    assert _post(client, "dev-2").status_code == 200
+
+
+def test_rotating_device_ids_hits_the_credential_bucket(client, limits):
+    limits(device_burst=2, credential_burst=3)
+
+    codes = [_post(client, f"dev-{i}").status_code for i in range(4)]
+
+    assert codes == [200, 200, 200, 429]
+
+
+def test_requests_without_device_id_share_the_credential_bucket(client, limits):
+    limits(device_burst=1, credential_burst=3)
+
+    codes = [_post(client).status_code for _ in range(4)]
+
+    assert codes == [200, 200, 200, 429]
+
+
+def test_invalid_body_costs_no_token(client, limits):
+    limits(device_burst=1, credential_burst=1)
+
+    assert _post(client, "dev-1", body={"ph": "acid"}).status_code == 422
+    assert _post(client, "dev-1").status_code == 200
+
+
+def test_batch_costs_one_token(client, limits):
+    limits(device_burst=1, credential_burst=1)
+
+    response = client.post("/api/sensor/batch", json={"readings": [READING] * 5}, headers={"X-Device-Id": "dev-1"})
+
+    assert response.status_code == 200
+    assert response.json()["count"] == 5
+    assert response.headers["ratelimit-remaining"] == "0"
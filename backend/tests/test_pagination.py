@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.pagination import PageParams, decode_cursor, encode_cursor, paginate
+
+
+def test_cursor_round_trip():
+    values = {"__name__": "doc-42", "created_at": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc), "n": 3}
+    cursor = encode_cursor(values)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == values
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "WzEsMl0"])  # garbage, a JSON list
+def test_invalid_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor)
+    assert e.value.status_code == 400
+
+
+def test_cursor_from_another_listing_is_400():
+    class Query:
+        def order_by(self, *args, **kwargs):
+            return self
+
+    cursor = encode_cursor({"__name__": "doc-1"})
+    with pytest.raises(HTTPException) as e:
+        paginate(Query(), PageParams(10, cursor), order_field="created_at")
+    assert e.value.status_code == 400
+
+
+def test_pages_walk_the_whole_collection_once():
+    from app.services.firebase_service import db
+
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(7):
+        # Two documents per timestamp: ties are broken by document id
+        db.collection("paginated").document(f"d{i}").set({"created_at": created.replace(hour=i // 2)})
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = paginate(db.collection("paginated"), PageParams(3, cursor),
+                                order_field="created_at", descending=True)
+        seen += [row["id"] for row in rows]
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert seen == ["d6", "d5", "d4", "d3", "d2", "d1", "d0"]
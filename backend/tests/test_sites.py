@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.main import app
+from app.services.firebase_service import db
+from app.services.site_service import PerSite, site_collection
+from app.utils.rbac import get_current_user
+
+
+@pytest.fixture
+def north(client):
+    assert client.post("/api/sites/", json={"site_id": "north", "name": "North"}).status_code == 200
+    yield "north"
+    db.collection("sites").document("north").delete()
+
+
+def sign_in(user_id, sites=..., role="user"):
+    doc = {"username": user_id, "role": role, "is_active": True}
+    if sites is not ...:
+        doc["sites"] = sites
+    db.collection("users").document(user_id).set(doc)
+    app.dependency_overrides[get_current_user] = lambda: {"sub": user_id, "role": role}
+
+
+def test_site_partitions_are_isolated(client, north):
+    now = datetime.now(timezone.utc)
+    db.collection(site_collection("sensors", north)).add({"temperature": 30.0, "timestamp": now})
+
+    default = client.get("/api/sensor/history?range=24h").json()
+    scoped = client.get("/api/sensor/history?range=24h", headers={"X-Site-Id": north}).json()
+
+    assert all(row.get("temperature") != 30.0 for row in default["data"])
+    assert [row["temperature"] for row in scoped["data"]] == [30.0]
+
+
+def test_unknown_or_malformed_site_is_rejected(client):
+    assert client.get("/api/control/settings", headers={"X-Site-Id": "nowhere"}).status_code == 404
+    assert client.get("/api/control/settings", headers={"X-Site-Id": "Bad Site!"}).status_code == 400
+
+
+def test_user_without_sites_gets_only_the_default_site(client, north):
+    sign_in("user-nosites")
+
+    assert client.get("/api/control/settings").status_code == 200
+    assert client.get("/api/control/settings", headers={"X-Site-Id": north}).status_code == 403
+    assert [s["site_id"] for s in client.get("/api/sites/").json()["data"]] == ["default"]
+
+
+def test_user_limited_to_listed_sites(client, north):
+    sign_in("user-north", sites=[north])
+
+    assert client.get("/api/control/settings", headers={"X-Site-Id": north}).status_code == 200
+    assert client.get("/api/control/settings").status_code == 403
+
+
+def test_user_sites_update_validates_ids(client, north):
+    db.collection("users").document("user-edit").set({"username": "user-edit", "role": "user"})
+
+    assert client.put("/api/users/user-edit/sites", json={"sites": ["Bad Site!"]}).status_code == 400
+    assert client.put("/api/users/user-edit/sites", json={"sites": ["nowhere"]}).status_code == 400
+
+    ok = client.put("/api/users/user-edit/sites", json={"sites": [north, north, "default"]})
+    assert ok.status_code == 200
+    assert ok.json()["sites"] == [north, "default"]
+
+
+def test_per_site_instances_are_capped():
+    class Counter:
+        hits = 1
+        misses = 0
+
+    caches = PerSite(lambda site_id: Counter(), max_sites=2)
+    first = caches["a"]
+    caches["b"]
+    assert caches["a"] is first       # "a" is now the most recently used
+    caches["c"]                       # evicts "b"
+
+    assert caches.stats() == {"sites": 2, "evictions": 1, "hits": 3, "misses": 0}
+    assert caches["a"] is first
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app.services import spool_service
+from app.services.firebase_service import db
+from app.services.spool_service import IngestSpool
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return str(tmp_path / "spool.db")
+
+
+def _docs(collection):
+    return {d.id: d.to_dict() for d in db.collection(collection).stream()}
+
+
+def test_replay_is_oldest_first(spool_path):
+    spool = IngestSpool(spool_path)
+    spool._append("spool_order", [("r1", {"v": 1}), ("r2", {"v": 2})])
+    spool._append("spool_order", [("r1", {"v": 3})])
+
+    replayed = spool._replay_batch()
+
+    assert [d["v"] for d in replayed["spool_order"]] == [1, 2, 3]
+    # The later write to the same document wins
+    assert _docs("spool_order") == {"r1": {"v": 3}, "r2": {"v": 2}}
+    assert spool.pending == 0
+
+
+def test_replay_batches_drain_in_order(spool_path, monkeypatch):
+    monkeypatch.setattr(spool_service, "REPLAY_BATCH", 2)
+    spool = IngestSpool(spool_path)
+    spool._append("spool_batches", [(f"r{i}", {"v": i}) for i in range(5)])
+
+    seen = []
+    while replayed := spool._replay_batch():
+        seen += [d["v"] for d in replayed["spool_batches"]]
+
+    assert seen == [0, 1, 2, 3, 4]
+    assert spool.pending == 0
+
+
+def test_shared_file_drained_by_one_worker(spool_path):
+    a, b = IngestSpool(spool_path), IngestSpool(spool_path)
+    b._append("spool_shared", [("r1", {"v": 1}), ("r2", {"v": 2})])
+
+    # A holds the lease and drains B's rows; B may not replay meanwhile
+    assert a._take_lease()
+    assert b._replay_batch() == {}
+    assert b.pending == 2
+    assert len(a._replay_batch()["spool_shared"]) == 2
+
+    # B's next poll finds the table empty and writes directly again
+    assert b._replay_batch() == {}
+    assert b.pending == 0
+    assert asyncio.run(b.write("spool_shared", "r3", {"v": 3})) is True
+    assert set(_docs("spool_shared")) == {"r1", "r2", "r3"}
+
+
+def test_lease_is_taken_over_when_it_expires(spool_path, monkeypatch):
+    a, b = IngestSpool(spool_path), IngestSpool(spool_path)
+    assert a._take_lease()
+    assert not b._take_lease()
+
+    monkeypatch.setattr(spool_service, "LEASE_SECONDS", -1)
+    assert a._take_lease()  # renewal, already expired
+    assert b._take_lease()
+
+
+def test_failed_write_is_spooled_then_replayed(spool_path, monkeypatch):
+    spool = IngestSpool(spool_path)
+
+    def down(collection, docs):
+        raise RuntimeError("datastore unavailable")
+
+    monkeypatch.setattr(spool_service, "_commit", down)
+    assert asyncio.run(spool.write("spool_outage", "r1", {"v": 1})) is False
+    assert spool.pending == 1
+
+    monkeypatch.undo()
+    assert spool._replay_batch() == {"spool_outage": [{"v": 1}]}
+    assert _docs("spool_outage") == {"r1": {"v": 1}}